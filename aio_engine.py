@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import BoundedSemaphore, Lock, Thread, local
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Hashable, List, Optional
+from urllib.parse import urlsplit
+
+from metrics import METRICS
+from resilience import CircuitOpenError
+from startup import lazy_import
+
+if TYPE_CHECKING:
+    import asyncio
+
+# asyncio 和 aiohttp 只在 asyncio 模式或协程处理方法第一次运行时导入，线程模式启动时不付出导入开销
+_aiohttp: Any = False  # False 表示还没尝试导入
+
+
+def load_aiohttp() -> Any:
+    """导入 aiohttp；未安装时返回 None，协程处理方法退回线程池里的同步客户端"""
+    global _aiohttp
+    if _aiohttp is False:
+        try:
+            _aiohttp = lazy_import("aiohttp")
+        except ImportError:
+            _aiohttp = None
+    return _aiohttp
+
+
+class AsyncEngine(object):
+    """asyncio 执行模式
+    事件循环运行在独立线程中，wcf 接收线程通过 submit 把消息送进来。
+    同步的 processMsg 在线程池里执行；其中命中的协程处理方法通过 defer 交回事件循环，
+    等待网络 I/O 时不占用线程，因此一个进程可以同时挂起成百上千个请求。
+    同一会话的消息依次处理，不同会话并发。
+    """
+
+    def __init__(self, handler: Callable[[Any], Any], executor_workers: int = 32, max_inflight: int = 1000,
+                 key: Optional[Callable[[Any], Hashable]] = None) -> None:
+        """
+        :param handler: 处理单条消息的同步方法
+        :param executor_workers: 运行同步代码的线程数
+        :param max_inflight: 同时在处理中的消息上限，达到上限时 submit 阻塞（背压）
+        :param key: 从消息中提取会话标识的方法
+        """
+        self.LOG = logging.getLogger("AsyncEngine")
+        self.handler = handler
+        self.key = key or (lambda msg: msg.roomid if msg.roomid else msg.sender)
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="AsyncSync")
+        self.inflight = BoundedSemaphore(max_inflight)
+        self.loop: Optional["asyncio.AbstractEventLoop"] = None
+        self.tails: Dict[Hashable, "asyncio.Future"] = {}
+        self.local = local()
+        self.lock = Lock()
+        self.pending = 0  # 已投递未处理完的消息数
+
+    @classmethod
+    def from_config(cls, handler: Callable[[Any], Any], conf: Optional[dict]) -> "AsyncEngine":
+        conf = conf or {}
+        return cls(handler, conf.get("workers", 32), conf.get("max_inflight", 1000))
+
+    def start(self) -> "asyncio.AbstractEventLoop":
+        """启动事件循环线程，重复调用无副作用"""
+        with self.lock:
+            if self.loop is None:
+                loop = lazy_import("asyncio").new_event_loop()
+                loop.set_default_executor(self.executor)
+                Thread(target=loop.run_forever, name="AsyncEngine", daemon=True).start()
+                self.loop = loop
+        return self.loop
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """在事件循环上执行协程并等待结果，供非事件循环线程调用"""
+        loop = self.start()
+        return lazy_import("asyncio").run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    def submit(self, msg) -> None:
+        """投递消息，可从任意线程调用"""
+        self.inflight.acquire()
+        with self.lock:
+            self.pending += 1
+        self.start().call_soon_threadsafe(self._schedule, msg)
+
+    def qsize(self) -> int:
+        """已投递未处理完的消息数，与 MsgDispatcher.qsize 对应"""
+        return self.pending
+
+    def defer(self, coro: Awaitable) -> bool:
+        """在 submit 触发的同步处理中调用：把协程交回事件循环，在该消息的处理任务里等待
+        :return: 不在引擎的处理线程中时返回 False，由调用方自行执行协程
+        """
+        pending = getattr(self.local, "pending", None)
+        if pending is None:
+            return False
+        pending.append(coro)
+        return True
+
+    def _schedule(self, msg) -> None:
+        key = self.key(msg)
+        prev = self.tails.get(key)
+        task = self.loop.create_task(self._process(msg, prev))
+        self.tails[key] = task
+        task.add_done_callback(partial(self._done, key))
+
+    def _done(self, key: Hashable, task: "asyncio.Task") -> None:
+        if self.tails.get(key) is task:
+            del self.tails[key]
+        with self.lock:
+            self.pending -= 1
+        self.inflight.release()
+
+    async def _process(self, msg, prev: Optional["asyncio.Future"]) -> None:
+        if prev is not None:
+            await lazy_import("asyncio").wait([prev])  # 只等前一条处理完，不关心其结果
+        try:
+            pending = await self.loop.run_in_executor(self.executor, self._run_sync, msg)
+            for coro in pending:
+                await coro
+        except Exception as e:
+            self.LOG.error(f"Processing message error: {e}")
+
+    def _run_sync(self, msg) -> List[Awaitable]:
+        self.local.pending = []
+        try:
+            self.handler(msg)
+            return self.local.pending
+        finally:
+            self.local.pending = None
+
+
+class AsyncHttpClient(object):
+    """协程处理方法使用的 HTTP 客户端
+    安装了 aiohttp 时使用其连接池；否则把同步 HttpClient 的调用放进线程池执行。
+    """
+
+    def __init__(self, sync_client, limit: int = 100, limit_per_host: int = 20) -> None:
+        """
+        :param sync_client: 同步 HttpClient，提供默认超时，也是未安装 aiohttp 时的后备
+        :param limit: 连接总数上限
+        :param limit_per_host: 每个主机的连接数上限
+        """
+        self.sync = sync_client
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.session = None
+        self.flights: Dict[tuple, "asyncio.Future"] = {}  # 进行中的请求，相同请求共享
+
+    def _session(self):
+        # ClientSession 必须在事件循环中创建，首次使用时再建
+        if self.session is None:
+            aiohttp = load_aiohttp()
+            connect, read = self.sync.timeout
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read))
+        return self.session
+
+    async def get_json(self, url: str, params: Optional[dict] = None) -> Any:
+        asyncio = lazy_import("asyncio")
+        if load_aiohttp() is None:
+            # 同步客户端自己合并相同请求
+            call = partial(copy_context().run, self.sync.get_json, url, params)
+            return await asyncio.get_running_loop().run_in_executor(None, call)
+        if not self.sync.coalesce:
+            return await self._get_json(url, params)
+        # 同时进行的相同请求只发一次；flights 只在事件循环线程中访问，不需要加锁
+        key = (url, self.sync.params_key(params))
+        task = self.flights.get(key)
+        if task is None:
+            task = self.flights[key] = asyncio.ensure_future(self._get_json(url, params))
+            task.add_done_callback(lambda t: self.flights.pop(key, None))
+        else:
+            METRICS.inc("robot_upstream_coalesced_total", host=urlsplit(url).netloc)
+        return await asyncio.shield(task)
+
+    async def _get_json(self, url: str, params: Optional[dict] = None) -> Any:
+        # 与同步客户端共用按主机的熔断器和超时；协程路径不做对冲
+        aiohttp, asyncio = load_aiohttp(), lazy_import("asyncio")
+        host = urlsplit(url).netloc
+        breaker = self.sync.resilience.breaker(host)
+        if not breaker.allow():
+            METRICS.inc("robot_upstream_requests_total", host=host, status="circuit_open")
+            raise CircuitOpenError(host)
+        timeout = aiohttp.ClientTimeout(total=breaker.policy.deadline, sock_connect=breaker.policy.connect_timeout,
+                                        sock_read=breaker.policy.read_timeout)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            async with self._session().get(self.sync.rewrite_url(url), params=params, timeout=timeout) as response:
+                status = str(response.status)
+                if response.status >= 500:
+                    breaker.failure()
+                else:
+                    breaker.success(time.perf_counter() - start)
+                response.raise_for_status()
+                return self.sync.json_bytes(await response.read())
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            breaker.failure()
+            raise
+        finally:
+            METRICS.upstream(host, time.perf_counter() - start, status)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
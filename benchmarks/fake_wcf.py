@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import time
+from queue import Empty, Queue
+from threading import Event, Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class FakeMsg(object):
+    """与 wcferry.WxMsg 接口一致的消息，供压测构造输入"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, content: str, sender: str, roomid: str = "", type: int = 0x01,
+                 at_self: Optional[str] = None, extra: str = "") -> None:
+        self.id = next(self._ids)
+        self.type = type
+        self.sender = sender
+        self.roomid = roomid
+        self.content = content
+        self.extra = extra
+        self.thumb = ""
+        self.xml = ""
+        self.ts = int(time.time())
+        self._self = False
+        self._at = at_self
+        self.created = time.perf_counter()  # 压测用：消息进入系统的时间
+
+    def from_group(self) -> bool:
+        return bool(self.roomid)
+
+    def from_self(self) -> bool:
+        return self._self
+
+    def is_at(self, wxid: str) -> bool:
+        return self._at == wxid
+
+    def __str__(self) -> str:
+        return f"FakeMsg({self.id}, {self.sender}@{self.roomid}: {self.content[:20]})"
+
+
+class FakeWcf(object):
+    """进程内的 Wcf 替身
+    get_msg 从内部队列取消息；send_* 记录发出的消息并通知等待方，可设置每次发送的耗时；
+    查询类接口返回固定数据。
+    """
+
+    def __init__(self, wxid: str = "wxid_bench", send_latency: float = 0.0, members: int = 50) -> None:
+        """
+        :param wxid: 机器人自己的 wxid
+        :param send_latency: 每次 send_* 的模拟耗时（秒）
+        :param members: 每个群的模拟成员数
+        """
+        self.wxid = wxid
+        self.send_latency = send_latency
+        self.members = members
+        self.inbox: "Queue[FakeMsg]" = Queue()
+        self.receiving = Event()
+        self.lock = Lock()
+        self.sent: List[Tuple[str, str, float]] = []  # (方法, 接收者, 时间)
+        self.on_send: Optional[Callable[[str, str, str], None]] = None
+
+    # 接收
+    def get_self_wxid(self) -> str:
+        return self.wxid
+
+    def enable_receiving_msg(self, callback=None) -> bool:
+        self.receiving.set()
+        return True
+
+    def disable_recv_msg(self) -> None:
+        self.receiving.clear()
+
+    def is_receiving_msg(self) -> bool:
+        return self.receiving.is_set()
+
+    def get_msg(self, block: bool = True) -> FakeMsg:
+        try:
+            return self.inbox.get(block, timeout=1)
+        except Empty:
+            raise Empty
+
+    def feed(self, msg: FakeMsg) -> None:
+        self.inbox.put(msg)
+
+    # 发送
+    def _sent(self, method: str, content: str, receiver: str) -> int:
+        if self.send_latency:
+            time.sleep(self.send_latency)
+        with self.lock:
+            self.sent.append((method, receiver, time.perf_counter()))
+        if self.on_send is not None:
+            self.on_send(method, content, receiver)
+        return 0
+
+    def send_text(self, msg: str, receiver: str, aters: str = "") -> int:
+        return self._sent("send_text", msg, receiver)
+
+    def send_image(self, path: str, receiver: str) -> int:
+        return self._sent("send_image", path, receiver)
+
+    def send_file(self, path: str, receiver: str) -> int:
+        return self._sent("send_file", path, receiver)
+
+    # 查询
+    def query_sql(self, db: str, sql: str) -> List[Dict]:
+        if "MAX(rowid)" in sql:
+            return [{"n": 0}]
+        if "WHERE UserName" in sql:
+            wxid = sql.split("'")[1]
+            return [{"NickName": f"昵称{wxid[-4:]}"}]
+        return []
+
+    def get_alias_in_chatroom(self, wxid: str, roomid: str) -> str:
+        return f"群昵称{wxid[-4:]}"
+
+    def get_chatroom_members(self, roomid: str) -> Dict[str, str]:
+        return {f"wxid_member{i:04d}": f"群昵称{i:04d}" for i in range(self.members)}
+
+    def download_image(self, id: int, extra: str, dir: str, timeout: int = 30) -> str:
+        return ""
+
+    def get_audio_msg(self, id: int, dir: str, timeout: int = 3) -> str:
+        return ""
+
+    def accept_new_friend(self, v3: str, v4: str, scene: int = 30) -> int:
+        return 1
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""离线压测：用进程内的 FakeWcf 和本地桩服务驱动 Robot，不依赖微信客户端和公网接口
+
+在仓库根目录运行：
+    python benchmarks/run.py                       # 每个命令、闲聊和混合负载各跑一轮
+    python benchmarks/run.py -c 查油价 -c 看抖音    # 只跑指定命令（看抖音会先在每个群里搜抖音）
+    python benchmarks/run.py --mode asyncio --latency 0.2 --concurrency 64
+
+输出每种负载的吞吐（条/秒）和端到端延迟 p50/p99（从消息进入接收队列到回复发出）。
+有负载一条回复都没收到时（通常是桩服务的返回格式与处理方法不符）以非零状态退出。
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import types
+from threading import Condition
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_wcf import FakeMsg, FakeWcf  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+# 每个命令的压测输入，命令名后的参数
+SAMPLES: Dict[str, List[str]] = {
+    "画": ["一只会飞的猪"], "翻译": ["我喜欢你"], "拼音": ["我爱你"], "搜歌": ["周杰伦"], "听歌": ["倒带"],
+    "签名": ["hsq，郭富城"], "网名": ["刘"], "取名": ["王"], "典故": ["遇到困难不要怕"], "重名": ["张三"],
+    "搜题": ["根据契税法律的规定"], "台词": ["我爱你"], "扮演": ["御姐"], "摸鱼": [""], "举牌": ["我出1个亿"],
+    "云图": ["苹果, 香蕉, 樱桃"], "识图": [""], "查榜": ["今日头条"], "不可说": ["情话"], "头像": ["机器人女友"],
+    "到账": ["100"], "追番": [""], "抖音": [""], "搜抖音": ["张大仙"], "刷抖音": [""], "小姐姐": [""],
+    "百家姓": ["张"], "卡路里": ["橘子"], "查星座": ["白羊座今日运势"], "查油价": ["江苏"],
+    "查号码": ["13500000000"], "查功能": [""], "讲述人": ["8，你是一朵盛开的花"], "看抖音": ["1"],
+    "查天气": ["河北-唐山"],
+}
+# 依赖会话状态的命令：压测前先在每个群里发一次，结果不计入统计
+SEEDS: Dict[str, str] = {"看抖音": "搜抖音张大仙"}
+CHITCHAT = ["今天天气怎么样", "讲个笑话", "你是谁"]
+
+
+class BenchConfig(object):
+    """压测用配置，字段与 configuration.Config 一致"""
+
+    def __init__(self, groups: List[str], rewrite: Dict[str, str], mode: str, workers: int, media_root: str) -> None:
+        self.GROUPS = groups
+        self.NEWS = []
+        self.WEATHER = []
+        self.HTTP = {"rewrite": rewrite, "pool_maxsize": max(20, workers * 2)}
+        self.DISPATCH = {"mode": mode, "workers": workers, "queue_size": 100000}
+        self.ASYNC = {"workers": workers, "max_inflight": 100000}
+        self.OUTBOX = {"rate": 1e6, "burst": 1e6, "workers": workers}
+        self.ALIAS = {"refresh_interval": 0}
+        self.MEDIA = {"root": media_root}
+
+    def reload(self) -> None:
+        pass
+
+
+class FakeChat(object):
+    """模拟大模型后端，按固定耗时返回"""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+
+    def get_answer(self, question: str, wxid: str) -> str:
+        time.sleep(self.latency)
+        return f"回答：{question}"
+
+
+def install_weather(robot) -> None:
+    """用走桩服务的实现替换 base.weather，查天气与其他命令一样经过 HttpClient"""
+    module = types.ModuleType("base.weather")
+
+    def get_weather(city: str) -> str:
+        data = robot.http.get_json("https://api.pearktrue.cn/api/weather", params={"city": city})
+        return f"{data['city']}明日天气：{data['weather']}，{data['temperature']}"
+
+    module.get_weather = get_weather
+    sys.modules["base.weather"] = module
+
+
+class Recorder(object):
+    """把 FakeWcf 发出的回复对应到消息，记录端到端延迟，并限制同时在途的消息数
+    在途消息在负载的截止时间之后仍未回复的记为丢失，不再占用名额，一直不回复的命令也不会卡住压测。
+    """
+
+    def __init__(self, concurrency: int, deadline: float) -> None:
+        """
+        :param concurrency: 同时在途的消息数
+        :param deadline: 负载的截止时间（time.monotonic）
+        """
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.cond = Condition()
+        self.pending: Dict[str, float] = {}  # 接收者（每条消息一个群）: 消息进入时间
+        self.latencies: List[float] = []
+        self.finished = 0.0
+        self.dropped = 0  # 截止时间后被放弃的在途消息
+
+    def on_send(self, method: str, content: str, receiver: str) -> None:
+        now = time.perf_counter()
+        with self.cond:
+            created = self.pending.pop(receiver, None)
+            if created is None:  # 同一条消息的后续回复（如搜题的提示语之后的答案）
+                return
+            self.latencies.append(now - created)
+            self.finished = now
+            self.cond.notify_all()
+
+    def admit(self, receiver: str, created: float) -> None:
+        with self.cond:
+            while len(self.pending) >= self.concurrency:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    self.dropped += len(self.pending)
+                    self.pending.clear()
+                    break
+                self.cond.wait(remaining)
+            self.pending[receiver] = created
+
+    def drain(self) -> int:
+        """等待在途消息完成，返回截止时间前未回复的条数"""
+        with self.cond:
+            while self.pending and time.monotonic() < self.deadline:
+                self.cond.wait(self.deadline - time.monotonic())
+            lost = self.dropped + len(self.pending)
+            self.pending.clear()
+            return lost
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+def run_workload(robot, wcf: FakeWcf, rooms: List[str], texts: List[str], concurrency: int,
+                 timeout: float) -> Tuple[int, int, float, float, float]:
+    """投递 texts 并等待回复，返回 (条数, 失败数, 吞吐, p50, p99)"""
+    recorder = Recorder(concurrency, time.monotonic() + timeout)
+    wcf.on_send = recorder.on_send
+    start = time.perf_counter()
+    for room, text in zip(rooms, texts):
+        msg = FakeMsg(f"@机器人 {text}", sender=f"wxid_user{random.randint(0, 999):04d}",
+                      roomid=room, at_self=wcf.wxid)
+        recorder.admit(room, msg.created)
+        wcf.feed(msg)
+    lost = recorder.drain()
+    elapsed = (recorder.finished or time.perf_counter()) - start
+    done = len(recorder.latencies)
+    return (len(texts), lost, done / elapsed if elapsed > 0 else 0.0,
+            percentile(recorder.latencies, 0.50), percentile(recorder.latencies, 0.99))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Robot 离线压测")
+    parser.add_argument("-n", "--messages", type=int, default=200, help="每种负载的消息数")
+    parser.add_argument("-c", "--command", action="append", help="只压测指定命令，可重复")
+    parser.add_argument("--concurrency", type=int, default=32, help="同时在途的消息数")
+    parser.add_argument("--mode", choices=("thread", "asyncio"), default="thread", help="分发模式")
+    parser.add_argument("--workers", type=int, default=8, help="处理线程数")
+    parser.add_argument("--latency", type=float, default=0.05, help="上游接口延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="上游接口延迟的随机浮动（秒）")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="大模型回复耗时（秒）")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="每次发送的耗时（秒）")
+    parser.add_argument("--timeout", type=float, default=60, help="每种负载等待回复的最长时间（秒）")
+    parser.add_argument("--no-mixed", action="store_true", help="不跑混合负载")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    from robot import Robot
+
+    stub = StubServer(latency=args.latency, jitter=args.jitter).start()
+    wcf = FakeWcf(send_latency=args.send_latency)
+    # 每条消息各用一个群，回复按群对应到消息，也避免了同一接收者的发送限速
+    rooms = [f"bench{i:06d}@chatroom" for i in range(args.messages)]
+    media_root = tempfile.mkdtemp(prefix="robot-bench-")
+    config = BenchConfig(rooms, stub.rewrite(), args.mode, args.workers, media_root)
+    robot = Robot(config, wcf, 0)
+    robot.chat = FakeChat(args.chat_latency)
+    install_weather(robot)
+    robot.enableReceivingMsg()
+
+    workloads: List[Tuple[str, List[str]]] = []
+    for cmd in (args.command or list(SAMPLES)):
+        if cmd not in SAMPLES:
+            parser.error(f"没有命令 {cmd} 的压测输入")
+        workloads.append((cmd, [cmd + random.choice(SAMPLES[cmd]) for _ in range(args.messages)]))
+    workloads.append(("toChitchat", [random.choice(CHITCHAT) for _ in range(args.messages)]))
+    if not args.no_mixed:
+        # 混合负载：一半闲聊，一半随机命令
+        pool = [cmd + arg for cmd in (args.command or list(SAMPLES)) for arg in SAMPLES[cmd]]
+        workloads.append(("mixed", [random.choice(pool) if random.random() < 0.5 else random.choice(CHITCHAT)
+                                    for _ in range(args.messages)]))
+
+    print(f"{'workload':<12}{'n':>6}{'lost':>6}{'msg/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    broken = []
+    for name, texts in workloads:
+        if name in SEEDS:
+            run_workload(robot, wcf, rooms, [SEEDS[name]] * len(texts), args.concurrency, args.timeout)
+        n, lost, rate, p50, p99 = run_workload(robot, wcf, rooms, texts, args.concurrency, args.timeout)
+        print(f"{name:<12}{n:>6}{lost:>6}{rate:>10.1f}{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}")
+        if n and lost == n:
+            broken.append(name)
+    print(f"upstream requests: {stub.requests}")
+
+    wcf.disable_recv_msg()
+    stub.stop()
+    if broken:
+        print(f"没有收到任何回复：{', '.join(broken)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
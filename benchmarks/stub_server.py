@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, Union
+from urllib.parse import parse_qs, urlsplit
+
+# 压测时替换的源站，HttpClient 的 rewrite 配置把它们指向本地桩服务
+UPSTREAMS = ("https://api.pearktrue.cn", "https://api.vvhan.com", "https://api.cenguigui.cn",
+             "https://api.lolimi.cn", "https://v.api.aa1.cn", "https://3650000.xyz")
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 4096
+
+
+def _items(n: int, make: Callable[[int], dict]) -> list:
+    return [make(i) for i in range(1, n + 1)]
+
+
+def _song(i: int) -> dict:
+    return {"id": i, "song_name": f"歌曲{i}", "singer": "歌手", "music_link": "https://api.pearktrue.cn/media/a.mp3"}
+
+
+# 路径 -> 返回内容，字典按 JSON 返回，bytes 原样返回，与线上接口的字段保持一致
+# 返回内容随参数变化的接口用函数表示，参数为查询参数（每个参数取第一个值）
+ROUTES: Dict[str, Union[dict, bytes, str, Callable[[Dict[str, str]], Union[dict, bytes, str]]]] = {
+    "/api/stablediffusion": {"code": 200, "imgurl": "https://api.pearktrue.cn/media/sd.png"},
+    "/api/googletranslate": {"code": 200, "result": "I like you"},
+    "/api/word/pinyin": {"code": 200, "data": ["wǒ", "ài", "nǐ"]},
+    # 不带 num 时返回搜索结果列表（搜歌），带 num 时返回该首歌（听歌）
+    "/api/music/wanneng.php": lambda q: {"code": 200, "data": _song(int(q["num"])) if "num" in q else _items(10, _song)},
+    "/api/signature": PNG,
+    "/api/namexy": {"code": 200, "data": [f"网名{i}" for i in range(10)]},
+    "/api/name/generate": {"code": 200, "data": [f"名字{i}" for i in range(10)]},
+    "/api/name/check.php": {"code": 200, "data": {"name": "张三", "count": 100, "male": "60%", "female": "40%"}},
+    "/api/meansearch": {"code": 200, "data": _items(10, lambda i: {"quote": f"句子{i}", "source": f"出处{i}"})},
+    "/api/media/lines.php": {"code": 200, "data": _items(5, lambda i: {
+        "title": f"电影{i}", "all_zh_word": ["我爱你"], "all_en_word": ["I love you"]})},
+    "/api/yujie/": '<html><video><source src="/media/a.mp3"></video></html>',
+    "/api/moyu": PNG,
+    "/api/jp": PNG,
+    "/api/wordcloud": {"code": 200, "imgurl": "https://api.pearktrue.cn/media/cloud.png"},
+    "/api/airecognizeimg/": {"code": 200, "result": "一只猫"},
+    "/api/dailyhot": {"code": 200, "data": _items(30, lambda i: {"title": f"热搜标题{i}"})},
+    "/api/jdyl/qinghua.php": "情话一<br>情话二<br>",
+    "/api/aiheadportrait/": {"code": 200, "imgurl": "https://api.pearktrue.cn/media/head.png"},
+    "/api/alipay": {"code": 200, "audiourl": "https://api.pearktrue.cn/media/a.mp3"},
+    "/api/todayanime/": {"code": 200, "data": _items(20, lambda i: {"title": f"番剧{i}", "status": "更新至12集"})},
+    "/api/dy/hot/": {"code": 200, "data": {"current": _items(30, lambda i: {"rank": i, "topic_name": f"话题{i}"})}},
+    "/api/dy/search": {"code": 200, "data": _items(10, lambda i: {
+        "top": i, "time": "2024-01-01", "nickname": f"作者{i}", "description": "视频简介" * 5,
+        "linkurl": f"https://www.douyin.com/video/{i}"})},
+    "/api/video/douyin": {"code": 200, "data": {"url": "https://api.pearktrue.cn/media/v.mp4"}},
+    "/api/api-girl-11-02/index.php": {"mp4": "//api.pearktrue.cn/media/v.mp4"},
+    "/api": '<html><img src="https://api.pearktrue.cn/media/a.jpg"></html>',
+    "/api/bjx": {"code": 200, "msg": "查询成功", "name": "张", "top": 3},
+    "/api/certificate/": PNG,
+    "/api/baidutiku": {"code": 200, "data": {"question": "题目", "options": ["A", "B"], "answer": "A"}},
+    "/api/calories": {"code": 200, "food": "橘子", "count": 2,
+                      "data": [{"food": "橘子", "calories": "44"}, {"food": "砂糖橘", "calories": "46"}]},
+    "/api/horoscope": {"success": True, "data": {
+        "title": "白羊座", "type": "今日运势", "time": "2024-01-01", "todo": {"yi": "读书", "ji": "熬夜"},
+        "shortcomment": "不错", "index": {"all": "80%"}, "fortunetext": {"all": "运势平稳"}}},
+    "/api/oil": {"code": 200, "data": [{"province": "江苏", "prices": {"92": "7.9", "95": "8.4"}}]},
+    "/api/phone": {"code": 200, "mobile": "13500000000",
+                   "info": {"province": "江苏", "city": "南京", "operator": "移动"},
+                   "data": [{"name": "标记", "msg": "无"}]},
+    "/api/aivoicenet": {"code": 200, "voiceurl": "https://api.pearktrue.cn/media/a.mp3"},
+    "/api/audiocr/": {"code": 200, "data": {"content": "你好"}},
+    "/api/weather": lambda q: {"code": 200, "city": q.get("city", ""), "weather": "晴", "temperature": "5~15℃"},
+}
+
+
+class StubServer(object):
+    """本地 HTTP 桩服务，模拟 api.pearktrue.cn、api.vvhan.com 等上游接口
+    每个请求按 latency ± jitter 延迟后返回 ROUTES 中的固定内容，/media/ 下的路径返回二进制数据。
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, port: int = 0,
+                 latencies: Dict[str, float] = None) -> None:
+        """
+        :param latency: 每个请求的模拟延迟（秒）
+        :param jitter: 延迟的随机浮动范围（秒）
+        :param port: 监听端口，0 表示自动分配
+        :param latencies: 按路径单独指定延迟，如 {"/api/video/douyin": 1.0}
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.latencies = latencies or {}
+        self.requests = 0
+        self.lock = Lock()  # 处理线程并发计数
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持 keep-alive，和线上一样复用连接
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def _reply(self) -> None:
+                with stub.lock:
+                    stub.requests += 1
+                url = urlsplit(self.path)
+                path = url.path
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                delay = stub.latencies.get(path, stub.latency)
+                if stub.jitter:
+                    delay = max(0.0, delay + random.uniform(-stub.jitter, stub.jitter))
+                time.sleep(delay)
+                body = ROUTES.get(path)
+                if callable(body):
+                    body = body({k: v[0] for k, v in parse_qs(url.query).items()})
+                if body is None and path.startswith("/media/"):
+                    body = PNG
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if isinstance(body, dict):
+                    data, ctype = json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json"
+                elif isinstance(body, str):
+                    data, ctype = body.encode("utf-8"), "text/html; charset=utf-8"
+                else:
+                    data, ctype = body, "application/octet-stream"
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _reply
+            do_POST = _reply
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rewrite(self) -> Dict[str, str]:
+        """供 HTTP 配置节 rewrite 使用：把所有上游指向本服务"""
+        return {upstream: self.base_url for upstream in UPSTREAMS}
+
+    def start(self) -> "StubServer":
+        Thread(target=self.server.serve_forever, name="StubServer", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
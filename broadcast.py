@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from concurrent.futures import Future, wait
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+def shift_time(t: str, seconds: float) -> str:
+    """把 HH:MM 或 HH:MM:SS 格式的时间平移若干秒，跨零点时回绕"""
+    fmt = "%H:%M:%S" if t.count(":") == 2 else "%H:%M"
+    shifted = datetime.strptime(t, fmt) + timedelta(seconds=seconds)
+    return shifted.strftime("%H:%M:%S")
+
+
+class BroadcastReport(object):
+    """一次群发的结果：每个接收者的送达耗时和失败原因"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.latency: Dict[str, float] = {}  # receiver: 从提交到送达的秒数
+        self.failed: Dict[str, str] = {}     # receiver: 最后一次失败的原因
+        self.attempts = 0
+
+    def summary(self) -> str:
+        lines = [f"{self.name} 群发：成功 {len(self.latency)}，失败 {len(self.failed)}，共尝试 {self.attempts} 轮"]
+        if self.latency:
+            values = sorted(self.latency.values())
+            p50 = values[len(values) // 2]
+            lines.append(f"送达耗时 p50 {p50:.2f}s，最大 {values[-1]:.2f}s")
+        lines += [f"失败 {r}: {reason}" for r, reason in self.failed.items()]
+        return "\n".join(lines)
+
+
+class Broadcaster(object):
+    """定时群发
+    在推送时间之前预取内容；推送时并发提交给发送队列（发送队列负责按接收者限速），
+    提交之间按 interval 节流，失败的接收者用同一份内容重试，不重新获取内容。
+    """
+
+    def __init__(self, send: Callable[[str, str], Future], prefetch_lead: float = 300, max_age: float = 1800,
+                 interval: float = 0.05, retries: int = 2, retry_delay: float = 10, timeout: float = 60) -> None:
+        """
+        :param send: send(content, receiver) 返回送达时完成的 Future
+        :param prefetch_lead: 提前预取的秒数
+        :param max_age: 预取的内容在多少秒内有效
+        :param interval: 相邻两次提交的间隔（秒）
+        :param retries: 失败接收者的重试轮数
+        :param retry_delay: 两轮之间的等待（秒）
+        :param timeout: 每轮等待送达的最长时间（秒）
+        """
+        self.LOG = logging.getLogger("Broadcaster")
+        self.send = send
+        self.prefetch_lead = prefetch_lead
+        self.max_age = max_age
+        self.interval = interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.contents: Dict[str, Tuple[str, float]] = {}  # name: (内容, 获取时间)
+        self.lock = Lock()
+        self.reports: Dict[str, BroadcastReport] = {}
+
+    @classmethod
+    def from_config(cls, send: Callable[[str, str], Future], conf: Optional[dict]) -> "Broadcaster":
+        conf = conf or {}
+        keys = ("prefetch_lead", "max_age", "interval", "retries", "retry_delay", "timeout")
+        return cls(send, **{k: conf[k] for k in keys if k in conf})
+
+    def prefetch(self, name: str, fetch: Callable[[], str]) -> None:
+        """预取内容，推送时直接使用"""
+        try:
+            content = fetch()
+        except Exception as e:
+            self.LOG.error(f"Prefetching {name} failed: {e}")
+            return
+        if content:
+            with self.lock:
+                self.contents[name] = (content, time.monotonic())
+
+    def content(self, name: str, fetch: Callable[[], str]) -> Optional[str]:
+        with self.lock:
+            cached = self.contents.pop(name, None)
+        if cached and time.monotonic() - cached[1] <= self.max_age:
+            return cached[0]
+        return fetch()
+
+    def start(self, name: str, fetch: Callable[[], str], receivers: List[str]) -> Thread:
+        """在后台线程中群发，立即返回"""
+        t = Thread(target=self.broadcast, name=f"Broadcast-{name}", args=(name, fetch, list(receivers)), daemon=True)
+        t.start()
+        return t
+
+    def broadcast(self, name: str, fetch: Callable[[], str], receivers: List[str]) -> BroadcastReport:
+        report = BroadcastReport(name)
+        content = self.content(name, fetch)
+        if not content:
+            self.LOG.error(f"No content to broadcast for {name}")
+            return report
+        pending = receivers
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay)
+            report.attempts += 1
+            pending = self._round(content, pending, report)
+            if not pending:
+                break
+        self.reports[name] = report
+        self.LOG.info(report.summary())
+        return report
+
+    def _round(self, content: str, receivers: List[str], report: BroadcastReport) -> List[str]:
+        # 提交一轮并等待送达，返回失败的接收者
+        futures: Dict[Future, str] = {}
+        for r in receivers:
+            submitted = time.monotonic()
+            future = self.send(content, r)
+            future.add_done_callback(lambda f, r=r, t=submitted: self._record(report, r, t, f))
+            futures[future] = r
+            if self.interval:
+                time.sleep(self.interval)
+        done, not_done = wait(futures, timeout=self.timeout)
+        failed = [futures[f] for f in done if f.exception() is not None]
+        for f in not_done:
+            if f.cancel():
+                # 还在发送队列中，撤回后下一轮重发
+                report.failed[futures[f]] = "timeout"
+                failed.append(futures[f])
+            else:
+                # 已在发送，重发会重复送达；结果由 _record 记录
+                report.failed.setdefault(futures[f], "timeout")
+        return failed
+
+    @staticmethod
+    def _record(report: BroadcastReport, receiver: str, submitted: float, future: Future) -> None:
+        if future.cancelled():
+            return
+        if future.exception() is None:
+            report.latency[receiver] = time.monotonic() - submitted
+            report.failed.pop(receiver, None)
+        else:
+            report.failed[receiver] = str(future.exception())
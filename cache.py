@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache(object):
+    """带过期时间的 LRU 缓存，线程安全"""
+
+    def __init__(self, max_size: int = 1024, default_ttl: float = 300) -> None:
+        """
+        :param max_size: 最多缓存的条目数，超出时淘汰最久未使用的
+        :param default_ttl: 默认过期时间（秒）
+        """
+        self.max_size = max(1, int(max_size))
+        self.default_ttl = default_ttl
+        self.data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key: (expire_at, value)
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self.lock:
+            item = self.data.get(key, _MISSING)
+            if item is _MISSING or item[0] <= now:
+                if item is not _MISSING:
+                    del self.data[key]
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expire_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self.lock:
+            self.data[key] = (expire_at, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            item = self.data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self.data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class ReplyCache(TTLCache):
+    """命令回复缓存，键为 (命令, 归一化后的参数)
+    每个命令的过期时间可在配置中覆盖，例如 CACHE: {ttl: {查油价: 3600}}
+    """
+
+    def __init__(self, max_size: int = 1024, default_ttl: float = 300,
+                 ttls: Optional[Dict[str, float]] = None) -> None:
+        super().__init__(max_size, default_ttl)
+        self.ttls = dict(ttls or {})
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> "ReplyCache":
+        conf = conf or {}
+        return cls(conf.get("max_size", 1024), conf.get("default_ttl", 300), conf.get("ttl"))
+
+    @staticmethod
+    def make_key(command: str, arg: str) -> tuple:
+        return command, " ".join(arg.split()).lower()
+
+    def fetch(self, command: str, arg: str, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """命中直接返回；未命中调用 loader，结果非空时写入缓存"""
+        key = self.make_key(command, arg)
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = loader()
+        if value:
+            self.set(key, value, self.ttls.get(command, ttl))
+        return value
+
+
+def cached_reply(ttl: float) -> Callable:
+    """处理方法的回复缓存装饰器，放在 add_receiver_info 之下
+    只适用于同样参数总是得到同样回复、且不修改会话状态的命令
+    :param ttl: 默认过期时间（秒），配置中的同名命令优先
+    """
+    def decorator(function):
+        command = function.__name__.replace("handle_", "", 1)
+
+        @wraps(function)
+        def wrapper(self, msg, content: str = ""):
+            return self.reply_cache.fetch(command, content, lambda: function(self, msg, content), ttl)
+
+        return wrapper
+
+    return decorator
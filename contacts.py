@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import sys
+import time
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from typing import Dict, Optional, Tuple
+
+from wcferry import Wcf
+
+
+class AliasCache(object):
+    """群成员昵称缓存，键为 (roomid, wxid)
+    每个群首次用到时一次性拉取全部成员，之后后台定时刷新；
+    收到群系统消息（成员变动）时标记失效，下次用到时重新拉取。
+    """
+
+    def __init__(self, wcf: Wcf, refresh_interval: float = 3600, max_rooms: int = 500) -> None:
+        """
+        :param wcf: Wcf 实例
+        :param refresh_interval: 后台刷新间隔（秒），0 表示不在后台刷新
+        :param max_rooms: 最多缓存的群数，超出时丢弃最久没用到的群
+        """
+        self.LOG = logging.getLogger("AliasCache")
+        self.wcf = wcf
+        self.refresh_interval = refresh_interval
+        self.max_rooms = max_rooms
+        self.rooms: Dict[str, Dict[str, str]] = {}
+        self.loaded: Dict[str, float] = {}  # roomid: 拉取时间
+        self.used: Dict[str, float] = {}    # roomid: 最近使用时间
+        self.lock = Lock()
+        self.stopped = Event()
+        if refresh_interval > 0:
+            Thread(target=self._refresh_loop, name="AliasRefresh", daemon=True).start()
+
+    @classmethod
+    def from_config(cls, wcf: Wcf, conf: Optional[dict]) -> "AliasCache":
+        conf = conf or {}
+        return cls(wcf, conf.get("refresh_interval", 3600), conf.get("max_rooms", 500))
+
+    def get(self, roomid: str, wxid: str) -> str:
+        """返回 wxid 在群里的昵称"""
+        members = self.rooms.get(roomid)
+        if members is None:
+            members = self.load(roomid)
+        self.used[roomid] = time.monotonic()
+        alias = members.get(wxid)
+        if alias is None:
+            # 刚进群还没刷新到的成员，单独查一次并补进缓存
+            alias = self.wcf.get_alias_in_chatroom(wxid, roomid)
+            members[wxid] = alias
+        return alias
+
+    def load(self, roomid: str) -> Dict[str, str]:
+        """整群拉取成员昵称"""
+        members = dict(self.wcf.get_chatroom_members(roomid) or {})
+        with self.lock:
+            self.rooms[roomid] = members
+            self.loaded[roomid] = time.monotonic()
+            self.used.setdefault(roomid, time.monotonic())
+            self._trim()
+        return members
+
+    def invalidate(self, roomid: str) -> None:
+        """群成员有变动，丢弃该群的缓存"""
+        with self.lock:
+            self.rooms.pop(roomid, None)
+            self.loaded.pop(roomid, None)
+
+    def _trim(self) -> None:
+        # 调用方持有 self.lock
+        while len(self.rooms) > self.max_rooms:
+            oldest = min(self.rooms, key=lambda r: self.used.get(r, 0))
+            self.rooms.pop(oldest)
+            self.loaded.pop(oldest, None)
+            self.used.pop(oldest, None)
+
+    def _refresh_loop(self) -> None:
+        while not self.stopped.wait(min(self.refresh_interval, 60)):
+            now = time.monotonic()
+            stale = [r for r, t in list(self.loaded.items()) if now - t >= self.refresh_interval]
+            for roomid in stale:
+                try:
+                    self.load(roomid)
+                except Exception as e:
+                    self.LOG.warning(f"Refreshing members of {roomid} failed: {e}")
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+class ContactDirectory(object):
+    """按需加载的联系人目录，替代启动时整表读取 Contact
+    只缓存最近用到的联系人（LRU），昵称以 UTF-8 字节存储以减少内存；
+    条目超过 ttl 后再次用到时单独重查，新增联系人通过 sync 按 rowid 增量拉取。
+    格式与原来的 {"wxid": "NickName"} 一致，可按字典方式读写。
+    """
+
+    def __init__(self, wcf: Wcf, max_entries: int = 2000, ttl: float = 86400) -> None:
+        """
+        :param wcf: Wcf 实例
+        :param max_entries: 最多缓存的联系人数
+        :param ttl: 条目过期时间（秒）
+        """
+        self.LOG = logging.getLogger("ContactDirectory")
+        self.wcf = wcf
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Tuple[Optional[bytes], float]]" = OrderedDict()  # wxid: (昵称, 加载时间)
+        self.lock = Lock()
+        self.last_rowid = self._max_rowid()
+
+    @classmethod
+    def from_config(cls, wcf: Wcf, conf: Optional[dict]) -> "ContactDirectory":
+        conf = conf or {}
+        return cls(wcf, conf.get("max_entries", 2000), conf.get("ttl", 86400))
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        return "'" + value.replace("'", "''") + "'"
+
+    def _max_rowid(self) -> int:
+        rows = self.wcf.query_sql("MicroMsg.db", "SELECT MAX(rowid) AS n FROM Contact;")
+        return (rows[0].get("n") or 0) if rows else 0
+
+    def _put(self, wxid: str, nickname: Optional[str]) -> None:
+        # 调用方持有 self.lock；查不到的 wxid 也缓存，避免反复查库
+        wxid = sys.intern(wxid)
+        self.entries[wxid] = (nickname.encode("utf-8") if nickname is not None else None, time.monotonic())
+        self.entries.move_to_end(wxid)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, wxid: str, default: Optional[str] = None) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(wxid)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self.entries.move_to_end(wxid)
+                return entry[0].decode("utf-8") if entry[0] is not None else default
+        rows = self.wcf.query_sql("MicroMsg.db", f"SELECT NickName FROM Contact WHERE UserName = {self._quote(wxid)};")
+        nickname = rows[0]["NickName"] if rows else None
+        with self.lock:
+            self._put(wxid, nickname)
+        return nickname if nickname is not None else default
+
+    def sync(self) -> int:
+        """增量拉取上次同步之后新增的联系人，返回拉取的条数"""
+        rows = self.wcf.query_sql("MicroMsg.db",
+                                  f"SELECT rowid AS id, UserName, NickName FROM Contact WHERE rowid > {int(self.last_rowid)} ORDER BY rowid;")
+        with self.lock:
+            for row in rows or []:
+                self._put(row["UserName"], row["NickName"])
+                self.last_rowid = max(self.last_rowid, row["id"])
+        return len(rows or [])
+
+    def __getitem__(self, wxid: str) -> str:
+        nickname = self.get(wxid)
+        if nickname is None:
+            raise KeyError(wxid)
+        return nickname
+
+    def __setitem__(self, wxid: str, nickname: str) -> None:
+        with self.lock:
+            self._put(wxid, nickname)
+
+    def __contains__(self, wxid: str) -> bool:
+        return self.get(wxid) is not None
+
+    def __len__(self) -> int:
+        return len(self.entries)
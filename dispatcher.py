@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from collections import deque
+from queue import Queue
+from threading import BoundedSemaphore, Condition, Thread
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+
+class MsgDispatcher(object):
+    """消息分发引擎
+    所有工作线程共用一个就绪队列，哪个线程空闲就处理哪条消息，慢会话不会挡住其他会话。
+    同一会话（roomid/sender）同时只有一条消息在处理，后到的暂存在该会话的等待队列里，
+    前一条处理完再放回就绪队列末尾，既保证会话内的顺序，也不让一个会话连续占用线程。
+    """
+
+    def __init__(self, handler: Callable[[Any], Any], workers: int = 8, queue_size: int = 1000,
+                 key: Optional[Callable[[Any], Hashable]] = None) -> None:
+        """
+        :param handler: 处理单条消息的方法
+        :param workers: 工作线程数
+        :param queue_size: 已投递未处理完的消息上限，达到上限时 submit 会阻塞（背压）
+        :param key: 从消息中提取会话标识的方法，默认 roomid，私聊用 sender
+        """
+        self.LOG = logging.getLogger("Dispatcher")
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.key = key or self.conversation_key
+        self.capacity = BoundedSemaphore(max(1, int(queue_size)))
+        self.ready: Queue = Queue()  # (会话, 消息)，没有同会话消息在处理的才进入
+        self.active: Dict[Hashable, Deque[Any]] = {}  # 正在处理的会话: 等待中的后续消息
+        self.cond = Condition()
+        self.pending = 0  # 已投递未处理完的消息数
+        self.threads: List[Thread] = []
+        self.running = False
+
+    @staticmethod
+    def conversation_key(msg) -> str:
+        return msg.roomid if msg.roomid else msg.sender
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        for i in range(self.workers):
+            t = Thread(target=self._work, name=f"Dispatch-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止分发，已投递的消息处理完后线程退出"""
+        if not self.running:
+            return
+        self.running = False
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending == 0, timeout)
+        for _ in self.threads:
+            self.ready.put(None)
+        for t in self.threads:
+            t.join(timeout)
+        self.threads = []
+
+    def submit(self, msg, timeout: Optional[float] = None) -> bool:
+        """投递消息，积压达到上限时阻塞，超时返回 False"""
+        if not self.capacity.acquire(timeout=timeout):
+            self.LOG.warning(f"Dispatch queue full, dropping message {getattr(msg, 'id', '')}")
+            return False
+        key = self.key(msg)
+        with self.cond:
+            self.pending += 1
+            waiting = self.active.get(key)
+            if waiting is not None:
+                waiting.append(msg)
+                return True
+            self.active[key] = deque()
+        self.ready.put((key, msg))
+        return True
+
+    def qsize(self) -> int:
+        return self.pending
+
+    def _work(self) -> None:
+        while True:
+            item: Optional[Tuple[Hashable, Any]] = self.ready.get()
+            if item is None:
+                return
+            key, msg = item
+            try:
+                self.handler(msg)
+            except Exception as e:
+                self.LOG.error(f"Processing message error: {e}")
+            finally:
+                self._done(key)
+
+    def _done(self, key: Hashable) -> None:
+        # 放行同一会话的下一条消息
+        with self.cond:
+            waiting = self.active[key]
+            following = waiting.popleft() if waiting else None
+            if following is None:
+                del self.active[key]
+            self.pending -= 1
+            if self.pending == 0:
+                self.cond.notify_all()
+        self.capacity.release()
+        if following is not None:
+            self.ready.put((key, following))
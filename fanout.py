@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from resilience import CircuitOpenError
+
+
+class FanOut(object):
+    """并发执行处理方法中相互独立的上游请求（scatter/gather）
+    所有分支共享一个总期限，超时或失败的分支单独记录，已成功的结果照常返回。
+    没有分支成功且有分支因熔断未发出时抛出 CircuitOpenError，由 add_receiver_info 回复降级提示。
+    """
+
+    def __init__(self, max_workers: int = 16, timeout: float = 10) -> None:
+        """
+        :param max_workers: 执行分支的线程数，所有处理方法共用
+        :param timeout: 默认总期限（秒）
+        """
+        self.LOG = logging.getLogger("FanOut")
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="FanOut")
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> "FanOut":
+        conf = conf or {}
+        return cls(conf.get("workers", 16), conf.get("timeout", 10))
+
+    def gather(self, calls: Dict[str, Callable[[], Any]], timeout: Optional[float] = None) -> Tuple[Dict[str, Any], Dict[str, BaseException]]:
+        """
+        :param calls: {分支名: 无参调用}
+        :param timeout: 所有分支的总期限（秒），默认使用初始化时的设置
+        :return: (成功分支的结果, 失败分支的异常)
+        """
+        timeout = self.timeout if timeout is None else timeout
+        # 分支在各自的上下文副本中运行，以便上游耗时仍记到发起的命令上
+        futures = {self.executor.submit(copy_context().run, call): name for name, call in calls.items()}
+        done, pending = wait(futures, timeout=timeout)
+        results, errors = {}, {}
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                self.LOG.warning(f"Branch {name} failed: {e}")
+                errors[name] = e
+        for future in pending:
+            name = futures[future]
+            future.cancel()  # 未开始的分支直接取消，已在运行的只能丢弃结果
+            self.LOG.warning(f"Branch {name} timed out after {timeout}s")
+            errors[name] = TimeoutError(f"{name} timed out")
+        if not results:
+            for e in errors.values():
+                if isinstance(e, CircuitOpenError):
+                    raise e
+        return results, errors
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import logging
+from typing import Any, Optional, Tuple
+
+from startup import lazy_import
+
+_pil: Any = False  # False 表示还没尝试导入
+
+
+def load_pil() -> Any:
+    """第一次【识图】时才导入 Pillow，返回 PIL 包；未安装时返回 None，原样上传并按内容哈希缓存"""
+    global _pil
+    if _pil is False:
+        try:
+            lazy_import("PIL.Image")
+            lazy_import("PIL.ImageOps")
+            _pil = lazy_import("PIL")
+        except ImportError:
+            _pil = None
+    return _pil
+
+
+class ImagePreprocessor(object):
+    """【识图】上传前的图片预处理
+    安装了 Pillow 时：按 EXIF 方向摆正、缩放到 max_side 以内并重新压缩为 JPEG，直到不超过 max_bytes；
+    同时计算 16×16 的差值哈希（dHash），转发多次、被重新压缩过的同一张图也能得到相同的键；
+    键里带上图片尺寸，布局相同但内容不同的图（如同一模板的表情包、同一应用的截图）不容易撞键。
+    未安装时原样上传，以 sha256 作为键。
+    """
+
+    def __init__(self, max_side: int = 1280, max_bytes: int = 512 * 1024, quality: int = 85,
+                 min_quality: int = 50) -> None:
+        """
+        :param max_side: 长边像素上限
+        :param max_bytes: 上传大小上限（字节），超过时逐步降低质量
+        :param quality: 初始 JPEG 质量
+        :param min_quality: 最低 JPEG 质量
+        """
+        self.LOG = logging.getLogger("ImagePreprocessor")
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.min_quality = min_quality
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> "ImagePreprocessor":
+        conf = conf or {}
+        keys = ("max_side", "max_bytes", "quality", "min_quality")
+        return cls(**{k: conf[k] for k in keys if k in conf})
+
+    def prepare(self, path: str) -> Tuple[bytes, str]:
+        """
+        :return: (上传的数据, 缓存键)
+        """
+        with open(path, "rb") as f:
+            raw = f.read()
+        pil = load_pil()
+        if pil is None:
+            return raw, "sha256:" + hashlib.sha256(raw).hexdigest()
+        try:
+            with pil.Image.open(io.BytesIO(raw)) as img:
+                img = pil.ImageOps.exif_transpose(img)
+                width, height = img.size
+                key = f"dhash:{width}x{height}:{self.dhash(img)}"
+                if max(img.size) <= self.max_side and len(raw) <= self.max_bytes:
+                    return raw, key
+                return self.compress(img), key
+        except Exception as e:  # 无法解码的文件原样上传
+            self.LOG.warning(f"Preprocessing {path} failed: {e}")
+            return raw, "sha256:" + hashlib.sha256(raw).hexdigest()
+
+    def compress(self, img) -> bytes:
+        img = img.convert("RGB")
+        img.thumbnail((self.max_side, self.max_side), load_pil().Image.LANCZOS)
+        quality = self.quality
+        while True:
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=quality, optimize=True)
+            if out.tell() <= self.max_bytes or quality <= self.min_quality:
+                return out.getvalue()
+            quality = max(self.min_quality, quality - 10)
+
+    @staticmethod
+    def dhash(img, size: int = 16) -> str:
+        """差值哈希：缩成 (size+1)×size 的灰度图，比较相邻像素的明暗，得到 size×size 位"""
+        small = img.convert("L").resize((size + 1, size), load_pil().Image.LANCZOS)
+        pixels = list(small.getdata())
+        bits = 0
+        for row in range(size):
+            for col in range(size):
+                left = pixels[row * (size + 1) + col]
+                right = pixels[row * (size + 1) + col + 1]
+                bits = (bits << 1) | (left > right)
+        return f"{bits:0{size * size // 4}x}"
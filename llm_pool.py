@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import BoundedSemaphore, Lock
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from memory import SUMMARY_PREFIX, ConversationMemory
+from metrics import METRICS
+
+
+class NoBackendError(Exception):
+    """所有模型都失败、超时或已达并发上限"""
+
+
+class Provider(object):
+    """一个聊天模型及其最近的延迟和错误统计"""
+
+    def __init__(self, name: str, backend: Any, max_concurrency: int = 4, window: int = 50,
+                 priority: int = 0) -> None:
+        """
+        :param name: 模型名，如 CHATGPT
+        :param backend: 提供 get_answer(question, wxid) 的模型实例
+        :param max_concurrency: 同时进行的请求上限，保护接口配额
+        :param window: 统计最近多少次请求
+        :param priority: 数值小的优先，指定的模型为 0
+        """
+        self.name = name
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.slots = BoundedSemaphore(max_concurrency)
+        self.priority = priority
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)  # (耗时, 是否成功)
+        self.inflight = 0
+        self.cooldown_until = 0.0
+        self.lock = Lock()
+
+    def record(self, elapsed: float, ok: bool, cooldown: float = 0) -> None:
+        with self.lock:
+            self.samples.append((elapsed, ok))
+            if not ok and cooldown:
+                self.cooldown_until = time.monotonic() + cooldown
+
+    @property
+    def error_rate(self) -> float:
+        samples = list(self.samples)
+        return sum(1 for _, ok in samples if not ok) / len(samples) if samples else 0.0
+
+    @property
+    def latency(self) -> float:
+        """最近成功请求的平均耗时，没有样本时为 0（新模型先试一试）"""
+        values = [elapsed for elapsed, ok in list(self.samples) if ok]
+        return sum(values) / len(values) if values else 0.0
+
+    def healthy(self, max_error_rate: float) -> bool:
+        return time.monotonic() >= self.cooldown_until and self.error_rate <= max_error_rate
+
+    def score(self) -> float:
+        """越小越好：平均耗时按错误率和当前占用放大"""
+        load = 1 + self.inflight / self.max_concurrency
+        return (self.latency + 0.1) * (1 + 4 * self.error_rate) * load
+
+
+class LLMPool(object):
+    """同时保持所有已配置的聊天模型可用
+    每次 get_answer 按健康状况和最近延迟选择模型；出错、超时或回复为空时换下一个。
+    同一会话优先沿用上次的模型，除非它已不健康。
+    配置了 memory 时，会话历史由 ConversationMemory 统一保存：每次调用前用压缩后的历史替换模型里该会话的
+    conversation_list，换了模型也能接上上下文，模型自身保存的历史也不会无限增长。
+    接口与单个模型一致，toChitchat 不需要区分。
+    """
+
+    def __init__(self, providers: List[Provider], timeout: float = 30, max_attempts: int = 3,
+                 max_error_rate: float = 0.5, cooldown: float = 30, max_sessions: int = 10000,
+                 memory: Optional[ConversationMemory] = None) -> None:
+        """
+        :param providers: 参与调度的模型
+        :param timeout: 单个模型的回复期限（秒），超过后换下一个
+        :param max_attempts: 每次问答最多尝试几个模型
+        :param max_error_rate: 最近错误率超过此值的模型视为不健康，只在没有其他模型时使用
+        :param cooldown: 模型出错后暂停调度的时间（秒）
+        :param max_sessions: 记住上次所用模型的会话数上限
+        :param memory: 共用的会话记忆，None 时各模型自行保存历史
+        """
+        self.LOG = logging.getLogger("LLMPool")
+        self.providers = providers
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.max_sessions = max_sessions
+        self.sticky: Dict[str, str] = {}  # wxid: 上次回复所用的模型
+        self.lock = Lock()
+        self.memory = memory
+        if memory is not None:
+            memory.on_evict = self.forget
+        workers = sum(p.max_concurrency for p in providers) or 1
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="LLM")
+        for p in providers:
+            METRICS.gauge("robot_llm_inflight", lambda p=p: p.inflight, provider=p.name)
+
+    @classmethod
+    def from_config(cls, providers: List[Provider], conf: Optional[dict],
+                    memory: Optional[ConversationMemory] = None) -> "LLMPool":
+        conf = conf or {}
+        keys = ("timeout", "max_attempts", "max_error_rate", "cooldown", "max_sessions")
+        return cls(providers, memory=memory, **{k: conf[k] for k in keys if k in conf})
+
+    def __bool__(self) -> bool:
+        return bool(self.providers)
+
+    def __getattr__(self, name: str) -> Any:
+        # 其他属性（如 conversation_list）转给首选模型，兼容只接一个模型时的用法
+        providers = self.__dict__.get("providers")
+        if not providers:
+            raise AttributeError(name)
+        return getattr(providers[0].backend, name)
+
+    def ranked(self, wxid: str) -> List[Provider]:
+        """按调度顺序排列的模型：健康的在前，其中上次所用的模型最先，其余按优先级和得分"""
+        healthy = [p for p in self.providers if p.healthy(self.max_error_rate)]
+        sick = [p for p in self.providers if p not in healthy]
+        healthy.sort(key=lambda p: (p.name != self.sticky.get(wxid), p.score(), p.priority))
+        sick.sort(key=lambda p: (p.cooldown_until, p.error_rate))
+        return healthy + sick
+
+    def get_answer(self, question: str, wxid: str) -> str:
+        errors = []
+        ranked = self.ranked(wxid)[:self.max_attempts]
+        for i, provider in enumerate(ranked):
+            # 都满载时在最后一个候选上排队等待，而不是直接失败
+            wait = i == len(ranked) - 1 and all(e.endswith(": busy") for e in errors)
+            if not provider.slots.acquire(timeout=self.timeout if wait else 0):
+                errors.append(f"{provider.name}: busy")
+                continue
+            try:
+                answer = self._ask(provider, question, wxid)
+            except Exception as e:
+                errors.append(f"{provider.name}: {e!r}")
+                self.LOG.warning(f"{provider.name} failed, trying next: {e!r}")
+                continue
+            if answer:
+                self._remember(wxid, provider.name)
+                if self.memory is not None:
+                    self.memory.append(wxid, "user", question)
+                    self.memory.append(wxid, "assistant", answer)
+                return answer
+            errors.append(f"{provider.name}: empty")
+        raise NoBackendError("; ".join(errors) or "no chat backend configured")
+
+    def _ask(self, provider: Provider, question: str, wxid: str) -> str:
+        # slots 已由调用方获取，在模型线程结束时释放：超时后放弃等待，但该线程仍占用一个并发名额
+        try:
+            self._load_history(provider.backend, wxid)
+        except Exception:
+            provider.slots.release()  # 还没交给模型线程，由这里归还名额
+            raise
+        with provider.lock:
+            provider.inflight += 1
+        start = time.perf_counter()
+        future = self.executor.submit(provider.backend.get_answer, question, wxid)
+
+        def release(_) -> None:
+            with provider.lock:
+                provider.inflight -= 1
+            provider.slots.release()
+
+        future.add_done_callback(release)
+        ok = False
+        try:
+            answer = future.result(timeout=self.timeout)
+            ok = bool(answer)
+            return answer
+        except TimeoutError:
+            raise TimeoutError(f"no answer within {self.timeout}s")
+        finally:
+            elapsed = time.perf_counter() - start
+            provider.record(elapsed, ok, self.cooldown)
+            METRICS.observe("robot_llm_seconds", elapsed, provider=provider.name)
+            METRICS.inc("robot_llm_requests_total", provider=provider.name, outcome="ok" if ok else "error")
+
+    def _load_history(self, backend: Any, wxid: str) -> None:
+        # 保留模型自己的 system 提示，其余换成会话记忆里的历史
+        # 模型没见过这个会话但记忆里已有对话时（如刚从其他模型切换过来），用模型的 system 提示补上会话
+        history = getattr(backend, "conversation_list", None)
+        if self.memory is None or not isinstance(history, dict):
+            return
+        messages = self.memory.messages(wxid)
+        if wxid in history:
+            system = self._system_messages(history[wxid])
+        elif messages:
+            system = self._system_prompt(backend, history)
+        else:
+            return  # 全新的会话交给模型自己初始化
+        history[wxid] = system + messages
+
+    @staticmethod
+    def _system_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [m for m in messages
+                if m.get("role") == "system" and not str(m.get("content", "")).startswith(SUMMARY_PREFIX)]
+
+    def _system_prompt(self, backend: Any, history: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """模型的 system 提示：优先用模型的 system_content_msg，否则取它已有会话里的 system 消息"""
+        prompt = getattr(backend, "system_content_msg", None)
+        if isinstance(prompt, dict):
+            return [dict(prompt)]
+        for messages in list(history.values()):
+            system = self._system_messages(messages)
+            if system:
+                return [dict(m) for m in system]
+        return []
+
+    def forget(self, wxid: str) -> None:
+        """会话过期或被淘汰：同时丢弃各模型里保存的历史"""
+        for p in self.providers:
+            history = getattr(p.backend, "conversation_list", None)
+            if isinstance(history, dict):
+                history.pop(wxid, None)
+        with self.lock:
+            self.sticky.pop(wxid, None)
+
+    def _remember(self, wxid: str, name: str) -> None:
+        with self.lock:
+            self.sticky.pop(wxid, None)
+            self.sticky[wxid] = name
+            while len(self.sticky) > self.max_sessions:
+                self.sticky.pop(next(iter(self.sticky)))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [{"name": p.name, "latency": round(p.latency, 3), "error_rate": round(p.error_rate, 3),
+                 "inflight": p.inflight, "healthy": p.healthy(self.max_error_rate)} for p in self.providers]
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from threading import RLock
+from typing import Dict, Optional, Tuple
+
+
+class MediaWriter(object):
+    """写入一个媒体文件：先写临时文件并边写边计算哈希，提交时按内容哈希命名"""
+
+    def __init__(self, cache: "MediaCache", suffix: str, key: Optional[str] = None) -> None:
+        self.cache = cache
+        self.suffix = suffix
+        self.key = key
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.path: Optional[str] = None
+        fd, self.tmp_path = tempfile.mkstemp(suffix=".part", dir=cache.root)
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def commit(self) -> str:
+        self.file.close()
+        self.path = self.cache._commit(self.tmp_path, self.digest.hexdigest(), self.size, self.suffix, self.key)
+        return self.path
+
+    def abort(self) -> None:
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self) -> "MediaWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class MediaCache(object):
+    """按内容寻址的媒体文件缓存
+    下载或生成的图片、音频、视频统一存放在 root 下，以内容哈希命名，相同内容只存一份。
+    也可以用请求键（如 日期、URL）登记，下次同样的请求直接返回磁盘上的文件。
+    交给微信发送前文件被“占用”，发送完成后 release；淘汰时跳过被占用的文件，
+    因此并发请求之间不会互相覆盖或删掉对方还没发出去的文件。
+    """
+
+    def __init__(self, root: str, max_bytes: int = 512 * 1024 * 1024, max_age: float = 7 * 86400) -> None:
+        """
+        :param root: 缓存目录
+        :param max_bytes: 缓存总大小上限（字节）
+        :param max_age: 文件最长保留时间（秒）
+        """
+        self.LOG = logging.getLogger("MediaCache")
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = RLock()
+        self.files: Dict[str, Tuple[int, float]] = {}  # path: (size, mtime)
+        self.keys: Dict[str, str] = {}                 # 请求键: path
+        self.pins: Counter = Counter()
+        self.total = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._scan()
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> "MediaCache":
+        conf = conf or {}
+        root = conf.get("root") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "media")
+        return cls(root, conf.get("max_bytes", 512 * 1024 * 1024), conf.get("max_age", 7 * 86400))
+
+    def _scan(self) -> None:
+        # 启动时登记已有文件，清理上次中断留下的临时文件
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".part"):
+                os.remove(entry.path)
+                continue
+            st = entry.stat()
+            self.files[entry.path] = (st.st_size, st.st_mtime)
+            self.total += st.st_size
+
+    def contains(self, path: str) -> bool:
+        return os.path.abspath(os.path.dirname(path)) == self.root
+
+    def writer(self, suffix: str, key: Optional[str] = None) -> MediaWriter:
+        """返回写入器，配合 with 使用；提交后得到的文件已被占用，发送后需 release"""
+        return MediaWriter(self, suffix, key)
+
+    def put_bytes(self, data: bytes, suffix: str, key: Optional[str] = None) -> str:
+        with self.writer(suffix, key) as w:
+            w.write(data)
+        return w.path
+
+    def lookup(self, key: str) -> Optional[str]:
+        """按请求键查找未过期的文件，找到时占用并返回路径"""
+        with self.lock:
+            path = self.keys.get(key)
+            if path is None:
+                return None
+            info = self.files.get(path)
+            if info is None or time.time() - info[1] > self.max_age or not os.path.isfile(path):
+                self.keys.pop(key, None)
+                return None
+            self.pins[path] += 1
+            return path
+
+    def release(self, path: str) -> None:
+        """发送完成后释放占用，必要时触发淘汰"""
+        with self.lock:
+            if self.pins[path] > 1:
+                self.pins[path] -= 1
+            else:
+                self.pins.pop(path, None)
+            self.evict()
+
+    def _commit(self, tmp_path: str, digest: str, size: int, suffix: str, key: Optional[str]) -> str:
+        path = os.path.join(self.root, digest[:32] + suffix)
+        with self.lock:
+            if path in self.files and os.path.isfile(path):
+                os.remove(tmp_path)  # 相同内容已存在，复用
+                os.utime(path)
+            else:
+                os.replace(tmp_path, path)
+                self.total += size
+            self.files[path] = (size, time.time())
+            if key is not None:
+                self.keys[key] = path
+            self.pins[path] += 1
+            self.evict()
+        return path
+
+    def evict(self) -> None:
+        """删除过期文件，再按最旧优先删到总大小不超过上限；被占用的文件不删"""
+        with self.lock:
+            now = time.time()
+            for path, (size, mtime) in sorted(self.files.items(), key=lambda item: item[1][1]):
+                if self.total <= self.max_bytes and now - mtime <= self.max_age:
+                    break
+                if self.pins.get(path):
+                    continue
+                self._remove(path, size)
+
+    def _remove(self, path: str, size: int) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.LOG.warning(f"Failed to remove {path}: {e}")
+            return
+        del self.files[path]
+        self.total -= size
+        for key in [k for k, p in self.keys.items() if p == path]:
+            del self.keys[key]
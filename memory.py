@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import re
+import time
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Callable, Deque, Dict, List, Optional
+
+# 中日韩字符约一字一个 token，其余按 4 个字符一个 token 估算
+_CJK = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+SUMMARY_PREFIX = "此前对话摘要："
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数，用于预算控制，不追求精确"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4 + 1
+
+
+class _Turn(object):
+    __slots__ = ("role", "content", "tokens")
+
+    def __init__(self, role: str, content: str) -> None:
+        self.role = role
+        self.content = content
+        self.tokens = estimate_tokens(content)
+
+
+class _Session(object):
+    __slots__ = ("turns", "summary", "tokens", "used")
+
+    def __init__(self, now: float) -> None:
+        self.turns: Deque[_Turn] = deque()
+        self.summary: Deque[str] = deque()  # 被压缩掉的旧轮次，每轮一行
+        self.tokens = 0                     # turns 与 summary 的总 token 数
+        self.used = now
+
+
+class ConversationMemory(object):
+    """所有聊天模型共用的会话记忆
+    每个会话按 token 预算保存最近的对话；超出预算时把最旧的轮次压缩成一行摘要，摘要本身也有预算，
+    超出后丢弃最旧的摘要。闲置超过 ttl 的会话过期，所有会话的总 token 数超过上限时淘汰最久未用的会话。
+    摘要是截取式的（每轮保留开头若干字），不额外调用模型。
+    """
+
+    def __init__(self, max_tokens: int = 1500, summary_tokens: int = 300, summary_chars: int = 40,
+                 ttl: float = 3600, max_total_tokens: int = 2000000) -> None:
+        """
+        :param max_tokens: 每个会话保留的 token 预算（含摘要）
+        :param summary_tokens: 其中摘要部分的预算
+        :param summary_chars: 每轮压缩成摘要时保留的字数
+        :param ttl: 会话闲置多久后过期（秒）
+        :param max_total_tokens: 所有会话合计的 token 上限
+        """
+        self.max_tokens = max_tokens
+        self.summary_tokens = min(summary_tokens, max_tokens // 2)
+        self.summary_chars = summary_chars
+        self.ttl = ttl
+        self.max_total_tokens = max_total_tokens
+        self.sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self.total_tokens = 0
+        self.lock = Lock()
+        self.on_evict: Optional[Callable[[str], None]] = None  # 会话被淘汰或过期时的回调
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> "ConversationMemory":
+        conf = conf or {}
+        keys = ("max_tokens", "summary_tokens", "summary_chars", "ttl", "max_total_tokens")
+        return cls(**{k: conf[k] for k in keys if k in conf})
+
+    def _get(self, key: str, now: float) -> Optional[_Session]:
+        # 调用方持有 self.lock
+        session = self.sessions.get(key)
+        if session is not None and now - session.used > self.ttl:
+            self._drop(key)
+            session = None
+        return session
+
+    def messages(self, key: str) -> List[Dict[str, str]]:
+        """会话的上下文：摘要（如有）作为一条 system 消息，后接保留的轮次"""
+        with self.lock:
+            session = self._get(key, time.monotonic())
+            if session is None:
+                return []
+            result = []
+            if session.summary:
+                result.append({"role": "system", "content": SUMMARY_PREFIX + "\n".join(session.summary)})
+            result += [{"role": t.role, "content": t.content} for t in session.turns]
+            return result
+
+    def append(self, key: str, role: str, content: str) -> None:
+        now = time.monotonic()
+        evicted = []
+        with self.lock:
+            session = self._get(key, now)
+            if session is None:
+                session = self.sessions[key] = _Session(now)
+            session.used = now
+            self.sessions.move_to_end(key)
+            turn = _Turn(role, content)
+            session.turns.append(turn)
+            self._add(session, turn.tokens)
+            self._compact(session)
+            evicted += self._purge(now)
+        self._notify(evicted)
+
+    def forget(self, key: str) -> None:
+        with self.lock:
+            self._drop(key)
+
+    def _add(self, session: _Session, tokens: int) -> None:
+        session.tokens += tokens
+        self.total_tokens += tokens
+
+    def _compact(self, session: _Session) -> None:
+        # 超出预算时把最旧的轮次压成摘要，至少保留最新的一轮
+        while session.tokens > self.max_tokens and len(session.turns) > 1:
+            turn = session.turns.popleft()
+            label = "用户" if turn.role == "user" else "助手"
+            text = turn.content.replace("\n", " ")
+            line = f"{label}：{text[:self.summary_chars]}{'…' if len(text) > self.summary_chars else ''}"
+            session.summary.append(line)
+            self._add(session, estimate_tokens(line) - turn.tokens)
+            while sum(estimate_tokens(s) for s in session.summary) > self.summary_tokens and session.summary:
+                self._add(session, -estimate_tokens(session.summary.popleft()))
+
+    def _purge(self, now: float) -> List[str]:
+        # 淘汰过期会话和超出总预算时最久未用的会话，返回被淘汰的 key
+        evicted = []
+        while self.sessions:
+            key, session = next(iter(self.sessions.items()))
+            if now - session.used <= self.ttl and self.total_tokens <= self.max_total_tokens:
+                break
+            self._drop(key)
+            evicted.append(key)
+        return evicted
+
+    def _drop(self, key: str) -> None:
+        session = self.sessions.pop(key, None)
+        if session is not None:
+            self.total_tokens -= session.tokens
+
+    def _notify(self, keys: List[str]) -> None:
+        if self.on_evict is not None:
+            for key in keys:
+                self.on_evict(key)
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def stats(self) -> Dict[str, int]:
+        return {"sessions": len(self.sessions), "tokens": self.total_tokens}
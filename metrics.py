@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# 延迟直方图的桶上界（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# 当前处理中的命令累计的上游耗时，线程和协程各自独立
+_upstream: "ContextVar[Optional[List[float]]]" = ContextVar("upstream", default=None)
+
+
+class Histogram(object):
+    """固定桶的延迟直方图，格式与 Prometheus histogram 一致"""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最后一个是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """按桶估算分位数，返回所在桶的上界"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Metrics(object):
+    """进程内指标：延迟直方图、计数器和按需读取的队列深度"""
+
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, int]] = {}
+        self.gauges: Dict[str, Dict[Labels, Callable[[], float]]] = {}
+        self.help: Dict[str, str] = {}
+        self.lock = Lock()
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> Labels:
+        return tuple(sorted(labels.items()))
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = self._labels(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name: str, value: int = 1, **labels: str) -> None:
+        key = self._labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def gauge(self, name: str, read: Callable[[], float], **labels: str) -> None:
+        """登记一个读数方法，导出时调用"""
+        with self.lock:
+            self.gauges.setdefault(name, {})[self._labels(labels)] = read
+
+    def describe(self, name: str, text: str) -> None:
+        self.help[name] = text
+
+    @contextmanager
+    def track_upstream(self) -> Iterator[List[float]]:
+        """在处理一条命令期间累计上游请求耗时，返回的列表在退出时含一个总耗时"""
+        acc = [0.0]
+        token = _upstream.set(acc)
+        try:
+            yield acc
+        finally:
+            _upstream.reset(token)
+
+    def upstream(self, host: str, seconds: float, status: str) -> None:
+        """由 HttpClient 在每次请求后调用"""
+        acc = _upstream.get()
+        if acc is not None:
+            acc[0] += seconds
+        self.observe("robot_upstream_request_seconds", seconds, host=host)
+        self.inc("robot_upstream_requests_total", host=host, status=status)
+
+    @staticmethod
+    def add_upstream_time(seconds: float) -> None:
+        """只累计到当前命令，不计请求数，用于流式下载读取响应体的时间"""
+        acc = _upstream.get()
+        if acc is not None:
+            acc[0] += seconds
+
+    # 导出
+    @staticmethod
+    def _fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        lines = []
+        with self.lock:
+            histograms = {n: dict(s) for n, s in self.histograms.items()}
+            counters = {n: dict(s) for n, s in self.counters.items()}
+            gauges = {n: dict(s) for n, s in self.gauges.items()}
+        for name, series in sorted(histograms.items()):
+            lines += [f"# HELP {name} {self.help.get(name, name)}", f"# TYPE {name} histogram"]
+            for labels, hist in sorted(series.items()):
+                cumulative = 0
+                for bound, n in zip(BUCKETS + (float("inf"),), hist.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{self._fmt(labels, (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{self._fmt(labels)} {hist.sum}")
+                lines.append(f"{name}_count{self._fmt(labels)} {hist.count}")
+        for name, series in sorted(counters.items()):
+            lines += [f"# HELP {name} {self.help.get(name, name)}", f"# TYPE {name} counter"]
+            lines += [f"{name}{self._fmt(labels)} {value}" for labels, value in sorted(series.items())]
+        for name, series in sorted(gauges.items()):
+            lines += [f"# HELP {name} {self.help.get(name, name)}", f"# TYPE {name} gauge"]
+            for labels, read in sorted(series.items(), key=lambda item: item[0]):
+                try:
+                    lines.append(f"{name}{self._fmt(labels)} {float(read())}")
+                except Exception:
+                    continue
+        return "\n".join(lines) + "\n"
+
+    def summary(self, top: int = 10) -> str:
+        """聊天里查看的简要统计：最慢的命令、错误数和队列深度"""
+        with self.lock:
+            handler = dict(self.histograms.get("robot_handler_seconds", {}))
+            upstream = dict(self.histograms.get("robot_command_upstream_seconds", {}))
+            outcomes = dict(self.counters.get("robot_messages_total", {}))
+            gauges = dict(self.gauges.get("robot_queue_depth", {}))
+            coalesced = dict(self.counters.get("robot_upstream_coalesced_total", {}))
+        errors: Dict[str, int] = {}
+        for labels, n in outcomes.items():
+            d = dict(labels)
+            if d.get("outcome") in ("error", "send_error"):
+                errors[d["command"]] = errors.get(d["command"], 0) + n
+        rows = sorted(handler.items(), key=lambda item: item[1].quantile(0.99), reverse=True)[:top]
+        lines = ["命令 次数 p50/p99(ms) 上游p99(ms) 错误"]
+        for labels, hist in rows:
+            command = dict(labels)["command"]
+            up = upstream.get(labels)
+            up99 = f"{up.quantile(0.99) * 1000:.0f}" if up else "-"
+            lines.append(f"{command} {hist.count} {hist.quantile(0.5) * 1000:.0f}/{hist.quantile(0.99) * 1000:.0f}"
+                         f" {up99} {errors.get(command, 0)}")
+        for labels, read in sorted(gauges.items()):
+            try:
+                lines.append(f"队列 {dict(labels)['queue']}: {int(read())}")
+            except Exception:
+                continue
+        if coalesced:
+            lines.append(f"合并的上游请求: {sum(coalesced.values())}")
+        return "\n".join(lines)
+
+
+METRICS = Metrics()
+METRICS.describe("robot_handler_seconds", "Time spent in a command handler, including upstream calls")
+METRICS.describe("robot_command_upstream_seconds", "Upstream HTTP time spent while handling one command")
+METRICS.describe("robot_send_seconds", "Time from queueing a reply to the WeChat send completing")
+METRICS.describe("robot_messages_total", "Handled messages by command and outcome")
+METRICS.describe("robot_upstream_request_seconds", "Latency of single upstream HTTP requests")
+METRICS.describe("robot_upstream_requests_total", "Upstream HTTP requests by host and status")
+METRICS.describe("robot_queue_depth", "Messages waiting in internal queues")
+METRICS.describe("robot_upstream_coalesced_total", "Upstream GET calls served by an identical in-flight request")
+
+
+@contextmanager
+def timed(name: str, **labels: str) -> Iterator[None]:
+    """记录一段代码的耗时到直方图"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.observe(name, time.perf_counter() - start, **labels)
+
+
+class MetricsServer(object):
+    """在本地端口上以 Prometheus 文本格式导出 METRICS"""
+
+    def __init__(self, metrics: Metrics = METRICS, host: str = "127.0.0.1", port: int = 9108) -> None:
+        self.LOG = logging.getLogger("MetricsServer")
+        self.metrics = metrics
+        metrics_ref = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics_ref.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> Optional["MetricsServer"]:
+        """配置了 METRICS.port 时才创建"""
+        if not conf or not conf.get("port"):
+            return None
+        return cls(METRICS, conf.get("host", "127.0.0.1"), conf["port"])
+
+    def start(self) -> "MetricsServer":
+        Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True).start()
+        host, port = self.server.server_address[:2]
+        self.LOG.info(f"Serving metrics on http://{host}:{port}/metrics")
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
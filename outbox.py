@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Condition, Thread
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+
+class _Lane(object):
+    """单个接收者的发送队列和令牌桶"""
+    __slots__ = ("queue", "tokens", "updated", "scheduled", "busy")
+
+    def __init__(self, burst: float, now: float) -> None:
+        self.queue: Deque[Tuple[Any, Future]] = deque()
+        self.tokens = burst
+        self.updated = now
+        self.scheduled = False  # 已在待发送堆中
+        self.busy = False       # 正在发送
+
+
+class Outbox(object):
+    """出站发送队列
+    每个接收者一条队列，按令牌桶限速；可选地把短时间内发给同一会话的连续文本合并成一条。
+    处理方法把消息放进队列即返回，实际发送由独立的发送线程完成，同一接收者的消息按顺序发出。
+    """
+
+    def __init__(self, deliver: Callable[[Any], Any], rate: float = 2.0, burst: float = 5,
+                 coalesce_window: float = 0.0, workers: int = 4,
+                 merge: Optional[Callable[[Any, Any], Any]] = None) -> None:
+        """
+        :param deliver: 实际发送一条消息的方法
+        :param rate: 每个接收者每秒最多发送的消息数
+        :param burst: 每个接收者允许的突发条数
+        :param coalesce_window: 合并窗口（秒），0 表示不合并
+        :param workers: 发送线程数
+        :param merge: merge(a, b) 返回合并后的消息，不能合并时返回 None
+        """
+        self.LOG = logging.getLogger("Outbox")
+        self.deliver = deliver
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1)
+        self.coalesce_window = coalesce_window
+        self.merge = merge
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Outbox")
+        self.lanes: Dict[str, _Lane] = {}
+        self.heap: List[Tuple[float, int, str]] = []
+        self.seq = itertools.count()
+        self.cond = Condition()
+        self.coalesced = 0
+        self.purged = time.monotonic()
+        Thread(target=self._schedule_loop, name="OutboxScheduler", daemon=True).start()
+
+    @classmethod
+    def from_config(cls, deliver: Callable[[Any], Any], conf: Optional[dict],
+                    merge: Optional[Callable[[Any, Any], Any]] = None) -> "Outbox":
+        conf = conf or {}
+        return cls(deliver, conf.get("rate", 2.0), conf.get("burst", 5), conf.get("coalesce_window", 0.0),
+                   conf.get("workers", 4), merge)
+
+    def put(self, receiver: str, payload: Any) -> Future:
+        """放入发送队列，立即返回；发送完成后 Future 得到 deliver 的返回值
+        还在队列中时可以用 Future.cancel() 撤回，已开始发送的撤回不了（cancel 返回 False）
+        """
+        future: Future = Future()
+        with self.cond:
+            now = time.monotonic()
+            lane = self.lanes.get(receiver)
+            if lane is None:
+                lane = self.lanes[receiver] = _Lane(self.burst, now)
+            lane.queue.append((payload, future))
+            if not lane.scheduled and not lane.busy:
+                delay = self.coalesce_window if self.merge and self.coalesce_window > 0 else 0
+                self._push(receiver, lane, now, delay)
+        return future
+
+    def depth(self) -> int:
+        """待发送的消息数"""
+        with self.cond:
+            return sum(len(lane.queue) for lane in self.lanes.values())
+
+    def _refill(self, lane: _Lane, now: float) -> None:
+        lane.tokens = min(self.burst, lane.tokens + (now - lane.updated) * self.rate)
+        lane.updated = now
+
+    def _push(self, receiver: str, lane: _Lane, now: float, delay: float = 0) -> None:
+        # 在令牌可用且合并窗口结束时调度，调用方持有 self.cond
+        self._refill(lane, now)
+        wait = 0 if lane.tokens >= 1 else (1 - lane.tokens) / self.rate
+        heapq.heappush(self.heap, (now + max(wait, delay), next(self.seq), receiver))
+        lane.scheduled = True
+        self.cond.notify()
+
+    def _schedule_loop(self) -> None:
+        while True:
+            with self.cond:
+                while not self.heap or self.heap[0][0] > time.monotonic():
+                    self.cond.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+                _, _, receiver = heapq.heappop(self.heap)
+                lane = self.lanes[receiver]
+                lane.scheduled = False
+                batch = self._take(lane)
+                if batch is None:  # 队列里的消息都已撤回
+                    continue
+                self._refill(lane, time.monotonic())
+                lane.tokens -= 1
+                lane.busy = True
+            self.executor.submit(self._send, receiver, batch)
+
+    @staticmethod
+    def _claim(future: Future) -> bool:
+        # 标记为发送中，之后不能再撤回；已撤回的返回 False。合并失败留在队首的消息已经标记过
+        return future.running() or future.set_running_or_notify_cancel()
+
+    def _take(self, lane: _Lane) -> Optional[Tuple[Any, List[Future]]]:
+        # 调用方持有 self.cond
+        while lane.queue and not self._claim(lane.queue[0][1]):
+            lane.queue.popleft()
+        if not lane.queue:
+            return None
+        payload, future = lane.queue.popleft()
+        futures = [future]
+        while self.merge and self.coalesce_window > 0 and lane.queue:
+            if not self._claim(lane.queue[0][1]):
+                lane.queue.popleft()
+                continue
+            merged = self.merge(payload, lane.queue[0][0])
+            if merged is None:
+                break
+            payload = merged
+            futures.append(lane.queue.popleft()[1])
+            self.coalesced += 1
+        return payload, futures
+
+    def _send(self, receiver: str, batch: Tuple[Any, List[Future]]) -> None:
+        payload, futures = batch
+        try:
+            result = self.deliver(payload)
+            for future in futures:
+                future.set_result(result)
+        except Exception as e:
+            self.LOG.error(f"Sending to {receiver} failed: {e}")
+            for future in futures:
+                future.set_exception(e)
+        finally:
+            with self.cond:
+                lane = self.lanes[receiver]
+                lane.busy = False
+                now = time.monotonic()
+                if lane.queue:
+                    self._push(receiver, lane, now)
+                if now - self.purged > 1:
+                    self._purge(now)
+
+    def _purge(self, now: float) -> None:
+        # 空闲且令牌已补满的接收者与新建的没有区别，删除以免占内存，调用方持有 self.cond
+        self.purged = now
+        for receiver, lane in list(self.lanes.items()):
+            if not (lane.queue or lane.busy or lane.scheduled):
+                if lane.tokens + (now - lane.updated) * self.rate >= self.burst:
+                    del self.lanes[receiver]
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextvars import copy_context
+from threading import Lock
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from metrics import METRICS
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """上游主机的熔断器处于打开状态，请求未发出
+    不继承 requests.RequestException，处理方法里捕获请求异常的代码不会吞掉它，
+    由 add_receiver_info 统一回复降级提示。
+    """
+
+    def __init__(self, host: str) -> None:
+        super().__init__(f"Circuit for {host} is open")
+        self.host = host
+
+
+class HostPolicy(object):
+    """单个上游主机的超时、熔断和对冲设置"""
+    __slots__ = ("connect_timeout", "read_timeout", "deadline", "failure_threshold", "reset_timeout",
+                 "hedge", "hedge_quantile", "hedge_min_samples")
+
+    def __init__(self, connect_timeout: float = 3.05, read_timeout: float = 10, deadline: float = 15,
+                 failure_threshold: int = 5, reset_timeout: float = 30, hedge: bool = False,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 20) -> None:
+        """
+        :param connect_timeout: 连接超时（秒）
+        :param read_timeout: 读取超时（秒）
+        :param deadline: 每次调用的总期限（秒，含对冲），超过后放弃等待；流式下载只限制到收到响应头为止
+        :param failure_threshold: 连续失败多少次后打开熔断器
+        :param reset_timeout: 熔断器打开多久后放行一个探测请求（秒）
+        :param hedge: 是否对 GET 请求发送对冲请求
+        :param hedge_quantile: 第一个请求超过该主机延迟的这个分位数仍未返回时，发出第二个请求
+        :param hedge_min_samples: 延迟样本不足时不对冲
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return self.connect_timeout, self.read_timeout
+
+    def updated(self, conf: Optional[dict]) -> "HostPolicy":
+        """返回用 conf 覆盖后的新设置"""
+        values = {k: getattr(self, k) for k in self.__slots__}
+        values.update({k: v for k, v in (conf or {}).items() if k in self.__slots__})
+        return HostPolicy(**values)
+
+
+class CircuitBreaker(object):
+    """连续失败达到阈值后打开，打开期间直接拒绝；reset_timeout 后进入半开，只放行一个探测请求，
+    探测成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, host: str, policy: HostPolicy) -> None:
+        self.LOG = logging.getLogger("CircuitBreaker")
+        self.host = host
+        self.policy = policy
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.latencies: Deque[float] = deque(maxlen=200)  # 最近成功请求的耗时
+        self.lock = Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.policy.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.probing:  # 半开状态下同时只放行一个探测请求
+                return False
+            self.probing = True
+            return True
+
+    def success(self, elapsed: float) -> None:
+        with self.lock:
+            self.latencies.append(elapsed)
+            if self.state != CLOSED:
+                self.LOG.info(f"Circuit for {self.host} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= self.policy.failure_threshold:
+                if self.state != OPEN:
+                    self.LOG.warning(f"Circuit for {self.host} opened after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def hedge_delay(self) -> Optional[float]:
+        """对冲等待时间：最近延迟的 hedge_quantile 分位数，样本不足时返回 None"""
+        with self.lock:
+            if len(self.latencies) < self.policy.hedge_min_samples:
+                return None
+            values = sorted(self.latencies)
+        return values[min(len(values) - 1, int(self.policy.hedge_quantile * len(values)))]
+
+
+class Resilience(object):
+    """按上游主机划分的超时、熔断和对冲"""
+
+    def __init__(self, default: Optional[HostPolicy] = None, hosts: Optional[Dict[str, HostPolicy]] = None,
+                 fallback: str = "服务暂时不可用，请稍后再试", workers: int = 64) -> None:
+        """
+        :param default: 未单独配置的主机使用的设置
+        :param hosts: {主机名: 设置}
+        :param fallback: 熔断期间回复给用户的提示
+        :param workers: 实际发出请求的线程数；调用方按 deadline 等待，超时后不再占用处理线程
+        """
+        self.default = default or HostPolicy()
+        self.hosts = hosts or {}
+        self.fallback = fallback
+        self.workers = workers
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.lock = Lock()
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict], connect_timeout: float = 3.05, read_timeout: float = 10) -> "Resilience":
+        """
+        配置示例（HTTP 节内）：
+        policy: {failure_threshold: 5, reset_timeout: 30}
+        hosts: {api.pearktrue.cn: {read_timeout: 8, hedge: true}}
+        fallback: 服务暂时不可用，请稍后再试
+        """
+        conf = conf or {}
+        default = HostPolicy(connect_timeout, read_timeout).updated(conf.get("policy"))
+        hosts = {host: default.updated(c) for host, c in (conf.get("hosts") or {}).items()}
+        workers = conf.get("workers", conf.get("hedge_workers", 64))  # hedge_workers 为旧配置名
+        return cls(default, hosts, conf.get("fallback", "服务暂时不可用，请稍后再试"), workers)
+
+    def policy(self, host: str) -> HostPolicy:
+        return self.hosts.get(host, self.default)
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            with self.lock:
+                breaker = self.breakers.get(host)
+                if breaker is None:
+                    breaker = self.breakers[host] = CircuitBreaker(host, self.policy(host))
+                    METRICS.gauge("robot_circuit_open", lambda b=breaker: b.state != CLOSED, host=host)
+        return breaker
+
+    def call(self, host: str, send: Callable[[], Any], is_failure: Callable[[Any], bool],
+             hedge: bool = False) -> Any:
+        """经过熔断器发出请求
+        :param send: 发出一次请求的无参调用
+        :param is_failure: 判断返回值是否算作上游故障（如 5xx）
+        :param hedge: 是否允许对冲，只应用于幂等请求
+        """
+        breaker = self.breaker(host)
+        if not breaker.allow():
+            METRICS.inc("robot_upstream_requests_total", host=host, status="circuit_open")
+            raise CircuitOpenError(host)
+        start = time.monotonic()
+        try:
+            delay = breaker.hedge_delay() if hedge and breaker.policy.hedge and breaker.state == CLOSED else None
+            if delay is not None:
+                result = self._hedged(host, send, delay, breaker.policy.deadline)
+            else:
+                result = self._bounded(host, send, breaker.policy.deadline)
+        except Exception:
+            breaker.failure()
+            raise
+        if is_failure(result):
+            breaker.failure()
+        else:
+            breaker.success(time.monotonic() - start)
+        return result
+
+    def _submit(self, send: Callable[[], Any]) -> Future:
+        if self.executor is None:
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="Upstream")
+        return self.executor.submit(copy_context().run, send)
+
+    def _bounded(self, host: str, send: Callable[[], Any], deadline: float) -> Any:
+        # read_timeout 只限制两次读取之间的间隔，持续慢速返回的上游靠总期限截断
+        future = self._submit(send)
+        try:
+            return future.result(timeout=deadline)
+        except FutureTimeoutError:
+            if future.done():  # send 自己抛出的超时
+                raise
+            self._discard([future])
+            raise TimeoutError(f"{host} exceeded deadline of {deadline}s")
+
+    def _hedged(self, host: str, send: Callable[[], Any], delay: float, deadline: float) -> Any:
+        # 第一个请求超过 delay 未返回时再发一个，取先成功的那个
+        start = time.monotonic()
+        futures = [self._submit(send)]
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            METRICS.inc("robot_upstream_hedged_total", host=host)
+            futures.append(self._submit(send))
+        error: Optional[BaseException] = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline - (time.monotonic() - start)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._discard(pending)
+                    return future.result()
+                error = future.exception()
+        self._discard(pending)
+        if error is not None:
+            raise error
+        raise TimeoutError(f"{host} exceeded deadline of {deadline}s")
+
+    @staticmethod
+    def _discard(futures) -> None:
+        # 落选的请求已在运行，只能丢弃结果并关闭响应，归还连接
+        def close(future: Future) -> None:
+            if future.exception() is None and hasattr(future.result(), "close"):
+                future.result().close()
+
+        for future in futures:
+            future.add_done_callback(close)
@@ -1,35 +1,59 @@
 # -*- coding: utf-8 -*-
 
+import time
+_IMPORT_START = time.perf_counter()
+
 import os
+import inspect
 import logging
 import re
-import time
-import urllib
-import json
 import requests
-import subprocess
-from bs4 import BeautifulSoup
-import xml.etree.ElementTree as ET
+from urllib.parse import urljoin
 from queue import Empty
+from concurrent.futures import Future
+from functools import partial
+from typing import Optional
 from threading import Thread
-from job_mgmt import Job
 from datetime import datetime
-from base.func_chengyu import cy
-from base.func_news import News
-from base.func_weather import Weather
-from base.weather import get_weather
 
 from constants import ChatType
 from wcferry import Wcf, WxMsg
 from configuration import Config
-from base.func_chatglm import ChatGLM
-from base.func_chatgpt import ChatGPT
-from base.func_chatnio import Chatnio
-from base.func_tigerbot import TigerBot
-from base.func_xinghuo_web import XinghuoWeb
-
-
-class Robot(Job):
+from startup import STARTUP, lazy_import
+from dispatcher import MsgDispatcher
+from upstream import HttpClient
+from router import CommandRouter
+from cache import ReplyCache, TTLCache, cached_reply
+from fanout import FanOut
+from session import SessionStore
+from media_cache import MediaCache
+from aio_engine import AsyncEngine, AsyncHttpClient
+from outbox import Outbox
+from contacts import AliasCache, ContactDirectory
+from broadcast import Broadcaster, shift_time
+from metrics import METRICS, MetricsServer
+from resilience import CircuitOpenError
+from llm_pool import LLMPool, NoBackendError, Provider
+from memory import ConversationMemory
+from imaging import ImagePreprocessor
+from voice import Transcoder, VoicePipeline, tts_key
+from scheduler import DeadlineJob, Scheduler
+from ingress import IngressFilter
+
+STARTUP.record("import robot", time.perf_counter() - _IMPORT_START)
+
+# 聊天模型：ChatType 值 -> (模块, 类名, 配置项)，用到哪个才导入哪个
+# 未指定类型时按此顺序选第一个配置可用的
+CHAT_BACKENDS = {
+    ChatType.TIGER_BOT.value: ("base.func_tigerbot", "TigerBot", "TIGERBOT"),
+    ChatType.CHATGPT.value: ("base.func_chatgpt", "ChatGPT", "CHATGPT"),
+    ChatType.XINGHUO_WEB.value: ("base.func_xinghuo_web", "XinghuoWeb", "XINGHUO_WEB"),
+    ChatType.CHATGLM.value: ("base.func_chatglm", "ChatGLM", "CHATGLM"),
+    ChatType.CHATNIO.value: ("base.func_chatnio", "Chatnio", "CHATNIO"),
+}
+
+
+class Robot(DeadlineJob):
     """个性化自己的机器人
     """
 
@@ -37,13 +61,45 @@ class Robot(Job):
         self.wcf = wcf
         self.config = config
         self.LOG = logging.getLogger("Robot")
-        self.wxid = self.wcf.get_self_wxid()
-        self.allContacts = self.getAllContacts()
-        self.song_list = {}
-        self.file_path = ""
-        self.voice_path = ""
-        self.douyin_hotlist = {}
-        self.douyin_downloadlink = {}
+        with STARTUP.phase("init clients"):
+            self.http = HttpClient.from_config(getattr(self.config, "HTTP", None))
+            self.reply_cache = ReplyCache.from_config(getattr(self.config, "CACHE", None))
+            self.fanout = FanOut.from_config(getattr(self.config, "FANOUT", None))
+        with STARTUP.phase("init contacts"):
+            self.wxid = self.wcf.get_self_wxid()
+            self.ingress = IngressFilter.from_config(self.config)
+            self.aliases = AliasCache.from_config(self.wcf, getattr(self.config, "ALIAS", None))
+            self.allContacts = ContactDirectory.from_config(self.wcf, getattr(self.config, "CONTACTS", None))
+        with STARTUP.phase("init sessions and media"):
+            self.sessions = SessionStore.from_config(getattr(self.config, "SESSION", None))
+            self.media = MediaCache.from_config(getattr(self.config, "MEDIA", None))
+            # 配置示例 IMAGE: {max_side: 1280, max_bytes: 524288, cache_size: 2000, cache_ttl: 604800}
+            image_conf = getattr(self.config, "IMAGE", None) or {}
+            self.imaging = ImagePreprocessor.from_config(image_conf)
+            self.recognitions = TTLCache(image_conf.get("cache_size", 2000), image_conf.get("cache_ttl", 7 * 86400))
+        with STARTUP.phase("init engines"):
+            self.aio = AsyncEngine.from_config(self.processMsg, getattr(self.config, "ASYNC", None))
+            self.ahttp = AsyncHttpClient(self.http)
+            self.outbox = Outbox.from_config(self.deliverMsg, getattr(self.config, "OUTBOX", None), self.mergeMsgDict)
+            # 配置示例 SCHEDULER: {workers: 4, jitter: 0}
+            super().__init__(Scheduler.from_config(getattr(self.config, "SCHEDULER", None)))
+            self.broadcaster = Broadcaster.from_config(self.sendTextMsg, getattr(self.config, "BROADCAST", None))
+            METRICS.gauge("robot_queue_depth", self.outbox.depth, queue="outbox")
+            # 配置示例 METRICS: {port: 9108}，未配置端口时不导出，但仍可用 /统计 查看
+            self.metrics_server = MetricsServer.from_config(getattr(self.config, "METRICS", None))
+            if self.metrics_server:
+                self.metrics_server.start()
+        with STARTUP.phase("init voice"):
+            # 配置示例 VOICE: {workers: 2, ffmpeg: ffmpeg, max_procs: 2, format: mp3, bitrate: 32k, dir: D:/voice}
+            voice_conf = getattr(self.config, "VOICE", None) or {}
+            self.voice_dir = voice_conf.get("dir", r"C:\Users\Raimbault\Documents\WeChat Files\wxid_55zyiv0rij9a12\FileStorage\File\2023-12")
+            self.voice_format = voice_conf.get("format", "mp3")
+            self.voice_bitrate = voice_conf.get("bitrate", "32k")
+            self.transcoder = Transcoder.from_config(self.media, voice_conf)
+            self.voice = VoicePipeline(self.fetchVoice, self.stt, self.answerVoice, self.tts, self.transcodeVoice,
+                                       self.sendVoice, voice_conf.get("workers", 2), self.sendDegraded)
+        # 图片只在【识图】用到时才下载到这里
+        self.image_dir = r"C:/Users/Raimbault/Documents/WeChat Files/wxid_55zyiv0rij9a12/FileStorage/MsgAttach/f2332fbf6604994906debc30e386a18a/Image/2023-12/"
         self.commands = {
             "画": self.handle_画, "翻译": self.handle_翻译,  "拼音": self.handle_拼音,
             "搜歌": self.handle_搜歌, "听歌": self.handle_听歌, "签名": self.handle_签名,
@@ -59,35 +115,44 @@ class Robot(Job):
             "查号码": self.handle_查号码, "查天气": self.handle_查天气, "查功能": self.handle_查功能,
             "讲述人": self.handle_讲述人,
         }
+        self.router = CommandRouter(self.commands)
 
-        if ChatType.is_in_chat_types(chat_type):
-            if chat_type == ChatType.TIGER_BOT.value and TigerBot.value_check(self.config.TIGERBOT):
-                self.chat = TigerBot(self.config.TIGERBOT)
-            elif chat_type == ChatType.CHATGPT.value and ChatGPT.value_check(self.config.CHATGPT):
-                self.chat = ChatGPT(self.config.CHATGPT)
-            elif chat_type == ChatType.XINGHUO_WEB.value and XinghuoWeb.value_check(self.config.XINGHUO_WEB):
-                self.chat = XinghuoWeb(self.config.XINGHUO_WEB)
-            elif chat_type == ChatType.CHATGLM.value and ChatGLM.value_check(self.config.CHATGLM):
-                self.chat = ChatGLM(self.config.CHATGLM)
-            elif chat_type == ChatType.CHATNIO.value and Chatnio.value_check(self.config.CHATNIO):
-                self.chat = Chatnio(self.config.CHATNIO)    
-            else:
-                self.LOG.warning("未配置模型")
-                self.chat = None
-        else:
-            if TigerBot.value_check(self.config.TIGERBOT):
-                self.chat = TigerBot(self.config.TIGERBOT)
-            elif ChatGPT.value_check(self.config.CHATGPT):
-                self.chat = ChatGPT(self.config.CHATGPT)
-            elif XinghuoWeb.value_check(self.config.XINGHUO_WEB):
-                self.chat = XinghuoWeb(self.config.XINGHUO_WEB)
-            elif ChatGLM.value_check(self.config.CHATGLM):
-                self.chat = ChatGLM(self.config.CHATGLM)
-            elif Chatnio.value_check(self.config.CHATNIO):
-                self.chat = Chatnio(self.config.CHATNIO)    
-            else:
-                self.LOG.warning("未配置模型")
-                self.chat = None
+        with STARTUP.phase("init chat"):
+            self.chat = self.loadChat(chat_type)
+        self.LOG.info(STARTUP.report())
+
+    def loadChat(self, chat_type: int):
+        """创建所有已配置的聊天模型，组成按延迟和健康状况调度的模型池
+        只导入有配置的模型；指定的模型优先，其余按 CHAT_BACKENDS 顺序作为备选。
+        配置示例 LLM_POOL: {timeout: 30, max_attempts: 3, max_concurrency: {CHATGPT: 8}}
+        :param chat_type: 指定的模型类型，不在 ChatType 中时不区分优先级
+        """
+        pool_conf = getattr(self.config, "LLM_POOL", None) or {}
+        limits = pool_conf.get("max_concurrency", {})
+        providers = []
+        for t, (module, name, conf_key) in CHAT_BACKENDS.items():
+            conf = getattr(self.config, conf_key, None)
+            if not conf:  # 没有配置的模型不必导入
+                continue
+            try:
+                backend = getattr(lazy_import(module), name)
+                if not backend.value_check(conf):
+                    continue
+                with STARTUP.phase(f"init {name}"):
+                    instance = backend(conf)
+            except Exception as e:
+                self.LOG.error(f"初始化模型 {name} 失败：{e}")
+                continue
+            priority = 0 if t == chat_type else 1
+            providers.append(Provider(conf_key, instance, limits.get(conf_key, 4), pool_conf.get("window", 50), priority))
+        if not providers:
+            self.LOG.warning("未配置模型")
+            return None
+        providers.sort(key=lambda p: p.priority)
+        self.LOG.info(f"可用模型：{', '.join(p.name for p in providers)}")
+        # 配置示例 MEMORY: {max_tokens: 1500, ttl: 3600, max_total_tokens: 2000000}
+        memory = ConversationMemory.from_config(getattr(self.config, "MEMORY", None))
+        return LLMPool.from_config(providers, pool_conf, memory)
 
     def value_check(args: dict) -> bool:
         if args:
@@ -95,29 +160,82 @@ class Robot(Job):
         return False
 
     def add_receiver_info(function):
-        #给要发送的消息添加地址和类型
-        def wrapper(self, msg):
-            try:
-                rsp = function(self, msg)
-                if rsp:
-                    receiver_id = msg.roomid if msg.roomid else msg.sender
-                    group_id = msg.sender if msg.roomid else None
-                    msg_type = self.classify_msg_type(rsp) 
-                    msg_dict = {
-                        "receiver_id": receiver_id,
-                        "group_id": group_id,
-                        "msg_type": msg_type,
-                        "content": rsp,
-                    }
-                    return self.sendMsg(msg_dict)
-                else:
-                    return None
-            except Exception as e:
-                self.LOG.error(e)
-                return None
+        #给要发送的消息添加地址和类型，并记录命令的耗时和结果
+        command = function.__name__.replace("handle_", "", 1)
+        if inspect.iscoroutinefunction(function):
+            # 协程处理方法：等待回复时不占线程，回复放入发送队列即返回
+            async def async_wrapper(self, msg, *args):
+                start = time.perf_counter()
+                with METRICS.track_upstream() as upstream:
+                    try:
+                        rsp = await function(self, msg, *args)
+                    except Exception as e:
+                        self.LOG.error(e)
+                        rsp = e
+                return self.sendReply(command, msg, rsp, time.perf_counter() - start, upstream[0])
+
+            return async_wrapper
+
+        def wrapper(self, msg, *args):
+            start = time.perf_counter()
+            with METRICS.track_upstream() as upstream:
+                try:
+                    rsp = function(self, msg, *args)
+                except Exception as e:
+                    self.LOG.error(e)
+                    rsp = e
+            return self.sendReply(command, msg, rsp, time.perf_counter() - start, upstream[0])
 
         return wrapper
 
+    def sendReply(self, command: str, msg: WxMsg, rsp, elapsed: float, upstream: float) -> Optional[Future]:
+        """ 发送处理方法的回复，并记录处理耗时、上游耗时、发送耗时和结果
+        :param command: 命令名
+        :param rsp: 处理方法的返回值，出错时为异常；上游熔断时改为回复降级提示
+        :param elapsed: 处理方法的耗时（秒）
+        :param upstream: 其中上游请求的耗时（秒）
+        """
+        METRICS.observe("robot_handler_seconds", elapsed, command=command)
+        METRICS.observe("robot_command_upstream_seconds", upstream, command=command)
+        done = "ok"
+        if isinstance(rsp, CircuitOpenError):
+            # 上游熔断中，立即回复降级提示，不让用户干等
+            done = "degraded"
+            rsp = self.http.resilience.fallback
+        elif isinstance(rsp, Exception):
+            METRICS.inc("robot_messages_total", command=command, outcome="error")
+            return None
+        if not rsp:
+            METRICS.inc("robot_messages_total", command=command, outcome="empty")
+            return None
+        try:
+            queued = time.perf_counter()
+            future = self.sendMsg(self.buildMsgDict(msg, rsp))
+        except Exception as e:
+            self.LOG.error(e)
+            METRICS.inc("robot_messages_total", command=command, outcome="send_error")
+            return None
+
+        def sent(f: Future) -> None:
+            METRICS.observe("robot_send_seconds", time.perf_counter() - queued, command=command)
+            outcome = "send_error" if f.exception() is not None else done
+            METRICS.inc("robot_messages_total", command=command, outcome=outcome)
+
+        future.add_done_callback(sent)
+        return future
+
+    def buildMsgDict(self, msg: WxMsg, rsp: str) -> dict:
+        #根据收到的消息确定回复的地址和类型
+        receiver_id = msg.roomid if msg.roomid else msg.sender
+        group_id = msg.sender if msg.roomid else None
+        msg_type = self.classify_msg_type(rsp) 
+        return {
+            "receiver_id": receiver_id,
+            "group_id": group_id,
+            "msg_type": msg_type,
+            "content": rsp,
+        }
+
     def classify_msg_type(self, content) -> str:
         #判断发送消息的类型
         if os.path.isfile(content) or content.startswith("http"):
@@ -130,8 +248,23 @@ class Robot(Job):
         else:
             return "text"
 
-    def sendMsg(self, msg_dict: dict) -> None:
-        """ 发送消息
+    def sendMsg(self, msg_dict: dict) -> Future:
+        """ 发送消息，放入接收者的发送队列后立即返回
+        :param msg_dict: 包含消息相关信息的字典
+        :return: 发送完成时得到结果的 Future
+        """
+        return self.outbox.put(msg_dict["receiver_id"], msg_dict)
+
+    def mergeMsgDict(self, first: dict, second: dict) -> dict:
+        """合并发给同一会话、@同一批人的连续文本，不能合并时返回 None"""
+        if first["msg_type"] != "text" or second["msg_type"] != "text":
+            return None
+        if first["group_id"] != second["group_id"] or first.get("inline_ats") != second.get("inline_ats"):
+            return None
+        return dict(first, content=f"{first['content']}\n\n{second['content']}")
+
+    def deliverMsg(self, msg_dict: dict) -> None:
+        """ 实际发送消息，由发送队列的线程调用
         :param msg_dict: 包含消息相关信息的字典
         :param at_list: 要@的wxid, @所有人的wxid为：notify@all
         """
@@ -140,48 +273,69 @@ class Robot(Job):
         receiver = msg_dict["receiver_id"]
         at_list = msg_dict["group_id"]
 
-        # msg 中需要有 @ 名单中一样数量的 @
-        ats = ""
-        if at_list:
-            if at_list == "notify@all":  # @所有人
-                ats = " @所有人"
+        try:
+            # msg 中需要有 @ 名单中一样数量的 @
+            ats = ""
+            if at_list:
+                if at_list == "notify@all":  # @所有人
+                    ats = " @所有人"
+                else:
+                    wxids = at_list.split(",")
+                    for wxid in wxids:
+                        # 根据 wxid 查找群昵称，走缓存，不再每次调用 RPC
+                        ats += f" @{self.aliases.get(receiver, wxid)}"
+
+            # 对于文本消息，包含 ats（如果有的话）
+            if msg_type == "text" and msg_dict.get("inline_ats"):
+                # {msg}{ats} 表示要发送的消息内容后面紧跟@，例如 北京天气情况为：xxx @张三
+                message = f"{ats}  {msg}" if ats else f"{msg}"
+                self.LOG.info(f"To {receiver}: {message}")
+                self.wcf.send_text(message, receiver, at_list)
+            elif msg_type == "text":
+                message = f"{ats}\n{msg}" if ats else f"{msg}"
+                self.LOG.info(f"To {receiver}: {message}")
+                self.wcf.send_text(message, receiver, at_list)
+            elif msg_type == "image":
+                # 对于图片消息，只发送图片路径或URL
+                self.LOG.info(f"To {receiver}: Sending image.")
+                self.wcf.send_image(msg, receiver)
+            elif msg_type in ("voice", "amr"):
+                # 对于语音消息，只发送语音路径或URL
+                self.LOG.info(f"To {receiver}: Sending voice.")
+                self.wcf.send_file(msg, receiver)
             else:
-                wxids = at_list.split(",")
-                for wxid in wxids:
-                    # 根据 wxid 查找群昵称
-                    ats += f" @{self.wcf.get_alias_in_chatroom(wxid, receiver)}"
-
-        # 对于文本消息，包含 ats（如果有的话）
-        if msg_type == "text":
-            message = f"{ats}\n{msg}" if ats else f"{msg}"
-            self.LOG.info(f"To {receiver}: {message}")
-            self.wcf.send_text(message, receiver, at_list)
-        elif msg_type == "image":
-            # 对于图片消息，只发送图片路径或URL
-            self.LOG.info(f"To {receiver}: Sending image.")
-            self.wcf.send_image(msg, receiver)
-        elif msg_type == "amr":
-            # 对于语音消息，只发送语音路径或URL
-            self.LOG.info(f"To {receiver}: Sending voice.")
-            self.wcf.send_file(msg, receiver)
-        else:
-            # 对于文件消息，只发送文件路径或URL
-            self.LOG.info(f"To {receiver}: Sending file.")
-            self.wcf.send_file(msg, receiver)
-        # ... 其他消息类型的处理 ...
+                # 对于文件消息，只发送文件路径或URL
+                self.LOG.info(f"To {receiver}: Sending file.")
+                self.wcf.send_file(msg, receiver)
+            # ... 其他消息类型的处理 ...
+        finally:
+            if msg_type != "text" and self.media.contains(msg):
+                # 发送结束（无论成败），释放媒体缓存中的文件，之后可被淘汰
+                self.media.release(msg)
 
     def toAt(self, msg: WxMsg) -> bool:
         """处理被 @ 消息
         :param msg: 微信消息结构
         :return: 处理状态，`True` 成功，`False` 失败
         """
-        msg.content = re.sub(r"@.*?[\u2005|\s]", "", msg.content).replace(" ", "")
-        for cmd, handler in self.commands.items():
-            if msg.content.strip().startswith(cmd):
-                handler(msg)
-                break  # 结束循环
-        else:
+        msg.content = self.router.normalize(msg.content)
+        return self.dispatchCommand(msg)
+
+    def dispatchCommand(self, msg: WxMsg) -> bool:
+        """按最长前缀匹配命令并把参数交给处理方法，未匹配时闲聊
+        :param msg: 微信消息结构
+        """
+        matched = self.router.match(msg.content)
+        if matched is None:
             return self.toChitchat(msg)
+        cmd, handler, content = matched
+        rsp = handler(msg, content)
+        if inspect.iscoroutine(rsp):
+            # 协程处理方法：asyncio 模式下交回事件循环等待，线程模式下在事件循环上执行完再返回
+            if not self.aio.defer(rsp):
+                return self.aio.run(rsp)
+            return None
+        return rsp
 
     @add_receiver_info
     def toChengyu(self, msg: WxMsg) -> bool:
@@ -197,12 +351,14 @@ class Robot(Job):
             flag = texts[0][0]
             text = texts[0][1]
             if flag == "#":  # 接龙
+                cy = lazy_import("base.func_chengyu").cy
                 if cy.isChengyu(text):
                     rsp = cy.getNext(text)
                     if rsp:
                         return rsp
                         status = True
             elif flag in ["?", "？"]:  # 查词
+                cy = lazy_import("base.func_chengyu").cy
                 if cy.isChengyu(text):
                     rsp = cy.getMeaning(text)
                     if rsp:
@@ -218,8 +374,11 @@ class Robot(Job):
         if not self.chat:  # 没接 ChatGPT，固定回复
             rsp = "你@我干嘛？"
         else:  # 接了 ChatGPT，智能回复
-            msg.content = re.sub(r"@.*?[\u2005|\s]", "", msg.content).replace(" ", "")
-            rsp = self.chat.get_answer(msg.content, (msg.roomid if msg.from_group() else msg.sender)).split('####')[0]  #用split删除广告消息
+            try:
+                rsp = self.chat.get_answer(msg.content, (msg.roomid if msg.from_group() else msg.sender)).split('####')[0]  #用split删除广告消息
+            except NoBackendError as e:
+                self.LOG.error(f"所有模型均不可用：{e}")
+                rsp = None
 
         if rsp:
             return rsp
@@ -229,15 +388,13 @@ class Robot(Job):
 
     def processMsg(self, msg: WxMsg) -> None:
         if msg.from_group():
-            if msg.roomid not in self.config.GROUPS:
+            if msg.roomid not in self.ingress.rules.groups:
                 return
             if msg.is_at(self.wxid):  # 被@
                 self.toAt(msg)           
             
-            if msg.type == 3:  # 图片消息
-                img_path = r"C:/Users/Raimbault/Documents/WeChat Files/wxid_55zyiv0rij9a12/FileStorage/MsgAttach/f2332fbf6604994906debc30e386a18a/Image/2023-12/"
-                self.file_path = self.wcf.download_image(msg.id, msg.extra, img_path, 5)
-                print(f"Image download successfully")
+            if msg.type == 3:  # 图片消息，只记下引用，【识图】时再下载
+                self.sessions.of(msg).add_image(msg)
 
             # if msg.type == 34:  # 语音信息
             #     dir_path = r"C:\Users\Raimbault\Documents\WeChat Files\wxid_55zyiv0rij9a12\FileStorage\File\2023-12"                
@@ -251,6 +408,9 @@ class Robot(Job):
             #     print(speech)
             #     self.wcf.send_file(speech, msg.roomid)
 
+            elif msg.type == 10000:  # 群系统消息，成员可能有变动
+                self.aliases.invalidate(msg.roomid)
+
             else: # 其他消息    
                 self.toChengyu(msg)
             return #不返回会触发chitchat
@@ -261,22 +421,11 @@ class Robot(Job):
             # if msg.type == 37:  # 好友请求
             #     self.autoAcceptFriendRequest(msg)
 
-            if msg.type == 3:  # 图片消息
-                dir_path = r"C:/Users/Raimbault/Documents/WeChat Files/wxid_55zyiv0rij9a12/FileStorage/MsgAttach/f2332fbf6604994906debc30e386a18a/Image/2023-12/"
-                self.file_path = self.wcf.download_image(msg.id, msg.extra, dir_path,5)
-                print(f"图片下载成功")
-
-            if msg.type == 34:  # 语音信息
-                dir_path = r"C:\Users\Raimbault\Documents\WeChat Files\wxid_55zyiv0rij9a12\FileStorage\File\2023-12"                
-                self.voice_path = self.wcf.get_audio_msg(msg.id, dir_path, 3)
-                print(f"语音下载成功")
-                text = self.stt()
-                print(text)
-                rsp = self.chat.get_answer(text, msg.sender).split('####')[0]  #用split删除广告消息
-                print(rsp)
-                speech = self.tts(rsp).replace("\n", "")
-                print(speech)
-                self.wcf.send_file(speech, msg.sender)
+            if msg.type == 3:  # 图片消息，只记下引用，【识图】时再下载
+                self.sessions.of(msg).add_image(msg)
+
+            if msg.type == 34:  # 语音信息，转写、回复、合成在语音线程池中进行，不阻塞消息分发
+                self.voice.submit(msg)
 
             # if msg.type == 43:  # 视频信息
             #     dir_path = r"C:/Users/Raimbault/Documents/WeChat Files/wxid_55zyiv0rij9a12/FileStorage/Video/2023-12/"
@@ -292,7 +441,11 @@ class Robot(Job):
                 if msg.from_self():
                     if msg.content == "/更新":
                         self.config.reload()
-                        self.LOG.info("已更新")       
+                        self.ingress.reload(self.config)
+                        self.allContacts.sync()
+                        self.LOG.info("已更新")
+                    elif msg.content == "/统计":
+                        self.sendTextMsg(METRICS.summary(), msg.roomid if msg.roomid else msg.sender)       
                 else: 
                     # 如果是天气，就重发天气预报
                     if msg.content == "/天气":
@@ -300,16 +453,13 @@ class Robot(Job):
                     # 如果是新闻，就重发隔夜要闻
                     elif msg.content == "/新闻":
                         self.newsReport()                
-                    else:  # 其他消息
-                        for cmd, handler in self.commands.items():
-                            if msg.content.strip().startswith(cmd):
-                                handler(msg)
-                                break  # 结束循环
-                        else:
-                            self.toChitchat(msg)  # 闲聊
+                    else:  # 其他消息，未匹配命令时闲聊
+                        self.dispatchCommand(msg)
 
     def onMsg(self, msg: WxMsg) -> int:
         try:
+            if not self.ingress.accept(msg, self.wxid):
+                return 0
             self.LOG.info(msg)  # 打印信息
             self.processMsg(msg)
         except Exception as e:
@@ -321,12 +471,27 @@ class Robot(Job):
         self.wcf.enable_receiving_msg(self.onMsg)
 
     def enableReceivingMsg(self) -> None:
+        # 接收线程只负责取消息，处理交给分发引擎的工作线程池
+        # 配置示例 DISPATCH: {workers: 8, queue_size: 1000}
+        # mode 为 asyncio 时改由事件循环调度，参数见 ASYNC: {workers: 32, max_inflight: 1000}
+        dispatch_conf = getattr(self.config, "DISPATCH", None) or {}
+        if dispatch_conf.get("mode") == "asyncio":
+            self.dispatcher = self.aio
+        else:
+            self.dispatcher = MsgDispatcher(self.processMsg,
+                                            workers=dispatch_conf.get("workers", 8),
+                                            queue_size=dispatch_conf.get("queue_size", 1000))
+        self.dispatcher.start()
+        METRICS.gauge("robot_queue_depth", self.dispatcher.qsize, queue="dispatch")
+
         def innerProcessMsg(wcf: Wcf):
             while wcf.is_receiving_msg():
                 try:
                     msg = wcf.get_msg()
+                    if not self.ingress.accept(msg, self.wxid):
+                        continue  # 不需要处理的消息只计数
                     self.LOG.info(msg)
-                    self.processMsg(msg)
+                    self.dispatcher.submit(msg)
                 except Empty:
                     continue  # Empty message
                 except Exception as e:
@@ -335,50 +500,30 @@ class Robot(Job):
         self.wcf.enable_receiving_msg()
         Thread(target=innerProcessMsg, name="GetMessage", args=(self.wcf,), daemon=True).start()
 
-    def sendTextMsg(self, msg: str, receiver: str, at_list: str = "") -> None:
-        """ 发送消息
+    def sendTextMsg(self, msg: str, receiver: str, at_list: str = "") -> Future:
+        """ 发送文本消息，放入接收者的发送队列后立即返回
         :param msg: 消息字符串
         :param receiver: 接收人wxid或者群id
         :param at_list: 要@的wxid, @所有人的wxid为：notify@all
+        :return: 发送完成时得到结果的 Future
         """
-        # msg 中需要有 @ 名单中一样数量的 @
-        ats = ""
-        if at_list:
-            if at_list == "notify@all":  # @所有人
-                ats = " @所有人"
-            else:
-                wxids = at_list.split(",")
-                for wxid in wxids:
-                    # 根据 wxid 查找群昵称
-                    ats += f" @{self.wcf.get_alias_in_chatroom(wxid, receiver)}"
-
-        # {msg}{ats} 表示要发送的消息内容后面紧跟@，例如 北京天气情况为：xxx @张三
-        if ats == "":
-            self.LOG.info(f"To {receiver}: {msg}")
-            self.wcf.send_text(f"{msg}", receiver, at_list)
-        else:
-            self.LOG.info(f"To {receiver}: {ats}\r{msg}")
-            self.wcf.send_text(f"{ats}  {msg}", receiver, at_list)
-
-    def getAllContacts(self) -> dict:
-        """
-        获取联系人（包括好友、公众号、服务号、群成员……）
-        格式: {"wxid": "NickName"}
-        """
-        contacts = self.wcf.query_sql("MicroMsg.db", "SELECT UserName, NickName FROM Contact;")
-        return {contact["UserName"]: contact["NickName"] for contact in contacts}
+        return self.sendMsg({
+            "receiver_id": receiver,
+            "group_id": at_list,
+            "msg_type": "text",
+            "content": msg,
+            "inline_ats": True,
+        })
 
     def keepRunningAndBlockProcess(self) -> None:
         """
-        保持机器人运行，不让进程退出
+        保持机器人运行，不让进程退出；定时任务在截止时间到达时触发
         """
-        while True:
-            self.runPendingJobs()
-            time.sleep(1)
+        self.scheduler.run_forever()
 
     def autoAcceptFriendRequest(self, msg: WxMsg) -> None:
         try:
-            xml = ET.fromstring(msg.content)
+            xml = lazy_import("xml.etree.ElementTree").fromstring(msg.content)
             v3 = xml.attrib["encryptusername"]
             v4 = xml.attrib["ticket"]
             scene = int(xml.attrib["scene"])
@@ -394,23 +539,57 @@ class Robot(Job):
             self.allContacts[msg.sender] = nickName[0]
             self.sendTextMsg(f"Hi {nickName[0]}，我自动通过了你的好友请求。", msg.sender)
 
-    def newsReport(self) -> None:
-        receivers = self.config.NEWS
-        if not receivers:
-            return
+    def fetchNews(self) -> str:
+        return lazy_import("base.func_news").News().get_important_news()
 
-        news = News().get_important_news()
-        for r in receivers:
-            self.sendTextMsg(news, r)
+    def fetchWeather(self) -> str:
+        return lazy_import("base.func_weather").Weather().get_weather()
 
-    def weatherReport(self) -> None:
-        receivers = self.config.WEATHER
+    def reportSource(self, name: str):
+        """群发内容的来源：name -> (获取内容的方法, 接收者列表)"""
+        return {
+            "news": (self.fetchNews, self.config.NEWS),
+            "weather": (self.fetchWeather, self.config.WEATHER),
+        }[name]
+
+    def broadcastReport(self, name: str) -> None:
+        """在后台群发，不占用定时任务循环；发送结果和失败重试见 Broadcaster"""
+        fetch, receivers = self.reportSource(name)
         if not receivers:
             return
+        self.broadcaster.start(name, fetch, receivers)
+
+    def prefetchReport(self, name: str) -> None:
+        fetch, receivers = self.reportSource(name)
+        if receivers:
+            self.broadcaster.prefetch(name, fetch)
 
-        weather = Weather().get_weather()
-        for r in receivers:
-            self.sendTextMsg(weather, r)
+    def scheduleReport(self, times, name: str) -> None:
+        """ 每天定时群发，并提前 prefetch_lead 秒预取内容
+        :param times: 时间字符串或列表，格式 HH:MM 或 HH:MM:SS
+        :param name: news 或 weather
+        """
+        times = times if isinstance(times, list) else [times]
+        lead = self.broadcaster.prefetch_lead
+        if lead > 0:
+            self.onEveryTime([shift_time(t, -lead) for t in times], partial(self.prefetchReport, name))
+        self.onEveryTime(times, partial(self.broadcastReport, name))
+
+    def onEveryTime(self, times, task, *args, **kwargs) -> None:
+        """ 定时任务；定时群发新闻、天气（如 onEveryTime("07:30", robot.newsReport)）改由 scheduleReport 注册，
+        推送前先预取内容
+        """
+        report = {self.newsReport: "news", self.weatherReport: "weather"}.get(task)
+        if report is not None and not args and not kwargs:
+            self.scheduleReport(times, report)
+        else:
+            super().onEveryTime(times, task, *args, **kwargs)
+
+    def newsReport(self) -> None:
+        self.broadcastReport("news")
+
+    def weatherReport(self) -> None:
+        self.broadcastReport("weather")
 
     def tts(self, msg): #原神版
         # 根据文字生成原神语音
@@ -421,91 +600,146 @@ class Robot(Job):
         sdp = 0.4    #Duration Predictor中SDP的占比，此值越大则语气波动越强烈，但可能偶发出现语调奇怪。
         Length = 1   #默认为1                    
         params = {'msg':msg, 'speaker':speaker, 'type':types, 'noise':noise, 'noisew':noisew, 'sdp':sdp, 'Length':Length}
-        response = requests.get('https://api.lolimi.cn/API/yyhc/y.php', params = params)
+        # 同样的文本和参数合成过就直接用缓存的语音
+        key = tts_key(msg, speaker, {k: v for k, v in params.items() if k != 'msg'})
+        rsp = self.media.lookup(key)
+        if rsp:
+            METRICS.inc("robot_tts_cache_total", result="hit")
+            return rsp
+        METRICS.inc("robot_tts_cache_total", result="miss")
+        response = self.http.get('https://api.lolimi.cn/API/yyhc/y.php', params = params)
         # 解析响应为 JSON
-        data = json.loads(response.text)
+        data = self.http.json(response)
         # 获取下载 URL
         download_url = data.get('music')
-        # 发送 GET 请求
-        response = requests.get(download_url, stream=True)
-        # 检查响应状态码
-        if response.status_code == 200:
-            # 将响应的内容写入到文件
-            with open(r'C:\Users\Raimbault\WeChatRobot-39.0.5.0\audio.wav', 'wb') as f:
-                f.write(response.content)
+        # 流式下载到媒体缓存
+        try:
+            rsp = self.downloadMedia(download_url, ".wav", key=key)
             print('Audio generates successfully')
-            rsp = r"C:\Users\Raimbault\WeChatRobot-39.0.5.0\audio.wav"
             return rsp
-        else:
+        except (requests.RequestException, IOError) as e:
+            print('Failed to generate audio', e)
             return None
-            print('Failed to generate audio')    
 
-    def stt(self):
-        #语音转文字
+    def downloadMedia(self, url: str, suffix: str, key: str = None, params: dict = None) -> str:
+        """流式下载到媒体缓存，受 HTTP 配置中的大小上限和总时长期限约束
+        :param url: 下载地址
+        :param suffix: 文件后缀，如 .jpg
+        :param key: 请求键，登记后同样的请求可用 self.media.lookup 直接取到文件
+        :param params: 请求参数
+        :return: 文件路径，发送后由 sendMsg 释放
+        """
+        with self.media.writer(suffix, key) as file:
+            self.http.download(url, file, params=params)
+        return file.path
+
+    def latestImage(self, msg: WxMsg, timeout: int = 10) -> str:
+        """ 下载会话里最近的一张图片，已下载过的直接返回路径
+        最新的图片下载失败（如已过期）时依次尝试更早的
+        :return: 本地路径，没有可用图片时为空字符串
+        """
+        images = self.sessions.of(msg).images
+        for ref in reversed(list(images)):
+            if ref.path and os.path.exists(ref.path):
+                return ref.path
+            try:
+                ref.path = self.wcf.download_image(ref.id, ref.extra, self.image_dir, timeout) or ""
+            except Exception as e:
+                self.LOG.warning(f"Downloading image {ref.id} failed: {e}")
+            if ref.path:
+                return ref.path
+            images.remove(ref)
+        return ""
+
+    def stt(self, file_path: str):
+        #语音转文字，上传前转成 16kHz 单声道以减小上传量
         url = "https://api.pearktrue.cn/api/audiocr/"
-        file_path = self.voice_path
+        upload = self.transcoder.transcode(file_path, "mp3", ["-ac", "1", "-ar", "16000"])
         try:
-            with open(file_path, "rb") as file:
+            with open(upload, "rb") as file:
                 formdata = {"file": file}
-                response = requests.post(url, files=formdata)
+                response = self.http.post(url, files=formdata)
             if response.status_code == 200:
-                data = response.json()
+                data = self.http.json(response)
                 rsp = data.get("data", {}).get("content", "Not found")
             else:
                 rsp = None
+        except CircuitOpenError:
+            raise
         except Exception as e:
             print(f"Error processing STT request: {e}")
             rsp = None
+        finally:
+            if upload != file_path:
+                self.media.release(upload)
         return rsp
 
+    def fetchVoice(self, msg: WxMsg) -> str:
+        """下载语音消息，返回本地路径"""
+        return self.wcf.get_audio_msg(msg.id, self.voice_dir, 3)
+
+    def answerVoice(self, text: str, wxid: str) -> str:
+        """语音消息的文字回复"""
+        if not self.chat:
+            return None
+        return self.chat.get_answer(text, wxid).split('####')[0]  #用split删除广告消息
+
+    def transcodeVoice(self, path: str) -> str:
+        """把合成的语音转成体积小的格式再发送，同一文件只转一次"""
+        fmt = self.voice_format
+        out = self.transcoder.transcode(path, fmt, ["-ac", "1", "-b:a", self.voice_bitrate],
+                                        key=f"{fmt}-{self.voice_bitrate}-{os.path.basename(path)}")
+        if out != path and self.media.contains(path):
+            self.media.release(path)
+        return out
+
+    def sendDegraded(self, receiver: str) -> Future:
+        """上游熔断期间回复降级提示"""
+        return self.sendTextMsg(self.http.resilience.fallback, receiver)
+
+    def sendVoice(self, path: str, receiver: str) -> Future:
+        return self.sendMsg({"receiver_id": receiver, "group_id": None, "msg_type": "voice", "content": path})
+
 
     @add_receiver_info
-    def handle_画(self, msg) -> None:
+    def handle_画(self, msg, content: str = "") -> None:
         # 调用StableDiffusion绘画，格式：画 一只会飞的猪
-        content = msg.content.replace('画', "").strip()
         if not content:
             return f"1.功能介绍：\nStableDiffusion绘画\n2.调用格式：\n画一只会飞的猪"        
         mode = 'vertical' # 模式：正方形normal、竖版vertical、横版horizontal
         prompt = content
         params = {'mode':mode, 'prompt':prompt}         
-        response = requests.get('https://api.pearktrue.cn/api/stablediffusion', params = params)
+        response = self.http.get('https://api.pearktrue.cn/api/stablediffusion', params = params)
         if response.status_code == 200:
-            data = json.loads(response.text)
+            data = self.http.json(response)
             rsp = data.get('imgurl', 'Not found')
         else:
             rsp = None
         return rsp
 
     @add_receiver_info
-    def handle_翻译(self, msg):
+    async def handle_翻译(self, msg, content: str = ""):
         # 调用谷歌翻译，中英互译
-        content = msg.content.replace("翻译", "").strip()
         if not content:
             return f"1.功能介绍：\n谷歌翻译，支持中英互译\n2.调用格式：\n翻译我喜欢你"
         types = "auto" # 翻译模式(auto=自动检测[默认]，en=英文转中文，zh=中文转英文)
         text = content
         params = {"type":types, "text":text}
-        response = requests.get("https://api.pearktrue.cn/api/googletranslate", params = params)
-        if response.status_code == 200:
-            data = json.loads(response.text)
-            result = data.get("result", "Not found")
-            rsp = result
-        else:
-            rsp = None
+        data = await self.ahttp.get_json("https://api.pearktrue.cn/api/googletranslate", params = params)
+        rsp = data.get("result", "Not found")
         return rsp
 
     @add_receiver_info
-    def handle_拼音(self, msg):
+    def handle_拼音(self, msg, content: str = ""):
         # 输出汉字的拼音
-        content = msg.content.replace("拼音", "").strip()
         if not content:
             return f"1.功能介绍：\n查找汉字拼音\n2.调用格式：\n拼音我爱你" 
         word = content
         params = {"word":word}
         print(params)
-        response = requests.get("https://api.pearktrue.cn/api/word/pinyin", params = params)
+        response = self.http.get("https://api.pearktrue.cn/api/word/pinyin", params = params)
         if response.status_code == 200:
-            data = json.loads(response.text)
+            data = self.http.json(response)
             print(data)
             pinyin_list = data.get("data", "Not found")
             rsp = ' '.join(pinyin_list)
@@ -514,25 +748,25 @@ class Robot(Job):
         return rsp
 
     @add_receiver_info
-    def handle_搜歌(self, msg):
+    def handle_搜歌(self, msg, content: str = ""):
         # 聚合音乐解析
-        content = msg.content.replace("搜歌", "").strip()
         if not content:
             return f"1.功能介绍：\n搜索歌曲并将序号传给【听歌】\n2.调用格式：\n搜歌周杰伦" 
         name = content
         params = {"name":name}
-        response = requests.get("https://api.pearktrue.cn/api/music/wanneng.php", params = params)
+        response = self.http.get("https://api.pearktrue.cn/api/music/wanneng.php", params = params)
         if response.status_code == 200:
-            data = json.loads(response.text)
+            data = self.http.json(response)
             if "data" in data:
                 songs = data["data"]
                 output = f'我为您找到了以下结果：\n'
-                
+                song_list = self.sessions.of(msg).song_list
+                song_list.clear()
                 for i, song in enumerate(songs):
                     if i >= 10:  # 只显示10个结果
                         break
-                    self.song_list[i+1] = f"https://api.pearktrue.cn/api/music/wanneng.php?name={name}&num={song['id']}"
-                    print(self.song_list)
+                    song_list[i+1] = f"https://api.pearktrue.cn/api/music/wanneng.php?name={name}&num={song['id']}"
+                    print(song_list)
                     output += f'Top -{song["id"]}-\n'
                     output += f'歌曲名: {song["song_name"]}\n'
                     output += f'歌手: {song["singer"]}\n'
@@ -544,32 +778,31 @@ class Robot(Job):
         return rsp
 
     @add_receiver_info
-    def handle_听歌(self, msg):
+    def handle_听歌(self, msg, content: str = ""):
         # 聚合音乐解析
-        content = msg.content.replace('听歌', "").strip()
         if not content:
             return f"1.功能介绍：\n通过【搜歌】序号或名字听歌\n调用格式\n格式1：听歌1\n格式2：听歌倒带"
         if content.isdigit():
             rank = int(content)
-            if rank in self.song_list:
-                url = self.song_list[rank]
+            song_list = self.sessions.of(msg).song_list
+            if rank in song_list:
+                url = song_list[rank]
             else:
                 return "请先调用【搜歌】，若已搜歌请检查序号"
         else:
             url = "https://api.pearktrue.cn/api/music/wanneng.php?num=1&name="+ content
         print(url)         
-        response = requests.get(url)
+        response = self.http.get(url)
         if response.status_code == 200:
-            data = json.loads(response.text)            
+            data = self.http.json(response)            
             rsp = data.get("data", {}).get("music_link", "Not found")
         else:
             rsp = None
         return rsp
 
     @add_receiver_info
-    def handle_签名(self, msg):
+    def handle_签名(self, msg, content: str = ""):
         # 生成个性签名图片,最多支持三个字
-        content = msg.content.replace('签名', "").strip()
         if not content:
             return f"1.功能介绍：\n生成个性签名，支持: hsq花式签 swq商务签 gxq个性牵 sxlbz手写连笔字 zkt正楷体 wrns温柔女生 xsq潇洒牵 cjysq超级艺术签 xsq行书签 ksq楷书牵 qsq情书签 xcq行草签 ktkaq卡通可爱签\n2.调用格式：\n签名hsq，郭富城"
         style, word = content.split("，") # style支持: hsq花式签 swq 商务签 gxq 个性牵 sxlbz 手写连笔字 zkt 正楷体 wrns 温柔女生 xsq 潇洒牵 cjysq 超级艺术签 xsq 行书签 ksq 楷书牵 qsq 情书签 xcq 行草签 ktkaq 卡通可爱签
@@ -577,30 +810,29 @@ class Robot(Job):
         fontcolor = "#000000" # 字体颜色
         colors = "#ffffff"    # 背景颜色
         params = {'word': word, "type":style, "size":size, "fontcolor":fontcolor, "colors":colors}
-        response = requests.get('https://api.pearktrue.cn/api/signature', params=params)
-        if response.status_code == 200:
-            # 以二进制写模式（binary write mode）打开文件
-            with open(r'C:\Users\Raimbault\output_image.png', 'wb') as f:
-                # 将响应内容写入文件
-                f.write(response.content)
+        # 同样的签名参数得到同样的图片，按请求键登记到媒体缓存
+        key = f"签名-{style}-{word}"
+        rsp = self.media.lookup(key)
+        if rsp:
+            return rsp
+        try:
+            rsp = self.downloadMedia('https://api.pearktrue.cn/api/signature', ".png", key=key, params=params)
             print("图片下载成功")                            
-            rsp = r"C:\Users\Raimbault\output_image.png"
             return rsp
-        else:
+        except (requests.RequestException, IOError) as e:
+            print("图片下载失败", e)
             return None
-            print("图片下载失败")
 
     @add_receiver_info
-    def handle_网名(self, msg):
+    def handle_网名(self, msg, content: str = ""):
         # 根据姓氏取网名
-        content = msg.content.replace('网名', "").strip()
         if not content:
             return f"1.功能介绍：\n根据姓氏取网名\n2.调用格式：\n网名刘"
         name = content
         params = {'name': name}
-        response = requests.get('https://api.pearktrue.cn/api/namexy', params=params)
+        response = self.http.get('https://api.pearktrue.cn/api/namexy', params=params)
         if response.status_code == 200:
-            data = response.json()
+            data = self.http.json(response)
             name_list = data['data']
             rsp = "\n".join(f"{i}.{name}" for i, name in enumerate(name_list, 1))
             print("取名成功")
@@ -610,37 +842,40 @@ class Robot(Job):
             print("取名失败")
 
     @add_receiver_info
-    def handle_取名(self, msg):
+    def handle_取名(self, msg, content: str = ""):
         # 取名，默认设置输出10个，对应count=9
-        content = msg.content.replace('取名', "").strip()
         if not content:
             return f"1.功能介绍：\n根据姓氏取真名\n2.调用格式：\n取名王"
         xing = content
-        male_params = {'xing': xing, 'sex': 'male', 'count': 9}
-        female_params = {'xing': xing, 'sex': 'female', 'count': 9}        
-        male_response = requests.get('https://api.pearktrue.cn/api/name/generate', params=male_params)
-        female_response = requests.get('https://api.pearktrue.cn/api/name/generate', params=female_params)        
-        if male_response.status_code == 200 and female_response.status_code == 200:
-            male_data = male_response.json()['data']
-            female_data = female_response.json()['data']            
-            male_names = "\n".join(f"{i}.{name}" for i, name in enumerate(male_data, 1))
-            female_names = "\n".join(f"{i}.{name}" for i, name in enumerate(female_data, 1))            
-            print("取名成功")
-            return f"如果是男孩: \n{male_names}\n\n如果是女孩: \n{female_names}"
-        else:
+        url = 'https://api.pearktrue.cn/api/name/generate'
+        # 男孩、女孩两个请求并发执行，其中一个失败时仍返回另一个的结果
+        results, _ = self.fanout.gather({
+            "male": lambda: self.http.get_json(url, params={'xing': xing, 'sex': 'male', 'count': 9})['data'],
+            "female": lambda: self.http.get_json(url, params={'xing': xing, 'sex': 'female', 'count': 9})['data'],
+        })
+        sections = []
+        if "male" in results:
+            male_names = "\n".join(f"{i}.{name}" for i, name in enumerate(results["male"], 1))
+            sections.append(f"如果是男孩: \n{male_names}")
+        if "female" in results:
+            female_names = "\n".join(f"{i}.{name}" for i, name in enumerate(results["female"], 1))
+            sections.append(f"如果是女孩: \n{female_names}")
+        if not sections:
             print("取名失败")
             return None
+        print("取名成功")
+        return "\n\n".join(sections)
 
     @add_receiver_info
-    def handle_重名(self, msg):
+    @cached_reply(ttl=86400)
+    def handle_重名(self, msg, content: str = ""):
         # 查询重名
-        content = msg.content.replace('重名', "").strip()
         if not content:
             return f"1.功能介绍：\n查询重名\n2.调用格式：\n重名张三"
         name = content
-        response = requests.get('https://api.pearktrue.cn/api/name/check.php?name='+ name)
+        response = self.http.get('https://api.pearktrue.cn/api/name/check.php?name='+ name)
         if response.status_code == 200:
-            data = json.loads(response.text)
+            data = self.http.json(response)
             info = data['data']
             output = ""
             output += f"查询成功：\n"
@@ -656,38 +891,31 @@ class Robot(Job):
             print("查询失败")
 
     @add_receiver_info
-    def handle_典故(self, msg):
+    def handle_典故(self, msg, content: str = ""):
         # 根据意思搜索现代文和古诗文
-        content = msg.content.replace('典故', "").strip()
         if not content:
             return f"1.功能介绍：\n根据语意查典故\n2.调用格式：\n典故遇到困难不要怕"
-        modern_params = {"mean": content, "type": "现代文"}
-        ancient_params = {"mean": content, "type": "古诗文"}
-        modern_response = requests.get('https://api.pearktrue.cn/api/meansearch', params=modern_params)
-        ancient_response = requests.get('https://api.pearktrue.cn/api/meansearch', params=ancient_params)
-        if modern_response.status_code == 200 and ancient_response.status_code == 200:
-            modern_data = modern_response.json()
-            print(modern_data)
-            ancient_data = ancient_response.json()
-            print(ancient_data)
-            modern_items = modern_data.get('data', [])
-            ancient_items = ancient_data.get('data', [])
-            lines = ["【现代文】："] + \
-                     [f"<{i}>.{item['quote']}\n出自: {item['source']}\n--------------------------------" for i, item in enumerate(modern_items[:10], 1)] + \
-                     ["【古诗文】："] + \
-                     [f"<{i}>.{item['quote']}\n出自: {item['source']}\n--------------------------------" for i, item in enumerate(ancient_items[:10], 1)]
-            rsp = '\n'.join(lines)
-            print("典故查询成功")
-            return rsp
-        else:
-            return None
+        url = 'https://api.pearktrue.cn/api/meansearch'
+        # 现代文、古诗文两个请求并发执行，其中一个失败时仍返回另一个的结果
+        results, _ = self.fanout.gather({
+            "现代文": lambda: self.http.get_json(url, params={"mean": content, "type": "现代文"}).get('data', []),
+            "古诗文": lambda: self.http.get_json(url, params={"mean": content, "type": "古诗文"}).get('data', []),
+        })
+        lines = []
+        for kind in ("现代文", "古诗文"):
+            if kind in results:
+                lines += [f"【{kind}】："] + \
+                         [f"<{i}>.{item['quote']}\n出自: {item['source']}\n--------------------------------" for i, item in enumerate(results[kind][:10], 1)]
+        if not lines:
             print("典故查询失败")
+            return None
+        print("典故查询成功")
+        return '\n'.join(lines)
 
     @add_receiver_info
-    def handle_台词(self, msg):
+    def handle_台词(self, msg, content: str = ""):
         # 根据句子查电影台词
         page = 1
-        content = msg.content.replace('台词', "").strip()
         if not content:
             return f"1.功能介绍：\n根据台词查找电影\n2.调用格式：\n格式1：台词我爱你\n格式2：台词3我爱你\n注：3表示第3页，默认第1页"
         if content[0].isdigit():
@@ -701,11 +929,11 @@ class Robot(Job):
             # 如果不是数字，整个内容都是台词
             word = content         
         params = {"word": word, "page": page}
-        response = requests.get('https://api.pearktrue.cn/api/media/lines.php', params=params)
+        response = self.http.get('https://api.pearktrue.cn/api/media/lines.php', params=params)
 
         if response.status_code == 200:
             try:
-                data = response.json()
+                data = self.http.json(response)
                 if "data" in data and len(data["data"]) > 0:
                     output = "为您找到以下结果：\n"
                     project_count = 1
@@ -720,82 +948,77 @@ class Robot(Job):
                     return output
                 else:
                     return "没有找到相关的电影台词。"
+            except CircuitOpenError:
+                raise
             except Exception as e:
                 print(f"Error processing data: {e}")
                 return "处理数据时发生错误。"   
 
     @add_receiver_info
-    def handle_扮演(self, msg):
+    def handle_扮演(self, msg, content: str = ""):
         #随机发送一条语音，支持扮演怼人、绿茶、御姐
-        content = msg.content.replace('扮演', "").strip()
         if not content:
             return f"1.功能介绍：\n扮演角色，支持扮演怼人、绿茶、御姐\n2.调用格式：\n扮演御姐"
         role = content
         role_dict = {"怼人": 'duiren/', "绿茶": 'greentea/', '御姐':'yujie/'}
         base_url = "https://api.pearktrue.cn/api/" + role_dict[role]
-        response = requests.get(base_url)
+        response = self.http.get(base_url)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = lazy_import("bs4").BeautifulSoup(response.content, 'html.parser')
             video = soup.find('video')
             source = video.find('source')
             relative_url = source.get('src')
-            mp3_url = urllib.parse.urljoin(base_url, relative_url)
-            response = requests.get(mp3_url, stream=True)
-            with open(r'C:\Users\Raimbault\WeChatRobot-39.0.5.0\audio.mp3', 'wb') as file:
-                file.write(response.content)     
+            mp3_url = urljoin(base_url, relative_url)
+            rsp = self.downloadMedia(mp3_url, ".mp3")
             print("Generate audio successfully.")
-            rsp = r'C:\Users\Raimbault\WeChatRobot-39.0.5.0\audio.mp3'
         else:
             rsp = None
             print("Failed to generate")
         return rsp
 
     @add_receiver_info
-    def handle_摸鱼(self, msg):
+    def handle_摸鱼(self, msg, content: str = ""):
         #生成摸鱼日历
-        response = requests.get('https://api.vvhan.com/api/moyu')
-        if response.status_code == 200:
-            # 以二进制写模式（binary write mode）打开文件
-            with open(r'C:\Users\Raimbault\output_image.jpg', 'wb') as f:
-                # 将响应内容写入文件
-                f.write(response.content)            
-            rsp = r"C:\Users\Raimbault\output_image.jpg"
+        # 摸鱼日历每天一张，当天已下载过的直接使用磁盘上的文件
+        key = f"摸鱼-{datetime.now():%Y%m%d}"
+        rsp = self.media.lookup(key)
+        if rsp:
             return rsp
+        try:
+            rsp = self.downloadMedia('https://api.vvhan.com/api/moyu', ".jpg", key=key)
             print("摸鱼日历下载成功")
-        else:
+            return rsp
+        except (requests.RequestException, IOError) as e:
+            print("摸鱼日历下载失败", e)
             return None
-            print("摸鱼日历下载失败")
 
     @add_receiver_info
-    def handle_举牌(self, msg):
+    def handle_举牌(self, msg, content: str = ""):
         # 将文字转化为举牌图片
-        content = msg.content.replace('举牌', "").strip()
         if not content:
             return f"1.功能介绍：\n小人举牌\n2.调用格式：\n举牌我出1个亿" 
+        key = f"举牌-{content}"
+        rsp = self.media.lookup(key)
+        if rsp:
+            return rsp
         params = {"msg":content}
-        response = requests.get('https://api.cenguigui.cn/api/jp', params = params)
-        if response.status_code == 200:
-            # 以二进制写模式（binary write mode）打开文件
-            with open(r'C:\Users\Raimbault\output_image.jpg', 'wb') as f:
-                # 将响应内容写入文件
-                f.write(response.content)
+        try:
+            rsp = self.downloadMedia('https://api.cenguigui.cn/api/jp', ".jpg", key=key, params=params)
             print("图片下载成功")                            
-            rsp = r"C:\Users\Raimbault\output_image.jpg"
             return rsp
-        else:
+        except (requests.RequestException, IOError) as e:
+            print("图片下载失败", e)
             return None
-            print("图片下载失败")
 
     @add_receiver_info
-    def handle_云图(self, msg):
+    def handle_云图(self, msg, content: str = ""):
         # 根据文本生成中国行政区划的云图
-        content = msg.content.replace('云图', "").strip()
         if not content:
             return f"1.功能介绍：\n根据长文本生成中国地图的云图\n2.调用格式：\n云图苹果, 香蕉, 樱桃, 枣, 接骨木果, 无花果, 西柚, 哈密瓜, 猕猴桃, 柠檬, 芒果, 油桃, 橙子, 番木瓜, 山楂, 草莓, 橙子, 柑橘, 葡萄, 西瓜, 杏子, 黑莓, 椰子, 火龙果, 芭乐, 猕猴桃, 青柠, 甜瓜, 桃子, 李子, 葡萄, 蓝莓, 菠萝, 石榴, 梨子, 柿子, 青柠, 荔枝, 蔓越莓, 香瓜, 黑醋栗, 百香果, 石榴, 草莓, 黑醋栗, 醋栗, 青提"
         params = {"text":content}
-        response = requests.get("https://api.pearktrue.cn/api/wordcloud", params = params)
+        response = self.http.get("https://api.pearktrue.cn/api/wordcloud", params = params)
         if response.status_code == 200:
-            data = response.json()
+            data = self.http.json(response)
             rsp = data['imgurl']
             return rsp
         else:
@@ -803,17 +1026,27 @@ class Robot(Job):
             print('生成图片失败')
 
     @add_receiver_info
-    def handle_识图(self, msg):
+    def handle_识图(self, msg, content: str = ""):
         #AI识图
         url = "https://api.pearktrue.cn/api/airecognizeimg/"
-        file_path = self.file_path
-        with open(file_path, "rb") as f:
-            files = {"file": ("file", f, 'image/jpeg')}
-            response = requests.post(url, files = files)
+        file_path = self.latestImage(msg)
+        if not file_path:
+            return "请先发送一张图片，再调用【识图】"
+        # 缩放压缩后再上传；同一张图（按感知哈希）识别过的直接用缓存的结果
+        image, key = self.imaging.prepare(file_path)
+        rsp = self.recognitions.get(key)
+        METRICS.inc("robot_image_recognition_cache_total", outcome="hit" if rsp else "miss")
+        if rsp:
+            return rsp
+        METRICS.inc("robot_image_upload_bytes_total", len(image))
+        files = {"file": ("file.jpg", image, 'image/jpeg')}
+        response = self.http.post(url, files = files)
         if response.status_code == 200:
             print('图片上传成功')
-            data = response.json()
+            data = self.http.json(response)
             rsp = data["result"]
+            if rsp:
+                self.recognitions.set(key, rsp)
             #使用大语言模型加强识别结果
             #rsp = self.chat.get_answer(rsp, (msg.roomid if msg.roomid else msg.sender)).split('####')[0]  #用split删除广告消息
             return rsp
@@ -823,14 +1056,15 @@ class Robot(Job):
             print('图片上传失败') 
 
     @add_receiver_info
-    def handle_查榜(self, msg):
+    @cached_reply(ttl=300)
+    def handle_查榜(self, msg, content: str = ""):
         # 门户热搜榜单，格式：热搜+哔哩哔哩，百度，知乎，百度贴吧，少数派，IT之家，澎湃新闻，今日头条，微博热搜，36氪，稀土掘金，腾讯新闻
-        title = msg.content.replace('查榜', "").strip()
+        title = content
         if not title:
             return f"1.功能介绍：获取热搜榜单，支持哔哩哔哩，百度，知乎，百度贴吧，少数派，IT之家，澎湃新闻，今日头条，微博热搜，36氪，稀土掘金，腾讯新闻\n2.调用格式：\n查榜今日头条"
         params = {'title':title}
-        response = requests.get('https://api.pearktrue.cn/api/dailyhot', params=params)
-        data = response.json()
+        response = self.http.get('https://api.pearktrue.cn/api/dailyhot', params=params)
+        data = self.http.json(response)
         if response.status_code == 200:
             print("正在生成榜单")
             print(data)
@@ -848,15 +1082,15 @@ class Robot(Job):
             print("榜单获取失败")
 
     @add_receiver_info
-    def handle_不可说(self, msg): 
+    def handle_不可说(self, msg, content: str = ""): 
         # 不可说
-        yulu = msg.content.replace('不可说', "").strip() #支持哲学、污妖王、毒鸡汤、朋友圈、渣男、舔狗、骚话、情话、笑话
+        yulu = content #支持哲学、污妖王、毒鸡汤、朋友圈、渣男、舔狗、骚话、情话、笑话
         if not yulu:
             return f"1.功能介绍：\n佛曰：不可说，支持：不可说\n2.调用格式：\n不可说情话"
         yulu_dict = {'哲学':'jdyl/zhexue.php','污妖王':'wuyaowang','毒鸡汤': 'dujitang','朋友圈':'jdyl/pyq.php',"渣男": 'random/zhanan?type=text', '舔狗':'jdyl/tiangou.php', '骚话':'jdyl/saohua.php','情话':'jdyl/qinghua.php','笑话':'jdyl/xiaohua.php'}
         tail = yulu_dict[yulu]
         url = 'https://api.pearktrue.cn/api/'+tail
-        response = requests.get(url)                 
+        response = self.http.get(url)                 
         if response.status_code == 200:
            content = re.split('<br>', response.text)
            content = [line.strip().replace('-', '') for line in content if line.strip() != ""]
@@ -868,23 +1102,18 @@ class Robot(Job):
             print("语录生成失败")
 
     @add_receiver_info
-    def handle_头像(self, msg):
+    def handle_头像(self, msg, content: str = ""):
         # 根据文字设定生成头像
-        text = msg.content.replace('头像', "").strip() 
+        text = content 
         if not text:
             return f"1.功能介绍：\n根据设定生成头像\n2.调用格式：头像机器人女友"
         try:
-            response = requests.get('https://api.pearktrue.cn/api/aiheadportrait/?prompt='+ text)
+            response = self.http.get('https://api.pearktrue.cn/api/aiheadportrait/?prompt='+ text)
             response.raise_for_status()
-            data = json.loads(response.text)
+            data = self.http.json(response)
             imgurl = data['imgurl'] # 用方括号访问键
-            response = requests.get(imgurl, stream=True) # 注意这里用的是imgurl而不是image_url
-            response.raise_for_status()
-            # 将图片数据写入文件
-            with open(r'C:\Users\Raimbault\avatar.png', 'wb') as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    file.write(chunk)            
-            rsp = r"C:\Users\Raimbault\avatar.png"
+            # 将图片数据流式写入媒体缓存，注意这里用的是imgurl而不是image_url
+            rsp = self.downloadMedia(imgurl, ".png")
             return rsp
             print("头像生成成功")
         except (requests.RequestException, KeyError, IOError) as e:
@@ -892,17 +1121,16 @@ class Robot(Job):
             print('头像生成失败，错误代码:', e)
 
     @add_receiver_info
-    def handle_到账(self, msg):
+    def handle_到账(self, msg, content: str = ""):
         #生成支付宝到账语音
-        content = msg.content.replace('支付宝到账', "").strip()
         if not content:
             return f"1.功能介绍：\n生成支付宝到账语音\n2.调用格式：\n到账100000000000000"
         types = 'json'
         number = content
         params = {'number':number, 'type':types}
-        response = requests.get('https://api.pearktrue.cn/api/alipay', params = params)
+        response = self.http.get('https://api.pearktrue.cn/api/alipay', params = params)
         if response.status_code == 200:
-            data = json.loads(response.text)
+            data = self.http.json(response)
             rsp = [data.get('audiourl', 'Not found')]
             rsp = rsp[0]
             return rsp
@@ -912,10 +1140,11 @@ class Robot(Job):
             print("语音生成失败")
 
     @add_receiver_info
-    def handle_追番(self, msg):
+    @cached_reply(ttl=1800)
+    def handle_追番(self, msg, content: str = ""):
         #获取最新番剧更新情况
-        response = requests.get('https://api.pearktrue.cn/api/todayanime/')
-        data = response.json()
+        response = self.http.get('https://api.pearktrue.cn/api/todayanime/')
+        data = self.http.json(response)
         if data['code'] == 200:                        
             print("正在生成榜单") 
             animes = data['data']  # 获取_anime数组
@@ -933,18 +1162,20 @@ class Robot(Job):
             print("获取失败")
 
     @add_receiver_info
-    def handle_抖音(self, msg):
+    def handle_抖音(self, msg, content: str = ""):
         #获取抖音热榜并将序号传递给【搜抖音】
-        response = requests.get('https://api.pearktrue.cn/api/dy/hot/')
-        data = response.json()
+        response = self.http.get('https://api.pearktrue.cn/api/dy/hot/')
+        data = self.http.json(response)
         if data['code'] == 200:                        
             print("正在生成榜单")                        
             topics = data['data']['current']
             output = f'最新的抖音热搜榜单如下：\n'
+            douyin_hotlist = self.sessions.of(msg).douyin_hotlist
+            douyin_hotlist.clear()
             for i, topic in enumerate(topics):
                 if i >= 20: #只获取前二十个话题
                     break
-                self.douyin_hotlist[i+1] = topic["topic_name"]
+                douyin_hotlist[i+1] = topic["topic_name"]
                 output += f'{topic["rank"]}.'
                 output += f'{topic["topic_name"]}\n'
                 #output += f'热度: {topic["topic_index"]}\n'
@@ -953,22 +1184,22 @@ class Robot(Job):
             output += f'请输入“搜抖音+数字”搜索视频\n'
             rsp = output
             return rsp
-            print(f"榜单获取成功\n{self.douyin_hotlist}")
+            print(f"榜单获取成功\n{douyin_hotlist}")
         else:
             return None
             print("榜单获取失败")
 
     @add_receiver_info
-    def handle_搜抖音(self, msg):
+    def handle_搜抖音(self, msg, content: str = ""):
         # 抖音检索视频 
-        content = msg.content.replace('搜抖音', "").strip()
         if not content:
             return f"1.功能介绍：\n根据【抖音】序号或者名字搜索抖音\n2.调用格式：\n格式1：搜抖音1\n格式2：搜抖音张大仙\n格式3：搜抖音3张大仙\n注：3表示第3页，默认第1页"
         page = 1  # 默认页码为1
         if content.isdigit():
             rank = int(content)
-            if rank in self.douyin_hotlist:
-                keyword = self.douyin_hotlist[rank]
+            douyin_hotlist = self.sessions.of(msg).douyin_hotlist
+            if rank in douyin_hotlist:
+                keyword = douyin_hotlist[rank]
             else:
                 return "请先调用【抖音】，若已抖音请检查序号"
         else:
@@ -984,16 +1215,18 @@ class Robot(Job):
                 # 如果不是数字，整个内容都是关键词
                 keyword = content    
         params = {'keyword':keyword, 'page':page}
-        response = requests.get('https://api.pearktrue.cn/api/dy/search', params = params)
-        data = response.json()
+        response = self.http.get('https://api.pearktrue.cn/api/dy/search', params = params)
+        data = self.http.json(response)
         if data['code'] == 200: 
             print("正在处理搜索结果")                       
             videos = data['data']
             output = f'我为您找到了以下结果：\n'
+            douyin_downloadlink = self.sessions.of(msg).douyin_downloadlink
+            douyin_downloadlink.clear()
             for i, video in enumerate(videos):
                 if i >= 10:  # 一页只有10条，i<=10
                     break
-                self.douyin_downloadlink[i+1] = video["linkurl"]                           
+                douyin_downloadlink[i+1] = video["linkurl"]                           
                 output += f'Top -{video["top"]}-\n'
                 output += f'时间:{video["time"]}\n'
                 output += f'作者:{video["nickname"]}\n'
@@ -1006,49 +1239,48 @@ class Robot(Job):
             output += f'请输入“看抖音+数字”查看视频\n'
             rsp = output
             return rsp
-            print(f"链接获取成功\n{self.douyin_downloadlink}")
+            print(f"链接获取成功\n{douyin_downloadlink}")
         else:
             return None
             print("链接获取失败") 
 
     @add_receiver_info
-    def handle_看抖音(self, msg):
+    def handle_看抖音(self, msg, content: str = ""):
         #抖音解析链接下载视频
-        rank = int(msg.content.replace('看抖音', "").strip())
-        if not rank:
+        if not content.isdigit():
             return f"1.功能介绍：\n根据【搜抖音】序号或名字看抖音\n2.调用格式：\n格式1：看抖音1\n格式2：看抖音懂车帝"
-        if rank in self.douyin_downloadlink:
-            base_url = self.douyin_downloadlink[rank]
+        rank = int(content)
+        douyin_downloadlink = self.sessions.of(msg).douyin_downloadlink
+        if rank in douyin_downloadlink:
+            base_url = douyin_downloadlink[rank]
+            rsp = self.media.lookup(base_url)
+            if rsp:
+                return rsp
             params = {"url":base_url}
             try:
-                response = requests.get('https://api.pearktrue.cn/api/video/douyin', params =params, timeout = 5)
+                response = self.http.get('https://api.pearktrue.cn/api/video/douyin', params =params, timeout = 5)
                 response.raise_for_status()
-                data = json.loads(response.text)
+                data = self.http.json(response)
                 url = data['data']['url']  # Modify this line
-                response = requests.get(url, stream=True, timeout = 5)
-                response.raise_for_status() 
                 print("视频解析成功")               
+                # 流式写入媒体缓存，同一视频链接再次请求时直接使用
+                rsp = self.downloadMedia(url, ".mp4", key=base_url)
             except (requests.RequestException, KeyError, IOError) as e:
                 print("视频下载失败，错误代码:", e)
-
-            # 将数据写入文件
-            with open(r'C:\Users\Raimbault\douyin.mp4', 'wb') as file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    file.write(chunk)
+                return None
             print("视频下载成功")
-            rsp = r"C:\Users\Raimbault\douyin.mp4"
             return rsp
         else:
             return None
             print("输入的排名不存在")
 
     @add_receiver_info
-    def handle_刷抖音(self, msg):
+    def handle_刷抖音(self, msg, content: str = ""):
         #随机获取抖音小姐姐视频
-        response = requests.get('https://v.api.aa1.cn/api/api-girl-11-02/index.php?type=json')
+        response = self.http.get('https://v.api.aa1.cn/api/api-girl-11-02/index.php?type=json')
         if response.status_code == 200:
             print('视频获取成功.')
-            data = json.loads(response.text)
+            data = self.http.json(response)
             relative_url = data.get('mp4', 'Not found')
             rsp = 'https:' + relative_url
             return rsp
@@ -1057,40 +1289,40 @@ class Robot(Job):
             print('视频获取失败')
 
     @add_receiver_info
-    def handle_小姐姐(self, msg):
+    def handle_小姐姐(self, msg, content: str = ""):
         #随机生成小姐姐图片 
         types = 'img'
         mode = 1,3,8 #注意单个数字以逗号结尾，多个数字以逗号分隔，1：微博美女，2：IG图包，3：cos美女，5：Mtcos美女，7：美腿，8：Coser分类，9：兔玩映画
         params = {'type':types, 'mode':mode}
         mode_dict = {1:"微博美女", 2:"IG图包", 3:"Cos美女", 5:"Mtcos美女", 7:"美腿", 8:"Coser分类", 9:"兔玩映画"}
         names = ', '.join(mode_dict[number] for number in mode)
-        response = requests.get('https://3650000.xyz/api', params = params)                        
-        soup = BeautifulSoup(response.content, 'html.parser')                        
+        response = self.http.get('https://3650000.xyz/api', params = params)                        
+        soup = lazy_import("bs4").BeautifulSoup(response.content, 'html.parser')                        
         rsp = [tag.get('src') for tag in soup.find_all(src=True)]
         rsp = rsp[0]
         return rsp
         print("小姐姐来啦")    
 
     @add_receiver_info
-    def handle_百家姓(self, msg):
-        name = msg.content.replace("百家姓", "").strip()
+    def handle_百家姓(self, msg, content: str = ""):
+        name = content
         if not name:
             return f"1.功能介绍：\n查看百家姓排行\n2.调用格式：\n百家姓张"
         url = "https://api.pearktrue.cn/api/bjx"
         params = {"name":name}
         try:
-            response = requests.get(url, params = params, timeout= 5)
+            response = self.http.get(url, params = params, timeout= 5)
             response.raise_for_status()
         except requests.exceptions.RequestException as e:
             return f"视频下载失败，错误代码:{e}"
-        data = response.json()
+        data = self.http.json(response)
         rsp = f"{data['msg']}\n姓氏：{data['name']}\n排名：{data['top']}"
         return rsp
 
     @add_receiver_info
-    def handle_发证书(self, msg):
+    def handle_发证书(self, msg, content: str = ""):
         # 生成证书，title限制6字(超字数无法生成)，text在32字以内显示最佳
-        s = msg.content.replace('发证书', "").strip()
+        s = content
         if not s:
             return f"1.功能介绍：\n生成证书，标题限6字以内\n2.调用格式：\n发证书，颁发[标题]给@[姓名]，[证书正文]"
         match = re.match(".*发(.*)给@([^，]*)\u2005，(.*)", s)
@@ -1098,29 +1330,29 @@ class Robot(Job):
         name = match.group(2)
         text = match.group(3)
         params = {'name': name, 'title': title, 'text': text}
-        response = requests.get('https://api.pearktrue.cn/api/certificate/', params=params)
-        if response.status_code == 200:
-            print("证书生成成功") 
-            with open(r'C:\Users\Raimbault\output_image.jpg', 'wb') as f:
-                f.write(response.content)
+        key = f"发证书-{title}-{name}-{text}"
+        rsp = self.media.lookup(key)
+        if rsp:
+            return rsp
+        try:
+            rsp = self.downloadMedia('https://api.pearktrue.cn/api/certificate/', ".jpg", key=key, params=params)
             print("证书下载成功") 
-            rsp = r"C:\Users\Raimbault\output_image.jpg "
             return rsp                     
-        else:
+        except (requests.RequestException, IOError) as e:
+            print("证书生成失败", e)
             return None
-            print("证书生成失败")
 
     @add_receiver_info
-    def handle_搜题(self, msg):
+    def handle_搜题(self, msg, content: str = ""):
         # 百度搜题
-        question = msg.content.replace('搜题', "").strip()
+        question = content
         if not question:
             return f"1.功能介绍：\n百度教育搜题\n2.调用格式：\n搜题根据契税法律的规定"
         params = {'question':question}
         self.sendTextMsg(f"正在为您查询\n您要找的题目为：\n{question}\n正在查询，请您耐心等待···", msg.roomid)
-        response = requests.get('https://api.pearktrue.cn/api/baidutiku', params = params)
+        response = self.http.get('https://api.pearktrue.cn/api/baidutiku', params = params)
         if response.status_code == 200:
-            data = response.json()
+            data = self.http.json(response)
             question = data["data"]["question"]
             options = data["data"]["options"]
             answer = data["data"]["answer"]
@@ -1134,15 +1366,16 @@ class Robot(Job):
             print("搜题失败")
 
     @add_receiver_info
-    def handle_卡路里(self, msg):
+    @cached_reply(ttl=86400)
+    def handle_卡路里(self, msg, content: str = ""):
         #查询食品所含热量
-        food = msg.content.replace('卡路里', "").strip()
+        food = content
         if not food:
             return f"1.功能介绍：\n查食物热量\n2.调用格式：\n卡路里橘子"
         params = {'food':food}
-        response = requests.get('https://api.pearktrue.cn/api/calories', params = params)
+        response = self.http.get('https://api.pearktrue.cn/api/calories', params = params)
         if response.status_code == 200:
-            data = response.json()
+            data = self.http.json(response)
             foods = data['data']  # 来自请求的食物数据列表
             output = f'查找的食物: {data["food"]}\n共找到 {data["count"]} 类食物\n'
             output += f'食物{food}热量如下：\n'
@@ -1157,9 +1390,10 @@ class Robot(Job):
             print("食物热量查询失败")
 
     @add_receiver_info
-    def handle_查星座(self, msg):
+    @cached_reply(ttl=3600)
+    def handle_查星座(self, msg, content: str = ""):
         # 查询星座运势，支持今日、明日、本周、本月、今年、爱情运势
-        message = msg.content.replace('查星座', "").strip()
+        message = content
         if not message:
             return f"1.功能介绍：\n查星座运势，支持今日、明日、本周、本月、今年、爱情运势\n2.调用格式：\n查星座白羊座今日运势"
         time_dict = {"今日": "today", "明日": "nextday", "本周": "week",
@@ -1171,9 +1405,9 @@ class Robot(Job):
         time = time_dict[message[3:5]]
         xingzuo = xingzuo_dict[message[:3]]
         params = {'time': time, 'type': xingzuo}
-        response = requests.get('https://api.vvhan.com/api/horoscope', params=params)
+        response = self.http.get('https://api.vvhan.com/api/horoscope', params=params)
         if response.status_code == 200:
-            data = json.loads(response.text)
+            data = self.http.json(response)
             if data["success"]:
                 data = data["data"]
                 output = f'以下是查询到的内容：\n\n'
@@ -1208,14 +1442,15 @@ class Robot(Job):
                 print("星座查询失败")
 
     @add_receiver_info
-    def handle_查油价(self, msg):
+    @cached_reply(ttl=3600)
+    def handle_查油价(self, msg, content: str = ""):
         # 查全国油价，格式为：查油价+省份
-        province = msg.content.replace('查油价', "").strip()
+        province = content
         if not province:
             return f"1.功能介绍：\n查各省油价\n2.调用格式：\n查油价江苏"
-        response = requests.get('https://api.pearktrue.cn/api/oil')        
+        response = self.http.get('https://api.pearktrue.cn/api/oil')        
         if response.status_code == 200:
-            data = response.json()
+            data = self.http.json(response)
             prices_info = None            
             for entry in data["data"]:
                 province_entry = entry["province"]                
@@ -1235,15 +1470,15 @@ class Robot(Job):
 
 
     @add_receiver_info
-    def handle_查号码(self, msg):
+    def handle_查号码(self, msg, content: str = ""):
         # 查骚扰电话
-        mobile = msg.content.replace('查号码', "").strip()
+        mobile = content
         if not mobile:
             return f"1.功能介绍：\n查手机号码\n2.调用格式：查号码13500000000"
         params = {'mobile':mobile}
-        response = requests.get('https://api.pearktrue.cn/api/phone', params = params)
+        response = self.http.get('https://api.pearktrue.cn/api/phone', params = params)
         if response.status_code == 200:
-            data = response.json()  # 使用 json() 方法解析返回的 JSON 数据
+            data = self.http.json(response)  # 从字节解析返回的 JSON 数据
             output = f'查询号码: {data["mobile"]}\n'  # 添加手机号码
             output += f'所在省份: {data["info"]["province"]}\n'  # 添加省份
             output += f'所在城市: {data["info"]["city"]}\n'  # 添加城市
@@ -1258,17 +1493,17 @@ class Robot(Job):
             print("号码查询失败")
 
     @add_receiver_info
-    def handle_查天气(self, msg):
+    def handle_查天气(self, msg, content: str = ""):
         # 询问天气，询问格式为：搜天气 河北-唐山
-        city_name = msg.content.replace("查天气", "").strip()
+        city_name = content
         if not city_name:
             return f"1.功能介绍：查询明日天气\n2.调用格式：\n查天气河北-唐山"
         # 获取天气信息
-        rsp = get_weather(city_name)
+        rsp = lazy_import("base.weather").get_weather(city_name)
         return rsp
 
     @add_receiver_info
-    def handle_查功能(self, msg):
+    def handle_查功能(self, msg, content: str = ""):
         commands_list = [f"{i}. {key}" for i, key in enumerate(self.commands.keys(), 1)]
         line_length = 25
         output = ""
@@ -1288,9 +1523,8 @@ class Robot(Job):
         return output
 
     @add_receiver_info
-    def handle_讲述人(self, msg):
+    def handle_讲述人(self, msg, content: str = ""):
         #根据文字生成语音
-        content =  msg.content.replace("讲述人", "").strip()
         if not content:
             return f"1.功能介绍：\n讲述文本，支持1-163号讲述人\n2.调用格式：\n讲述人8，你是一朵盛开的花，在生命中散发着美丽的光芒"
         index, text = content.split("，")
@@ -1300,12 +1534,22 @@ class Robot(Job):
         speaker = name_dict[index]
         info = info_dict[index]
         params = {'speak':speaker, 'text':text}
-        response = requests.get('https://api.pearktrue.cn/api/aivoicenet', params = params)
+        # 同一讲述人讲过的文本直接发送缓存的语音
+        key = tts_key(text, speaker, {'api': 'aivoicenet'})
+        rsp = self.media.lookup(key)
+        if rsp:
+            METRICS.inc("robot_tts_cache_total", result="hit")
+            return rsp
+        METRICS.inc("robot_tts_cache_total", result="miss")
+        response = self.http.get('https://api.pearktrue.cn/api/aivoicenet', params = params)
         if response.status_code == 200:
             print('生成讲述语音成功')
-            data = json.loads(response.text)
-            rsp = [data.get('voiceurl', 'Not found')]
-            rsp = rsp [0]
+            data = self.http.json(response)
+            voiceurl = data.get('voiceurl')
+            if not voiceurl:
+                return None
+            suffix = os.path.splitext(voiceurl.split('?')[0])[1] or ".mp3"
+            rsp = self.downloadMedia(voiceurl, suffix, key=key)
             return rsp
             print('下载讲述语音成功')
         else:
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 群聊中 @某人 后跟 \u2005 或空白，整段去掉
+AT_PATTERN = re.compile(r"@.*?[\u2005|\s]")
+
+_END = ""  # 字典树中标记命令结束的键，命令名不会是空串
+
+
+class CommandRouter(object):
+    """命令路由
+    所有命令名预先编译成字典树，对消息做一次最长前缀匹配，
+    结果与注册顺序无关：“搜抖音”不会被“抖音”抢先匹配。
+    """
+
+    def __init__(self, commands: Optional[Dict[str, Callable]] = None) -> None:
+        self.root: dict = {}
+        self.names: List[str] = []
+        for name, handler in (commands or {}).items():
+            self.register(name, handler)
+
+    def register(self, name: str, handler: Callable) -> None:
+        """注册命令，同名命令会覆盖之前的处理方法"""
+        if not name:
+            raise ValueError("command name must not be empty")
+        node = self.root
+        for ch in name:
+            node = node.setdefault(ch, {})
+        if _END not in node:
+            self.names.append(name)
+        node[_END] = handler
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """去掉 @ 提及和所有空格"""
+        return AT_PATTERN.sub("", text).replace(" ", "")
+
+    def match(self, text: str) -> Optional[Tuple[str, Callable, str]]:
+        """最长前缀匹配
+        :param text: 消息文本
+        :return: (命令名, 处理方法, 参数)，没有匹配的命令时返回 None
+        """
+        text = text.strip()
+        node = self.root
+        found = None
+        for i, ch in enumerate(text):
+            node = node.get(ch)
+            if node is None:
+                break
+            if _END in node:
+                found = (i + 1, node[_END])
+        if found is None:
+            return None
+        end, handler = found
+        return text[:end], handler, text[end:].strip()
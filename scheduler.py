@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import count
+from threading import Condition
+from typing import Any, Callable, List, Optional, Tuple
+
+from job_mgmt import Job
+from metrics import METRICS
+
+
+def job_name(task: Callable[..., Any]) -> str:
+    """任务在日志和指标中的名字，partial 带上参数，如 broadcastReport(news)"""
+    if isinstance(task, partial):
+        args = ", ".join(str(a) for a in task.args)
+        return f"{job_name(task.func)}({args})"
+    return getattr(task, "__name__", repr(task))
+
+
+def next_daily(at: str, after: float) -> float:
+    """after 之后第一次到达本地时间 at（HH:MM 或 HH:MM:SS）的时间戳"""
+    fmt = "%H:%M:%S" if at.count(":") == 2 else "%H:%M"
+    t = datetime.strptime(at, fmt).time()
+    base = datetime.fromtimestamp(after)
+    run = datetime.combine(base.date(), t)
+    if run.timestamp() <= after:
+        run = datetime.combine(base.date() + timedelta(days=1), t)
+    return run.timestamp()
+
+
+class ScheduledJob(object):
+    """一个定时任务：固定间隔（interval 秒）或每天固定时间（at）"""
+    __slots__ = ("name", "task", "interval", "at", "jitter", "deadline", "running", "cancelled")
+
+    def __init__(self, name: str, task: Callable[[], Any], interval: Optional[float] = None,
+                 at: Optional[str] = None, jitter: float = 0) -> None:
+        self.name = name
+        self.task = task
+        self.interval = interval
+        self.at = at
+        self.jitter = jitter
+        self.deadline = 0.0     # 不含抖动的计划时间
+        self.running = False
+        self.cancelled = False
+
+    def following(self, after: float, now: float) -> float:
+        """after 之后的下一次计划时间；落后太多时跳过错过的轮次，不补跑"""
+        if self.at is not None:
+            return next_daily(self.at, max(after, now))
+        deadline = after + self.interval
+        if deadline <= now:
+            deadline += (now - deadline) // self.interval * self.interval + self.interval
+        return deadline
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class Scheduler(object):
+    """按截止时间触发的定时器
+    所有任务按下次运行时间放在一个堆里，调度线程睡到最早的截止时间再醒来，到期的任务交给有界线程池运行，
+    任务之间互不阻塞。同一任务上一次还没结束时跳过本次（计入 skipped）。
+    jitter 为每次运行附加 0~jitter 秒的随机延迟，避免多个任务同时打到上游；计划时间本身不漂移。
+    单次睡眠不超过 max_sleep 秒，系统时间被调整后也能及时按新时间触发。
+    """
+
+    def __init__(self, workers: int = 4, jitter: float = 0, max_sleep: float = 60) -> None:
+        """
+        :param workers: 同时运行的任务数
+        :param jitter: 默认的随机延迟上限（秒）
+        :param max_sleep: 调度线程单次睡眠的上限（秒）
+        """
+        self.LOG = logging.getLogger("Scheduler")
+        self.jitter = jitter
+        self.max_sleep = max_sleep
+        self.heap: List[Tuple[float, int, ScheduledJob]] = []  # (触发时间, 序号, 任务)
+        self.seq = count()
+        self.cond = Condition()
+        self.stopped = False
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Job")
+        METRICS.gauge("robot_jobs_scheduled", lambda: len(self.heap))
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> "Scheduler":
+        conf = conf or {}
+        keys = ("workers", "jitter", "max_sleep")
+        return cls(**{k: conf[k] for k in keys if k in conf})
+
+    def every(self, seconds: float, task: Callable[[], Any], name: Optional[str] = None,
+              jitter: Optional[float] = None) -> ScheduledJob:
+        """每隔 seconds 秒运行一次，第一次在 seconds 秒后"""
+        job = ScheduledJob(name or job_name(task), task, interval=seconds,
+                           jitter=self.jitter if jitter is None else jitter)
+        self._push(job, time.time() + seconds)
+        return job
+
+    def daily(self, at: str, task: Callable[[], Any], name: Optional[str] = None,
+              jitter: Optional[float] = None) -> ScheduledJob:
+        """每天在本地时间 at（HH:MM 或 HH:MM:SS）运行"""
+        job = ScheduledJob(name or job_name(task), task, at=at, jitter=self.jitter if jitter is None else jitter)
+        self._push(job, next_daily(at, time.time()))
+        return job
+
+    def _push(self, job: ScheduledJob, deadline: float) -> None:
+        job.deadline = deadline
+        fire = deadline + (random.uniform(0, job.jitter) if job.jitter > 0 else 0)
+        with self.cond:
+            heapq.heappush(self.heap, (fire, next(self.seq), job))
+            self.cond.notify()
+
+    def run_pending(self) -> int:
+        """运行所有已到期的任务，不等待；返回提交的任务数"""
+        due = []
+        now = time.time()
+        with self.cond:
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap))
+        for fire, _, job in due:
+            if job.cancelled:
+                continue
+            self._push(job, job.following(job.deadline, now))
+            self._dispatch(job, fire)
+        return len(due)
+
+    def run_forever(self) -> None:
+        """阻塞当前线程，睡到下一个截止时间再运行到期的任务，直到 stop"""
+        while True:
+            with self.cond:
+                while not self.stopped:
+                    now = time.time()
+                    if self.heap and self.heap[0][0] <= now:
+                        break
+                    timeout = self.heap[0][0] - now if self.heap else self.max_sleep
+                    self.cond.wait(min(timeout, self.max_sleep))
+                if self.stopped:
+                    return
+            self.run_pending()
+
+    def stop(self) -> None:
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.executor.shutdown(wait=False)
+
+    def _dispatch(self, job: ScheduledJob, fire: float) -> None:
+        with self.cond:
+            if job.running:
+                self.LOG.warning(f"{job.name} is still running, skipped")
+                METRICS.inc("robot_job_runs_total", job=job.name, outcome="skipped")
+                return
+            job.running = True
+        self.executor.submit(self._run, job, fire)
+
+    def _run(self, job: ScheduledJob, fire: float) -> None:
+        METRICS.observe("robot_job_lateness_seconds", max(0.0, time.time() - fire), job=job.name)
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            job.task()
+        except Exception as e:
+            outcome = "error"
+            self.LOG.error(f"{job.name} failed: {e}")
+        finally:
+            with self.cond:
+                job.running = False
+            METRICS.observe("robot_job_seconds", time.perf_counter() - start, job=job.name)
+            METRICS.inc("robot_job_runs_total", job=job.name, outcome=outcome)
+
+
+class DeadlineJob(Job):
+    """Job 的定时接口，改由 Scheduler 按截止时间触发，不再需要每秒轮询 runPendingJobs"""
+
+    def __init__(self, scheduler: Optional[Scheduler] = None) -> None:
+        self.scheduler = scheduler or Scheduler()
+
+    def onEverySeconds(self, seconds: int, task: Callable[..., Any], *args, **kwargs) -> None:
+        self.scheduler.every(seconds, partial(task, *args, **kwargs) if args or kwargs else task)
+
+    def onEveryMinutes(self, minutes: int, task: Callable[..., Any], *args, **kwargs) -> None:
+        self.onEverySeconds(minutes * 60, task, *args, **kwargs)
+
+    def onEveryHours(self, hours: int, task: Callable[..., Any], *args, **kwargs) -> None:
+        self.onEverySeconds(hours * 3600, task, *args, **kwargs)
+
+    def onEveryDays(self, days: int, task: Callable[..., Any], *args, **kwargs) -> None:
+        self.onEverySeconds(days * 86400, task, *args, **kwargs)
+
+    def onEveryTime(self, times, task: Callable[..., Any], *args, **kwargs) -> None:
+        """
+        :param times: 时间字符串或列表，格式 HH:MM 或 HH:MM:SS
+        """
+        times = times if isinstance(times, list) else [times]
+        for t in times:
+            self.scheduler.daily(t, partial(task, *args, **kwargs) if args or kwargs else task)
+
+    def runPendingJobs(self) -> None:
+        self.scheduler.run_pending()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Deque, Dict, Optional
+
+
+class ImageRef(object):
+    """收到的图片消息的引用，【识图】用到时才下载"""
+    __slots__ = ("id", "extra", "ts", "path")
+
+    def __init__(self, id: int, extra: str, ts: int) -> None:
+        self.id = id
+        self.extra = extra
+        self.ts = ts
+        self.path = ""  # 已下载时为本地路径
+
+
+class Session(object):
+    """单个会话（群或私聊）的命令状态"""
+    __slots__ = ("song_list", "douyin_hotlist", "douyin_downloadlink", "images", "expire_at")
+
+    def __init__(self, max_images: int = 5) -> None:
+        self.song_list: Dict[int, str] = {}            # 【搜歌】序号 -> 播放链接
+        self.douyin_hotlist: Dict[int, str] = {}       # 【抖音】序号 -> 话题
+        self.douyin_downloadlink: Dict[int, str] = {}  # 【搜抖音】序号 -> 视频链接
+        self.images: Deque[ImageRef] = deque(maxlen=max_images)  # 最近的图片，最新的在右端
+        self.expire_at: float = 0.0
+
+    def add_image(self, msg) -> None:
+        """只记录图片消息的引用，不下载"""
+        self.images.append(ImageRef(msg.id, msg.extra, getattr(msg, "ts", 0)))
+
+
+class SessionStore(object):
+    """按会话隔离的状态存储
+    每个会话闲置超过 ttl 后过期；会话总数超过 max_sessions 时淘汰最久未使用的。
+    """
+
+    def __init__(self, ttl: float = 1800, max_sessions: int = 5000, max_images: int = 5) -> None:
+        """
+        :param ttl: 会话闲置过期时间（秒）
+        :param max_sessions: 最多保留的会话数
+        :param max_images: 每个会话记录的最近图片数
+        """
+        self.ttl = ttl
+        self.max_sessions = max(1, int(max_sessions))
+        self.max_images = max(1, int(max_images))
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.lock = Lock()
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> "SessionStore":
+        conf = conf or {}
+        return cls(conf.get("ttl", 1800), conf.get("max_sessions", 5000), conf.get("max_images", 5))
+
+    @staticmethod
+    def key_of(msg) -> str:
+        return msg.roomid if msg.roomid else msg.sender
+
+    def of(self, msg) -> Session:
+        """取消息所在会话的状态，不存在或已过期时新建"""
+        return self.get(self.key_of(msg))
+
+    def get(self, key: str) -> Session:
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None or session.expire_at <= now:
+                session = Session(self.max_images)
+                self.sessions[key] = session
+            self.sessions.move_to_end(key)
+            session.expire_at = now + self.ttl
+            self._evict(now)
+            return session
+
+    def _evict(self, now: float) -> None:
+        # 最久未使用的在最前面，过期的和超出上限的都从头部淘汰
+        while self.sessions:
+            key, session = next(iter(self.sessions.items()))
+            if len(self.sessions) <= self.max_sessions and session.expire_at > now:
+                break
+            del self.sessions[key]
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self.sessions)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call(object):
+    """一次正在进行的调用，后到的相同调用等待它的结果"""
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight(object):
+    """合并同时进行的相同调用
+    同一个 key 在第一个调用返回之前到来的调用不再重复执行，直接共享第一个调用的结果或异常。
+    调用返回后立即移除，不做缓存；需要缓存的命令仍由 ReplyCache 负责。
+    """
+
+    def __init__(self) -> None:
+        self.calls: Dict[Hashable, _Call] = {}
+        self.lock = Lock()
+        self.executed = 0   # 实际执行的次数
+        self.coalesced = 0  # 被合并、没有实际执行的次数
+
+    def do(self, key: Hashable, fn: Callable[[], Any], on_coalesced: Optional[Callable[[], None]] = None) -> Any:
+        """
+        :param key: 调用的标识，相同 key 视为相同调用
+        :param fn: 实际执行的无参调用
+        :param on_coalesced: 本次调用被合并时的回调，用于计数
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = _Call()
+                leader = True
+                self.executed += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self.coalesced += 1
+        if not leader:
+            if on_coalesced is not None:
+                on_coalesced()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {"executed": self.executed, "coalesced": self.coalesced, "inflight": len(self.calls)}
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+from threading import Lock
+from types import ModuleType
+from typing import Iterator, List, Tuple
+
+
+class StartupTimer(object):
+    """记录启动过程中各组件的导入和初始化耗时"""
+
+    def __init__(self) -> None:
+        self.records: List[Tuple[str, float]] = []
+        self.lock = Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self.lock:
+            self.records.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self) -> str:
+        """按耗时从高到低列出各组件"""
+        with self.lock:
+            records = sorted(self.records, key=lambda r: r[1], reverse=True)
+        total = sum(seconds for _, seconds in records)
+        lines = [f"启动耗时 {total * 1000:.1f} ms："]
+        lines += [f"  {name}: {seconds * 1000:.1f} ms" for name, seconds in records]
+        return "\n".join(lines)
+
+
+STARTUP = StartupTimer()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """首次用到时才导入模块，并把导入耗时记入 STARTUP"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with STARTUP.phase(f"import {name}"):
+        return importlib.import_module(name)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from collections import Counter
+from threading import Lock
+
+from broadcast import BroadcastReport, Broadcaster
+from outbox import Outbox
+
+
+class SlowReceiverTest(unittest.TestCase):
+    """送达超时的接收者在下一轮重试时不能收到重复的推送"""
+
+    def setUp(self) -> None:
+        self.delivered = Counter()
+        self.lock = Lock()
+
+    def deliver(self, msg: dict) -> None:
+        if msg["receiver"] == "slow":
+            time.sleep(0.5)
+        with self.lock:
+            self.delivered[msg["receiver"]] += 1
+
+    def broadcast(self, outbox: Outbox, receivers, timeout: float = 0.1, retry_delay: float = 0) -> BroadcastReport:
+        send = lambda content, r: outbox.put(r, {"receiver": r, "content": content})
+        broadcaster = Broadcaster(send, interval=0, retries=2, retry_delay=retry_delay, timeout=timeout)
+        report = broadcaster.broadcast("news", lambda: "早报", receivers)
+        time.sleep(1)  # 等仍在发送的消息结束
+        return report
+
+    def test_sending_receiver_not_resent(self) -> None:
+        report = self.broadcast(Outbox(self.deliver, rate=100, workers=2), ["slow", "fast"])
+        self.assertEqual(self.delivered, Counter({"slow": 1, "fast": 1}))
+        # 超时的那次发送最终送达，记为成功而不是失败
+        self.assertEqual(set(report.latency), {"slow", "fast"})
+        self.assertEqual(report.failed, {})
+
+    def test_queued_receiver_not_resent(self) -> None:
+        # 只有一个发送线程：fast 已交给发送线程，排在 slow 之后，每轮超时时还没发出
+        outbox = Outbox(self.deliver, rate=100, workers=1)
+        report = self.broadcast(outbox, ["slow", "fast"])
+        self.assertEqual(self.delivered, Counter({"slow": 1, "fast": 1}))
+        self.assertEqual(set(report.latency), {"slow", "fast"})
+
+    def test_rate_limited_receiver_retried_once(self) -> None:
+        # 令牌已用完，第一轮的推送在发送队列里等到超时被撤回；第二轮令牌已恢复，重发送达，共送达一次
+        outbox = Outbox(self.deliver, rate=2, burst=1, workers=2)
+        outbox.put("fast", {"receiver": "fast", "content": "占用令牌"})
+        report = self.broadcast(outbox, ["fast"], timeout=0.2, retry_delay=0.3)
+        self.assertEqual(self.delivered["fast"], 2)  # 占用令牌的一条 + 推送一条
+        self.assertEqual(report.attempts, 2)
+        self.assertIn("fast", report.latency)
+        self.assertEqual(report.failed, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
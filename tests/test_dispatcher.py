@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from collections import defaultdict
+from threading import Event, Lock
+
+from dispatcher import MsgDispatcher
+
+
+class Msg(object):
+    def __init__(self, roomid: str, sender: str, seq: int) -> None:
+        self.roomid = roomid
+        self.sender = sender
+        self.seq = seq
+
+
+class ConversationOrderTest(unittest.TestCase):
+    """同一会话的消息按投递顺序逐条处理，慢会话不挡住其他会话"""
+
+    def setUp(self) -> None:
+        self.lock = Lock()
+        self.handled = defaultdict(list)
+        self.running = defaultdict(int)
+        self.overlapped = False
+
+    def handle(self, msg: Msg) -> None:
+        key = MsgDispatcher.conversation_key(msg)
+        with self.lock:
+            self.running[key] += 1
+            self.overlapped = self.overlapped or self.running[key] > 1
+        time.sleep(0.002)
+        with self.lock:
+            self.handled[key].append(msg.seq)
+            self.running[key] -= 1
+
+    def test_order_kept_per_conversation(self) -> None:
+        dispatcher = MsgDispatcher(self.handle, workers=8)
+        dispatcher.start()
+        for seq in range(30):
+            dispatcher.submit(Msg("room", "a", seq))
+            dispatcher.submit(Msg("", "wxid_b", seq))
+        dispatcher.stop(timeout=5)
+        self.assertEqual(self.handled["room"], list(range(30)))
+        self.assertEqual(self.handled["wxid_b"], list(range(30)))
+        self.assertFalse(self.overlapped)
+        self.assertEqual(dispatcher.qsize(), 0)
+
+    def test_slow_conversation_does_not_block_others(self) -> None:
+        release = Event()
+        done = Event()
+
+        def handle(msg: Msg) -> None:
+            if msg.roomid == "slow":
+                release.wait(5)
+            else:
+                done.set()
+
+        dispatcher = MsgDispatcher(handle, workers=2)
+        dispatcher.start()
+        dispatcher.submit(Msg("slow", "a", 0))
+        dispatcher.submit(Msg("slow", "a", 1))
+        dispatcher.submit(Msg("fast", "b", 0))
+        self.assertTrue(done.wait(1))
+        release.set()
+        dispatcher.stop(timeout=5)
+
+    def test_handler_error_releases_conversation(self) -> None:
+        handled = []
+
+        def handle(msg: Msg) -> None:
+            if msg.seq == 0:
+                raise RuntimeError("boom")
+            handled.append(msg.seq)
+
+        dispatcher = MsgDispatcher(handle, workers=2)
+        dispatcher.start()
+        for seq in range(3):
+            dispatcher.submit(Msg("room", "a", seq))
+        dispatcher.stop(timeout=5)
+        self.assertEqual(handled, [1, 2])
+
+    def test_submit_times_out_when_full(self) -> None:
+        release = Event()
+        dispatcher = MsgDispatcher(lambda msg: release.wait(5), workers=1, queue_size=1)
+        dispatcher.start()
+        self.assertTrue(dispatcher.submit(Msg("room", "a", 0)))
+        self.assertFalse(dispatcher.submit(Msg("room", "a", 1), timeout=0.05))
+        release.set()
+        dispatcher.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from memory import SUMMARY_PREFIX, ConversationMemory, estimate_tokens
+
+
+class ConversationMemoryTest(unittest.TestCase):
+    """会话按 token 预算保留最近的对话，超出的压缩成摘要，过期和超出总预算的会话被淘汰"""
+
+    def test_messages_in_order(self) -> None:
+        memory = ConversationMemory()
+        memory.append("wxid_a", "user", "你好")
+        memory.append("wxid_a", "assistant", "你好！")
+        self.assertEqual(memory.messages("wxid_a"), [{"role": "user", "content": "你好"},
+                                                     {"role": "assistant", "content": "你好！"}])
+        self.assertEqual(memory.messages("wxid_b"), [])
+
+    def test_old_turns_compacted_into_summary(self) -> None:
+        memory = ConversationMemory(max_tokens=100, summary_tokens=50, summary_chars=5)
+        for i in range(10):
+            memory.append("wxid_a", "user", f"第{i}个问题" + "很长" * 10)
+        messages = memory.messages("wxid_a")
+        self.assertEqual(messages[0]["role"], "system")
+        self.assertTrue(messages[0]["content"].startswith(SUMMARY_PREFIX))
+        self.assertEqual(messages[-1]["content"], "第9个问题" + "很长" * 10)
+        self.assertLessEqual(memory.stats()["tokens"], 100)
+        summary = messages[0]["content"][len(SUMMARY_PREFIX):]
+        self.assertLessEqual(sum(estimate_tokens(s) for s in summary.split("\n")), 50)
+
+    def test_latest_turn_kept_over_budget(self) -> None:
+        memory = ConversationMemory(max_tokens=10)
+        memory.append("wxid_a", "user", "长" * 50)
+        self.assertEqual(memory.messages("wxid_a"), [{"role": "user", "content": "长" * 50}])
+
+    def test_total_budget_evicts_least_recently_used(self) -> None:
+        memory = ConversationMemory(max_total_tokens=100)
+        evicted = []
+        memory.on_evict = evicted.append
+        memory.append("wxid_a", "user", "甲" * 40)
+        memory.append("wxid_b", "user", "乙" * 40)
+        memory.append("wxid_a", "user", "嗯")
+        memory.append("wxid_c", "user", "丙" * 40)
+        self.assertEqual(evicted, ["wxid_b"])
+        self.assertEqual(memory.messages("wxid_b"), [])
+        self.assertEqual(len(memory), 2)
+
+    def test_idle_session_expires(self) -> None:
+        memory = ConversationMemory(ttl=0.05)
+        memory.append("wxid_a", "user", "你好")
+        time.sleep(0.1)
+        self.assertEqual(memory.messages("wxid_a"), [])
+        self.assertEqual(memory.stats(), {"sessions": 0, "tokens": 0})
+
+    def test_forget(self) -> None:
+        memory = ConversationMemory()
+        memory.append("wxid_a", "user", "你好")
+        memory.forget("wxid_a")
+        self.assertEqual(memory.messages("wxid_a"), [])
+        self.assertEqual(memory.stats()["tokens"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
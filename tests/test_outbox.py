@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from threading import Event, Lock
+
+from outbox import Outbox
+
+
+def merge_text(a: dict, b: dict):
+    if a["receiver"] != b["receiver"]:
+        return None
+    return {"receiver": a["receiver"], "content": a["content"] + "\n" + b["content"]}
+
+
+class OutboxTest(unittest.TestCase):
+    """按接收者的令牌桶限速、顺序发送和合并"""
+
+    def setUp(self) -> None:
+        self.lock = Lock()
+        self.sent = []
+
+    def deliver(self, msg: dict) -> str:
+        with self.lock:
+            self.sent.append((time.monotonic(), msg["receiver"], msg["content"]))
+        return msg["content"]
+
+    def test_burst_then_paced_by_rate(self) -> None:
+        outbox = Outbox(self.deliver, rate=10, burst=2, workers=2)
+        start = time.monotonic()
+        futures = [outbox.put("a", {"receiver": "a", "content": str(i)}) for i in range(5)]
+        for f in futures:
+            f.result(timeout=2)
+        times = [t - start for t, _, _ in self.sent]
+        # 前两条用突发额度立即发出，之后每 0.1 秒一条
+        self.assertLess(times[1], 0.05)
+        self.assertGreaterEqual(times[4], 0.25)
+        self.assertEqual([c for _, _, c in self.sent], ["0", "1", "2", "3", "4"])
+
+    def test_receivers_paced_independently(self) -> None:
+        outbox = Outbox(self.deliver, rate=1, burst=1, workers=2)
+        outbox.put("a", {"receiver": "a", "content": "a0"})
+        slow = outbox.put("a", {"receiver": "a", "content": "a1"})
+        fast = outbox.put("b", {"receiver": "b", "content": "b0"})
+        self.assertEqual(fast.result(timeout=0.5), "b0")
+        self.assertFalse(slow.done())
+        self.assertEqual(slow.result(timeout=2), "a1")
+
+    def test_coalesce_within_window(self) -> None:
+        outbox = Outbox(self.deliver, rate=10, burst=5, coalesce_window=0.1, merge=merge_text)
+        futures = [outbox.put("a", {"receiver": "a", "content": str(i)}) for i in range(3)]
+        results = [f.result(timeout=2) for f in futures]
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(results, ["0\n1\n2"] * 3)
+        self.assertEqual(outbox.coalesced, 2)
+
+    def test_cancel_while_queued(self) -> None:
+        outbox = Outbox(self.deliver, rate=5, burst=1)
+        outbox.put("a", {"receiver": "a", "content": "0"}).result(timeout=1)
+        queued = outbox.put("a", {"receiver": "a", "content": "1"})
+        self.assertTrue(queued.cancel())
+        time.sleep(0.4)
+        self.assertEqual([c for _, _, c in self.sent], ["0"])
+        self.assertEqual(outbox.depth(), 0)
+
+    def test_cannot_cancel_while_sending(self) -> None:
+        started, release = Event(), Event()
+
+        def deliver(msg: dict) -> None:
+            started.set()
+            release.wait(2)
+
+        outbox = Outbox(deliver)
+        future = outbox.put("a", {"receiver": "a", "content": "0"})
+        self.assertTrue(started.wait(1))
+        self.assertFalse(future.cancel())
+        release.set()
+        self.assertIsNone(future.result(timeout=1))
+
+    def test_delivery_error_reaches_future(self) -> None:
+        def deliver(msg: dict) -> None:
+            raise RuntimeError("offline")
+
+        outbox = Outbox(deliver)
+        with self.assertRaises(RuntimeError):
+            outbox.put("a", {"receiver": "a", "content": "0"}).result(timeout=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
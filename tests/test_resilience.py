@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, HostPolicy, Resilience
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    """连续失败后打开熔断器，reset_timeout 后半开放行一个探测请求"""
+
+    def setUp(self) -> None:
+        self.resilience = Resilience(HostPolicy(failure_threshold=3, reset_timeout=0.2, deadline=1))
+        self.calls = 0
+
+    def send(self, status: int):
+        def call() -> int:
+            self.calls += 1
+            return status
+        return call
+
+    def call(self, status: int) -> int:
+        return self.resilience.call("api", self.send(status), lambda s: s >= 500)
+
+    def trip(self) -> None:
+        for _ in range(3):
+            self.call(503)
+
+    def test_opens_after_threshold(self) -> None:
+        self.call(503)
+        self.call(503)
+        self.assertEqual(self.resilience.breaker("api").state, CLOSED)
+        self.call(503)
+        self.assertEqual(self.resilience.breaker("api").state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.call(200)
+        self.assertEqual(self.calls, 3)  # 打开期间请求没有发出
+
+    def test_success_resets_failure_count(self) -> None:
+        self.call(503)
+        self.call(503)
+        self.call(200)
+        self.call(503)
+        self.call(503)
+        self.assertEqual(self.resilience.breaker("api").state, CLOSED)
+
+    def test_exception_counts_as_failure(self) -> None:
+        def boom() -> None:
+            raise ConnectionError("refused")
+
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                self.resilience.call("api", boom, lambda r: False)
+        self.assertEqual(self.resilience.breaker("api").state, OPEN)
+
+    def test_half_open_probe_closes(self) -> None:
+        self.trip()
+        time.sleep(0.25)
+        self.assertEqual(self.call(200), 200)
+        self.assertEqual(self.resilience.breaker("api").state, CLOSED)
+
+    def test_half_open_probe_failure_reopens(self) -> None:
+        self.trip()
+        time.sleep(0.25)
+        self.call(503)
+        breaker = self.resilience.breaker("api")
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.call(200)
+
+    def test_half_open_allows_single_probe(self) -> None:
+        self.trip()
+        time.sleep(0.25)
+        breaker = self.resilience.breaker("api")
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_hosts_are_independent(self) -> None:
+        self.trip()
+        self.assertEqual(self.resilience.call("other", self.send(200), lambda s: s >= 500), 200)
+
+    def test_deadline_exceeded(self) -> None:
+        resilience = Resilience(HostPolicy(failure_threshold=1, deadline=0.1))
+        with self.assertRaises(TimeoutError):
+            resilience.call("slow", lambda: time.sleep(0.5), lambda r: False)
+        self.assertEqual(resilience.breaker("slow").state, OPEN)
+
+
+if __name__ == "__main__":
+    unittest.main()
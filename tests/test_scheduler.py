@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from datetime import datetime
+from threading import Event, Lock, Thread
+
+try:
+    import scheduler
+    from scheduler import ScheduledJob, Scheduler, next_daily
+except ImportError:  # scheduler 依赖 job_mgmt
+    scheduler = None
+
+
+@unittest.skipIf(scheduler is None, "job_mgmt is not available")
+class SchedulerTest(unittest.TestCase):
+    """定时器堆按截止时间触发，取消的任务不再运行"""
+
+    def setUp(self) -> None:
+        self.lock = Lock()
+        self.runs = []
+        self.scheduler = Scheduler(workers=2, max_sleep=0.05)
+        self.thread = Thread(target=self.scheduler.run_forever, daemon=True)
+
+    def tearDown(self) -> None:
+        self.scheduler.stop()
+        if self.thread.is_alive():
+            self.thread.join(1)
+
+    def task(self, name: str):
+        def run() -> None:
+            with self.lock:
+                self.runs.append(name)
+        run.__name__ = name
+        return run
+
+    def test_fires_in_deadline_order(self) -> None:
+        self.scheduler.every(0.15, self.task("c"))
+        self.scheduler.every(0.05, self.task("a"))
+        self.scheduler.every(0.1, self.task("b"))
+        self.thread.start()
+        time.sleep(0.17)
+        firsts = [name for i, name in enumerate(self.runs) if name not in self.runs[:i]]
+        self.assertEqual(firsts, ["a", "b", "c"])
+        self.assertEqual(self.runs[:2], ["a", "a"])
+
+    def test_cancelled_job_not_run(self) -> None:
+        job = self.scheduler.every(0.05, self.task("a"))
+        self.scheduler.every(0.05, self.task("b"))
+        job.cancel()
+        self.thread.start()
+        time.sleep(0.2)
+        self.assertNotIn("a", self.runs)
+        self.assertIn("b", self.runs)
+        self.assertEqual(len(self.scheduler.heap), 1)
+
+    def test_job_still_running_skipped(self) -> None:
+        release = Event()
+        started = []
+
+        def slow() -> None:
+            started.append(1)
+            release.wait(1)
+
+        self.scheduler.every(0.02, slow)
+        self.thread.start()
+        time.sleep(0.15)
+        release.set()
+        self.assertEqual(len(started), 1)
+
+    def test_run_pending_only_due_jobs(self) -> None:
+        self.scheduler.every(0.01, self.task("due"))
+        self.scheduler.every(10, self.task("later"))
+        time.sleep(0.02)
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.scheduler.executor.shutdown(wait=True)
+        self.assertEqual(self.runs, ["due"])
+
+
+@unittest.skipIf(scheduler is None, "job_mgmt is not available")
+class DeadlineTest(unittest.TestCase):
+    """下次计划时间的计算"""
+
+    def test_next_daily(self) -> None:
+        after = datetime(2024, 5, 1, 8, 0).timestamp()
+        self.assertEqual(next_daily("07:30", after), datetime(2024, 5, 2, 7, 30).timestamp())
+        self.assertEqual(next_daily("08:00:30", after), datetime(2024, 5, 1, 8, 0, 30).timestamp())
+
+    def test_missed_rounds_skipped(self) -> None:
+        job = ScheduledJob("a", lambda: None, interval=10)
+        self.assertEqual(job.following(100, 105), 110)
+        self.assertEqual(job.following(100, 135), 140)  # 落后时不补跑错过的轮次
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from session import SessionStore
+
+
+class Msg(object):
+    def __init__(self, id: int, roomid: str = "", sender: str = "wxid_a", ts: int = 0) -> None:
+        self.id = id
+        self.extra = f"/tmp/{id}.dat"
+        self.roomid = roomid
+        self.sender = sender
+        self.ts = ts
+
+
+class SessionStoreTest(unittest.TestCase):
+    """按会话隔离的命令状态和图片引用"""
+
+    def test_images_recorded_per_conversation(self) -> None:
+        store = SessionStore()
+        store.of(Msg(1, roomid="room")).add_image(Msg(1, roomid="room"))
+        store.of(Msg(2)).add_image(Msg(2))
+        self.assertEqual([ref.id for ref in store.get("room").images], [1])
+        self.assertEqual([ref.id for ref in store.get("wxid_a").images], [2])
+
+    def test_only_latest_images_kept(self) -> None:
+        store = SessionStore(max_images=3)
+        session = store.get("room")
+        for i in range(5):
+            session.add_image(Msg(i, roomid="room", ts=i))
+        refs = list(store.get("room").images)
+        self.assertEqual([ref.id for ref in refs], [2, 3, 4])
+        self.assertEqual([ref.ts for ref in refs], [2, 3, 4])
+        self.assertEqual(refs[-1].extra, "/tmp/4.dat")
+        self.assertEqual(refs[-1].path, "")  # 只记录引用，没有下载
+
+    def test_idle_session_expires(self) -> None:
+        store = SessionStore(ttl=0.05)
+        store.get("room").add_image(Msg(1, roomid="room"))
+        time.sleep(0.1)
+        self.assertEqual(len(store.get("room").images), 0)
+
+    def test_least_recently_used_evicted(self) -> None:
+        store = SessionStore(max_sessions=2)
+        store.get("a").song_list[1] = "url"
+        store.get("b")
+        store.get("a")
+        store.get("c")
+        self.assertEqual(list(store.sessions), ["a", "c"])
+        self.assertEqual(store.get("a").song_list, {1: "url"})
+        self.assertEqual(store.evictions, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+from singleflight import SingleFlight
+
+
+class SingleFlightTest(unittest.TestCase):
+    """同时到来的相同调用只执行一次，共享结果或异常"""
+
+    def setUp(self) -> None:
+        self.flight = SingleFlight()
+        self.release = Event()
+        self.runs = 0
+
+    def slow(self, value):
+        def fn():
+            self.runs += 1
+            self.release.wait(2)
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return fn
+
+    def run_concurrently(self, key, value, callers: int = 5):
+        coalesced = Event()
+        count = []
+
+        def on_coalesced() -> None:
+            count.append(1)
+            if len(count) == callers - 1:
+                coalesced.set()
+
+        with ThreadPoolExecutor(max_workers=callers) as pool:
+            futures = [pool.submit(self.flight.do, key, self.slow(value), on_coalesced) for _ in range(callers)]
+            self.assertTrue(coalesced.wait(2))
+            self.release.set()
+            return [f.exception() or f.result() for f in futures]
+
+    def test_concurrent_callers_share_one_call(self) -> None:
+        results = self.run_concurrently("天气", "晴")
+        self.assertEqual(results, ["晴"] * 5)
+        self.assertEqual(self.runs, 1)
+        self.assertEqual(self.flight.stats(), {"executed": 1, "coalesced": 4, "inflight": 0})
+
+    def test_error_shared_by_waiters(self) -> None:
+        error = RuntimeError("upstream down")
+        results = self.run_concurrently("天气", error)
+        self.assertEqual(results, [error] * 5)
+        self.assertEqual(self.runs, 1)
+
+    def test_sequential_calls_not_cached(self) -> None:
+        self.release.set()
+        self.assertEqual(self.flight.do("k", self.slow(1)), 1)
+        self.assertEqual(self.flight.do("k", self.slow(2)), 2)
+        self.assertEqual(self.runs, 2)
+
+    def test_different_keys_run_separately(self) -> None:
+        self.release.set()
+        self.flight.do("a", self.slow(1))
+        self.flight.do("b", self.slow(2))
+        self.assertEqual(self.flight.stats()["coalesced"], 0)
+        self.assertEqual(self.runs, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
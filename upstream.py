@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import time
+from typing import Any, BinaryIO, Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+from resilience import CircuitOpenError, Resilience
+from singleflight import SingleFlight
+
+
+class DownloadError(IOError):
+    """下载超过大小上限或总时长期限"""
+
+
+class DownloadResult(NamedTuple):
+    size: int        # 字节数
+    elapsed: float   # 耗时（秒）
+
+    @property
+    def throughput(self) -> float:
+        """平均速度（字节/秒）"""
+        return self.size / self.elapsed if self.elapsed > 0 else float(self.size)
+
+
+class HttpClient(object):
+    """所有上游 API 共用的 HTTP 客户端
+    基于 requests.Session：同一主机复用 keep-alive 连接，避免每条命令都重新 TCP+TLS 握手。
+    连接池由 urllib3 PoolManager 按主机维护，可被多个线程同时使用。
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 20,
+                 connect_timeout: float = 3.05, read_timeout: float = 10, retries: int = 0,
+                 max_download_bytes: int = 64 * 1024 * 1024, download_deadline: float = 60,
+                 rewrite: Optional[Dict[str, str]] = None, resilience: Optional[Resilience] = None,
+                 coalesce: bool = True) -> None:
+        """
+        :param pool_connections: 缓存的主机连接池数量
+        :param pool_maxsize: 每个主机连接池的最大连接数，应不小于并发处理消息的线程数
+        :param connect_timeout: 默认连接超时（秒）
+        :param read_timeout: 默认读取超时（秒）
+        :param retries: 连接失败时的重试次数
+        :param max_download_bytes: 默认下载大小上限（字节）
+        :param download_deadline: 默认下载总时长期限（秒）
+        :param rewrite: 请求前替换的源站，如 {"https://api.pearktrue.cn": "http://127.0.0.1:8765"}，用于压测或调试
+        :param resilience: 按主机的超时、熔断和对冲设置，默认每个主机使用上面的超时
+        :param coalesce: 是否合并同时进行的相同 GET 请求
+        """
+        self.LOG = logging.getLogger("HttpClient")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_download_bytes = max_download_bytes
+        self.download_deadline = download_deadline
+        self.rewrite = {k.rstrip("/"): v.rstrip("/") for k, v in (rewrite or {}).items()}
+        self.resilience = resilience or Resilience.from_config(None, connect_timeout, read_timeout)
+        self.coalesce = coalesce
+        self.flights = SingleFlight()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              max_retries=retries, pool_block=False)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @classmethod
+    def from_config(cls, conf: Optional[dict]) -> "HttpClient":
+        """根据配置中的 HTTP 节创建客户端，未配置的项使用默认值"""
+        conf = conf or {}
+        keys = ("pool_connections", "pool_maxsize", "connect_timeout", "read_timeout", "retries",
+                "max_download_bytes", "download_deadline", "rewrite", "coalesce")
+        kwargs = {k: conf[k] for k in keys if k in conf}
+        kwargs["resilience"] = Resilience.from_config(conf, conf.get("connect_timeout", 3.05), conf.get("read_timeout", 10))
+        return cls(**kwargs)
+
+    def rewrite_url(self, url: str) -> str:
+        """按 rewrite 配置替换 url 的源站，未配置时原样返回"""
+        if not self.rewrite:
+            return url
+        parts = urlsplit(url)
+        target = self.rewrite.get(f"{parts.scheme}://{parts.netloc}")
+        if target is None:
+            return url
+        return target + url[len(parts.scheme) + 3 + len(parts.netloc):]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """按主机套用超时和熔断；未指定 timeout 时使用该主机的设置
+        熔断器打开时抛出 CircuitOpenError，连接失败、超时和 5xx 计为该主机的故障。
+        """
+        host = urlsplit(url).netloc
+        kwargs.setdefault("timeout", self.resilience.policy(host).timeout)
+        target = self.rewrite_url(url)
+        hedge = method == "GET" and not kwargs.get("stream")
+        start = time.perf_counter()
+        try:
+            response = self.resilience.call(host, lambda: self.session.request(method, target, **kwargs),
+                                            lambda r: r.status_code >= 500, hedge)
+        except CircuitOpenError:
+            raise  # 请求未发出，已由 Resilience 计数
+        except Exception as e:
+            METRICS.upstream(host, time.perf_counter() - start, "error")
+            if isinstance(e, TimeoutError):
+                raise requests.Timeout(str(e)) from e
+            raise
+        METRICS.upstream(host, time.perf_counter() - start, str(response.status_code))
+        return response
+
+    @staticmethod
+    def params_key(params: Any) -> str:
+        """查询参数的规范形式，参数顺序不同视为相同请求"""
+        if isinstance(params, dict):
+            return repr(sorted(params.items()))
+        return repr(params)
+
+    def get(self, url: str, params: Optional[dict] = None, **kwargs) -> requests.Response:
+        """GET 请求；同时进行的相同请求（url、参数和超时都相同）只发一次，所有调用方共享同一个响应
+        非流式响应在返回前已读完响应体，可被多个线程同时读取；流式下载和带其他参数的请求不合并。
+        """
+        if not self.coalesce or set(kwargs) - {"timeout"}:
+            return self.request("GET", url, params=params, **kwargs)
+        key = (url, self.params_key(params), repr(kwargs.get("timeout")))
+        start = time.perf_counter()
+        coalesced = []
+        response = self.flights.do(key, lambda: self.request("GET", url, params=params, **kwargs),
+                                   lambda: coalesced.append(True))
+        if coalesced:
+            METRICS.inc("robot_upstream_coalesced_total", host=urlsplit(url).netloc)
+            METRICS.add_upstream_time(time.perf_counter() - start)
+        return response
+
+    def post(self, url: str, data: Any = None, **kwargs) -> requests.Response:
+        return self.request("POST", url, data=data, **kwargs)
+
+    @staticmethod
+    def json_bytes(data: bytes) -> Any:
+        return json.loads(data)
+
+    @staticmethod
+    def json(response: requests.Response) -> Any:
+        """直接从字节解析 JSON，跳过 response.text 的编码探测和解码"""
+        return json.loads(response.content)
+
+    def get_json(self, url: str, params: Optional[dict] = None, **kwargs) -> Any:
+        response = self.get(url, params=params, **kwargs)
+        response.raise_for_status()
+        return self.json(response)
+
+    def download(self, url: str, dest: BinaryIO, params: Optional[dict] = None,
+                 max_bytes: Optional[int] = None, deadline: Optional[float] = None,
+                 chunk_size: int = 64 * 1024) -> DownloadResult:
+        """流式下载，数据分块直接写入 dest，内存占用与文件大小无关
+        :param dest: 可写对象，如打开的文件或 MediaCache.writer()
+        :param max_bytes: 大小上限，超过时抛出 DownloadError
+        :param deadline: 从发起请求到下载完成的总时长期限（秒），超过时抛出 DownloadError
+        """
+        max_bytes = self.max_download_bytes if max_bytes is None else max_bytes
+        deadline = self.download_deadline if deadline is None else deadline
+        start = time.monotonic()
+        size = 0
+        with self.get(url, params=params, stream=True) as response:
+            body_start = time.perf_counter()
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise DownloadError(f"{url} is {length} bytes, limit is {max_bytes}")
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise DownloadError(f"{url} exceeds {max_bytes} bytes")
+                if time.monotonic() - start > deadline:
+                    raise DownloadError(f"{url} exceeds deadline of {deadline}s")
+                dest.write(chunk)
+            METRICS.add_upstream_time(time.perf_counter() - body_start)
+        result = DownloadResult(size, time.monotonic() - start)
+        self.LOG.info(f"Downloaded {url}: {size} bytes in {result.elapsed:.2f}s, {result.throughput / 1024:.1f} KB/s")
+        return result
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import shutil
+import subprocess
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import BoundedSemaphore
+from typing import Any, Callable, List, Optional, Sequence
+
+from metrics import METRICS, timed
+from resilience import CircuitOpenError
+
+
+def tts_key(text: str, speaker: str, params: Optional[dict] = None) -> str:
+    """语音合成结果在媒体缓存中的键：同样的文本、讲述人和参数得到同样的语音"""
+    raw = repr((text, speaker, sorted((params or {}).items())))
+    return "tts-" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class Transcoder(object):
+    """用 ffmpeg 子进程在本地转码音频，结果写入媒体缓存
+    同时运行的 ffmpeg 进程数受 max_procs 限制；未安装 ffmpeg 或转码失败时返回原文件。
+    """
+
+    def __init__(self, media, ffmpeg: str = "ffmpeg", max_procs: int = 2, timeout: float = 30) -> None:
+        """
+        :param media: MediaCache 实例
+        :param ffmpeg: ffmpeg 可执行文件
+        :param max_procs: 同时运行的 ffmpeg 进程数
+        :param timeout: 单次转码的期限（秒）
+        """
+        self.LOG = logging.getLogger("Transcoder")
+        self.media = media
+        self.ffmpeg = shutil.which(ffmpeg)
+        self.slots = BoundedSemaphore(max(1, max_procs))
+        self.timeout = timeout
+        if self.ffmpeg is None:
+            self.LOG.warning(f"{ffmpeg} not found, audio will be sent without transcoding")
+
+    @classmethod
+    def from_config(cls, media, conf: Optional[dict]) -> "Transcoder":
+        conf = conf or {}
+        return cls(media, conf.get("ffmpeg", "ffmpeg"), conf.get("max_procs", 2), conf.get("timeout", 30))
+
+    def transcode(self, src: str, fmt: str, args: Sequence[str] = (), key: Optional[str] = None) -> str:
+        """
+        :param src: 源文件
+        :param fmt: 目标格式，如 mp3
+        :param args: 额外的 ffmpeg 输出参数，如 ["-ac", "1", "-ar", "16000"]
+        :param key: 媒体缓存键，已转码过的直接返回
+        :return: 转码后的文件路径
+        """
+        if self.ffmpeg is None or not src:
+            return src
+        if key is not None:
+            cached = self.media.lookup(key)
+            if cached:
+                return cached
+        cmd: List[str] = [self.ffmpeg, "-v", "error", "-nostdin", "-i", src, *args, "-f", fmt, "pipe:1"]
+        with self.slots:
+            try:
+                proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=self.timeout)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                self.LOG.warning(f"Transcoding {src} failed: {e}")
+                return src
+        if proc.returncode != 0 or not proc.stdout:
+            self.LOG.warning(f"Transcoding {src} failed: {proc.stderr.decode('utf-8', 'replace').strip()}")
+            return src
+        return self.media.put_bytes(proc.stdout, "." + fmt, key)
+
+
+class VoicePipeline(object):
+    """私聊语音的往返处理：取语音 → 语音转文字 → 对话 → 文字转语音 → 转码 → 发送
+    在独立线程池中运行，不占用消息分发线程；每个阶段单独计时（robot_voice_stage_seconds），
+    send 阶段从放入发送队列计到语音实际发出。
+    """
+
+    def __init__(self, fetch: Callable[[Any], str], stt: Callable[[str], Optional[str]],
+                 answer: Callable[[str, str], Optional[str]], tts: Callable[[str], Optional[str]],
+                 transcode: Callable[[str], str], send: Callable[[str, str], Any], workers: int = 2,
+                 degraded: Optional[Callable[[str], Any]] = None) -> None:
+        """
+        :param fetch: fetch(msg) 返回语音消息的本地文件
+        :param stt: stt(path) 返回识别出的文字
+        :param answer: answer(text, wxid) 返回回复文字
+        :param tts: tts(text) 返回合成的语音文件
+        :param transcode: transcode(path) 返回适合发送的语音文件
+        :param send: send(path, receiver) 发送语音
+        :param workers: 同时处理的语音消息数
+        :param degraded: degraded(receiver) 上游熔断时回复降级提示
+        """
+        self.LOG = logging.getLogger("VoicePipeline")
+        self.fetch = fetch
+        self.stt = stt
+        self.answer = answer
+        self.tts = tts
+        self.transcode = transcode
+        self.send = send
+        self.degraded = degraded
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Voice")
+
+    def submit(self, msg) -> Future:
+        """放入语音线程池后立即返回"""
+        return self.executor.submit(self.run, msg)
+
+    def run(self, msg) -> Optional[str]:
+        outcome = "error"
+        try:
+            with timed("robot_voice_stage_seconds", stage="fetch"):
+                audio = self.fetch(msg)
+            if not audio:
+                return None
+            with timed("robot_voice_stage_seconds", stage="stt"):
+                text = self.stt(audio)
+            if not text:
+                outcome = "no_text"
+                return None
+            with timed("robot_voice_stage_seconds", stage="chat"):
+                rsp = self.answer(text, msg.sender)
+            if not rsp:
+                return None
+            with timed("robot_voice_stage_seconds", stage="tts"):
+                speech = self.tts(rsp)
+            if not speech:
+                return None
+            with timed("robot_voice_stage_seconds", stage="transcode"):
+                speech = self.transcode(speech)
+            self._send(speech, msg.sender)
+            outcome = "ok"
+            return speech
+        except CircuitOpenError as e:
+            outcome = "degraded"
+            self.LOG.warning(f"Voice pipeline degraded: {e}")
+            if self.degraded is not None:
+                self.degraded(msg.sender)
+            return None
+        except Exception as e:
+            self.LOG.error(f"Voice pipeline failed: {e}")
+            return None
+        finally:
+            METRICS.inc("robot_voice_messages_total", outcome=outcome)
+
+    def _send(self, speech: str, receiver: str) -> None:
+        # 发送是异步的，返回 Future 时在发送完成的回调里记录耗时
+        start = time.perf_counter()
+        sent = self.send(speech, receiver)
+        observe = lambda _=None: METRICS.observe("robot_voice_stage_seconds", time.perf_counter() - start, stage="send")
+        if isinstance(sent, Future):
+            sent.add_done_callback(observe)
+        else:
+            observe()